@@ -0,0 +1,327 @@
+import io
+
+from django.db import connection, transaction
+
+from .search import SEARCH_CONFIG
+
+
+# This is the other way of putting parsed books in the database. Instead of a
+# few queries per book, the books' rows are copied into staging tables, and
+# each catalog table is then brought in line with them by a handful of
+# set-based statements, all in one transaction. A record the database
+# rejects fails the whole load and leaves the catalog as it was.
+
+# The staging tables and the columns copied into them. They're temporary
+# tables, which Postgres doesn't write to its log any more than unlogged
+# ones, and each session gets its own.
+STAGING_TABLES = {
+    'staged_books': [
+        'gutenberg_id integer', 'title text', 'copyright boolean',
+        'download_count integer', 'media_type text', 'fingerprint text'
+    ],
+    # Authors and translators, in the order the record lists them.
+    'staged_people': [
+        'gutenberg_id integer', 'role text', 'position integer', 'name text',
+        'birth_year integer', 'death_year integer'
+    ],
+    'staged_bookshelves': ['gutenberg_id integer', 'name text'],
+    'staged_languages': ['gutenberg_id integer', 'code text'],
+    'staged_subjects': ['gutenberg_id integer', 'name text'],
+    'staged_formats': ['gutenberg_id integer', 'mime_type text', 'url text'],
+    'staged_summaries': ['gutenberg_id integer', 'text text'],
+}
+
+# This many books' rows are buffered before they're copied.
+BATCH_SIZE = 5000
+
+# This adds the people, bookshelves, languages and subjects that aren't in
+# the database yet. People and subjects have no unique constraint to
+# conflict on, so they're compared with the existing rows instead.
+INSERT_DIMENSIONS_SQL = [
+    '''
+    INSERT INTO books_person (name, birth_year, death_year)
+    SELECT DISTINCT name, birth_year, death_year FROM staged_people
+    WHERE NOT EXISTS (
+        SELECT 1 FROM books_person
+        WHERE books_person.name = staged_people.name
+        AND books_person.birth_year IS NOT DISTINCT FROM staged_people.birth_year
+        AND books_person.death_year IS NOT DISTINCT FROM staged_people.death_year
+    )
+    ''',
+    '''
+    INSERT INTO books_bookshelf (name)
+    SELECT DISTINCT name FROM staged_bookshelves
+    ON CONFLICT (name) DO NOTHING
+    ''',
+    '''
+    INSERT INTO books_language (code)
+    SELECT DISTINCT code FROM staged_languages
+    ON CONFLICT (code) DO NOTHING
+    ''',
+    '''
+    INSERT INTO books_subject (name)
+    SELECT DISTINCT name FROM staged_subjects
+    WHERE NOT EXISTS (
+        SELECT 1 FROM books_subject WHERE books_subject.name = staged_subjects.name
+    )
+    ''',
+]
+
+# This writes the books, along with the search vector `update_search_vector`
+# would give them, and gives their database IDs.
+UPSERT_BOOKS_SQL = '''
+    INSERT INTO books_book (
+        gutenberg_id, title, copyright, download_count, media_type,
+        fingerprint, search_vector
+    )
+    SELECT
+        gutenberg_id, title, copyright, download_count, media_type,
+        fingerprint,
+        to_tsvector(%s, concat_ws(' ', coalesce(title, ''), author_names))
+    FROM staged_books
+    LEFT JOIN (
+        SELECT gutenberg_id, string_agg(name, ' ' ORDER BY position) AS author_names
+        FROM staged_people
+        WHERE role = 'author'
+        GROUP BY gutenberg_id
+    ) AS authors USING (gutenberg_id)
+    ON CONFLICT (gutenberg_id) DO UPDATE SET
+        title = EXCLUDED.title,
+        copyright = EXCLUDED.copyright,
+        download_count = EXCLUDED.download_count,
+        media_type = EXCLUDED.media_type,
+        fingerprint = EXCLUDED.fingerprint,
+        search_vector = EXCLUDED.search_vector
+    RETURNING gutenberg_id, id
+'''
+
+# Each association table, its column for the other side, and the `(book ID,
+# other ID)` pairs the staged books should have in it.
+# Nothing stops a person or subject from being in its table more than
+# once, so each is linked by its lowest ID, as the per-book path does.
+LINKS = [
+    (
+        'books_book_authors', 'person_id',
+        '''
+        SELECT DISTINCT ON (books_book.id, staged_people.position) books_book.id, books_person.id
+        FROM staged_people
+        JOIN books_book ON books_book.gutenberg_id = staged_people.gutenberg_id
+        JOIN books_person ON books_person.name = staged_people.name
+        AND books_person.birth_year IS NOT DISTINCT FROM staged_people.birth_year
+        AND books_person.death_year IS NOT DISTINCT FROM staged_people.death_year
+        WHERE staged_people.role = 'author'
+        ORDER BY books_book.id, staged_people.position, books_person.id
+        '''
+    ),
+    (
+        'books_book_translators', 'person_id',
+        '''
+        SELECT DISTINCT ON (books_book.id, staged_people.position) books_book.id, books_person.id
+        FROM staged_people
+        JOIN books_book ON books_book.gutenberg_id = staged_people.gutenberg_id
+        JOIN books_person ON books_person.name = staged_people.name
+        AND books_person.birth_year IS NOT DISTINCT FROM staged_people.birth_year
+        AND books_person.death_year IS NOT DISTINCT FROM staged_people.death_year
+        WHERE staged_people.role = 'translator'
+        ORDER BY books_book.id, staged_people.position, books_person.id
+        '''
+    ),
+    (
+        'books_book_bookshelves', 'bookshelf_id',
+        '''
+        SELECT books_book.id, books_bookshelf.id
+        FROM staged_bookshelves
+        JOIN books_book ON books_book.gutenberg_id = staged_bookshelves.gutenberg_id
+        JOIN books_bookshelf ON books_bookshelf.name = staged_bookshelves.name
+        '''
+    ),
+    (
+        'books_book_languages', 'language_id',
+        '''
+        SELECT books_book.id, books_language.id
+        FROM staged_languages
+        JOIN books_book ON books_book.gutenberg_id = staged_languages.gutenberg_id
+        JOIN books_language ON books_language.code = staged_languages.code
+        '''
+    ),
+    (
+        'books_book_subjects', 'subject_id',
+        '''
+        SELECT DISTINCT ON (books_book.id, staged_subjects.name) books_book.id, books_subject.id
+        FROM staged_subjects
+        JOIN books_book ON books_book.gutenberg_id = staged_subjects.gutenberg_id
+        JOIN books_subject ON books_subject.name = staged_subjects.name
+        ORDER BY books_book.id, staged_subjects.name, books_subject.id
+        '''
+    ),
+]
+
+# This drops the links the staged books no longer have...
+DELETE_LINKS_SQL = '''
+    WITH new_links (book_id, other_id) AS (%(pairs)s)
+    DELETE FROM %(table)s
+    USING staged_books, books_book
+    WHERE books_book.gutenberg_id = staged_books.gutenberg_id
+    AND %(table)s.book_id = books_book.id
+    AND NOT EXISTS (
+        SELECT 1 FROM new_links
+        WHERE new_links.book_id = %(table)s.book_id
+        AND new_links.other_id = %(table)s.%(column)s
+    )
+'''
+# ...and this adds the ones they don't have yet.
+INSERT_LINKS_SQL = '''
+    INSERT INTO %(table)s (book_id, %(column)s)
+    SELECT DISTINCT * FROM (%(pairs)s) AS new_links
+    ON CONFLICT DO NOTHING
+'''
+
+# Formats and summaries belong to one book each, so they're matched on their
+# values: the ones a staged book no longer lists are deleted, and the ones it
+# doesn't have yet are added.
+DETAILS_SQL = [
+    '''
+    DELETE FROM books_format
+    USING staged_books, books_book
+    WHERE books_book.gutenberg_id = staged_books.gutenberg_id
+    AND books_format.book_id = books_book.id
+    AND NOT EXISTS (
+        SELECT 1 FROM staged_formats
+        WHERE staged_formats.gutenberg_id = staged_books.gutenberg_id
+        AND staged_formats.mime_type = books_format.mime_type
+        AND staged_formats.url = books_format.url
+    )
+    ''',
+    '''
+    INSERT INTO books_format (book_id, mime_type, url)
+    SELECT DISTINCT books_book.id, staged_formats.mime_type, staged_formats.url
+    FROM staged_formats
+    JOIN books_book ON books_book.gutenberg_id = staged_formats.gutenberg_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM books_format
+        WHERE books_format.book_id = books_book.id
+        AND books_format.mime_type = staged_formats.mime_type
+        AND books_format.url = staged_formats.url
+    )
+    ''',
+    '''
+    DELETE FROM books_summary
+    USING staged_books, books_book
+    WHERE books_book.gutenberg_id = staged_books.gutenberg_id
+    AND books_summary.book_id = books_book.id
+    AND NOT EXISTS (
+        SELECT 1 FROM staged_summaries
+        WHERE staged_summaries.gutenberg_id = staged_books.gutenberg_id
+        AND staged_summaries.text = books_summary.text
+    )
+    ''',
+    '''
+    INSERT INTO books_summary (book_id, text)
+    SELECT DISTINCT books_book.id, staged_summaries.text
+    FROM staged_summaries
+    JOIN books_book ON books_book.gutenberg_id = staged_summaries.gutenberg_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM books_summary
+        WHERE books_summary.book_id = books_book.id
+        AND books_summary.text = staged_summaries.text
+    )
+    ''',
+]
+
+
+def get_copy_value(value):
+    """ This writes a value the way `COPY`'s text format reads it. """
+
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def get_staged_rows(id, book, fingerprint):
+    """ This gives the rows of each staging table for a parsed book. """
+
+    rows = {
+        'staged_books': [(
+            id, book['title'], book['copyright'], book['downloads'],
+            book['type'], fingerprint
+        )],
+        'staged_people': [],
+        'staged_bookshelves': [(id, name) for name in book['bookshelves']],
+        'staged_languages': [(id, code) for code in book['languages']],
+        'staged_subjects': [(id, name) for name in book['subjects']],
+        'staged_formats': [
+            (id, mime_type, url) for mime_type, url in book['formats'].items()
+        ],
+        'staged_summaries': [(id, text) for text in book['summaries']],
+    }
+    for role, people in (('author', book['authors']), ('translator', book['translators'])):
+        for position, person in enumerate(people):
+            rows['staged_people'].append(
+                (id, role, position, person['name'], person['birth'], person['death'])
+            )
+    return rows
+
+
+def copy_rows(cursor, buffers):
+    for table, buffer in buffers.items():
+        buffer.seek(0)
+        columns = [column.split()[0] for column in STAGING_TABLES[table]]
+        cursor.copy_expert(
+            'COPY %s (%s) FROM STDIN' % (table, ', '.join(columns)), buffer
+        )
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def bulk_load_books(books):
+    """
+    This puts `(id, book, fingerprint)` triples, as `get_book` and
+    `get_book_fingerprint` give them, in the database, and gives the
+    `(Gutenberg ID, database ID)` of every book written. The books are read
+    as they come, so they can be parsed while earlier ones are copied.
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table, columns in STAGING_TABLES.items():
+            cursor.execute('CREATE TEMPORARY TABLE %s (%s)' % (
+                table, ', '.join(columns)
+            ))
+
+        buffers = {table: io.StringIO() for table in STAGING_TABLES}
+        buffered = 0
+        for id, book, fingerprint in books:
+            for table, rows in get_staged_rows(id, book, fingerprint).items():
+                for row in rows:
+                    buffers[table].write(
+                        '\t'.join(get_copy_value(value) for value in row) + '\n'
+                    )
+            buffered += 1
+            if buffered == BATCH_SIZE:
+                copy_rows(cursor, buffers)
+                buffered = 0
+        copy_rows(cursor, buffers)
+
+        # Temporary tables are never analyzed on their own, and the planner
+        # needs their sizes to pick hash joins over nested loops.
+        for table in STAGING_TABLES:
+            cursor.execute('ANALYZE %s' % table)
+
+        for sql in INSERT_DIMENSIONS_SQL:
+            cursor.execute(sql)
+        cursor.execute(UPSERT_BOOKS_SQL, [SEARCH_CONFIG])
+        written = cursor.fetchall()
+        for table, column, pairs in LINKS:
+            parameters = {'table': table, 'column': column, 'pairs': pairs}
+            cursor.execute(DELETE_LINKS_SQL % parameters)
+            cursor.execute(INSERT_LINKS_SQL % parameters)
+        for sql in DETAILS_SQL:
+            cursor.execute(sql)
+
+        cursor.execute('DROP TABLE %s' % ', '.join(STAGING_TABLES))
+
+    return written
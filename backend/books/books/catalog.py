@@ -0,0 +1,54 @@
+import hashlib
+import os
+import threading
+import uuid
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+
+
+# The catalog only changes when `updatecatalog` runs. It stamps every run in
+# this file, and anything derived from the catalog (like ETags) is keyed by
+# the stamp, so a reload invalidates it in every worker.
+
+_lock = threading.Lock()
+_cached_mtime = None
+_cached_version = '0'
+
+
+def get_catalog_version():
+    global _cached_mtime, _cached_version
+    try:
+        mtime = os.stat(settings.CATALOG_VERSION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return '0'
+    if mtime != _cached_mtime:
+        with _lock:
+            with open(settings.CATALOG_VERSION_PATH) as version_file:
+                _cached_version = version_file.read().strip() or '0'
+            _cached_mtime = mtime
+    return _cached_version
+
+
+def bump_catalog_version():
+    version = uuid.uuid4().hex
+    directory = os.path.dirname(settings.CATALOG_VERSION_PATH)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    temporary_path = settings.CATALOG_VERSION_PATH + '.tmp'
+    with open(temporary_path, 'w') as version_file:
+        version_file.write(version)
+    os.replace(temporary_path, settings.CATALOG_VERSION_PATH)
+    return version
+
+
+# This gives an ETag for a response given the request path and query string.
+# Parameter order doesn't change the tag.
+def get_etag(path, query_string):
+    parameters = sorted(parse_qsl(query_string, keep_blank_values=True))
+    key = repr((get_catalog_version(), path, parameters))
+    return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def get_request_etag(request, *args, **kwargs):
+    return get_etag(request.path, request.META.get('QUERY_STRING', ''))
@@ -0,0 +1,54 @@
+from rest_framework.renderers import JSONRenderer
+
+from .models import *
+from .serializers import BookSerializer
+
+
+def render_book_documents(books):
+    """ This gives the JSON documents of the given books, keyed by book ID. """
+
+    renderer = JSONRenderer()
+    return {
+        book.id: renderer.render(BookSerializer(book).data).decode()
+        for book in books
+    }
+
+
+def get_book_documents(book_ids):
+    """
+    This gives the stored documents of the given books, in the given order.
+    Books without a stored document yet are rendered on the spot.
+    """
+
+    documents = dict(
+        BookDocument.objects.filter(book_id__in=book_ids).values_list(
+            'book_id', 'document'
+        )
+    )
+    missing_ids = [book_id for book_id in book_ids if book_id not in documents]
+    if missing_ids:
+        books = Book.objects.filter(id__in=missing_ids)
+        books = books.prefetch_related(*BookSerializer.prefetch_fields)
+        documents.update(render_book_documents(books))
+    return [documents[book_id] for book_id in book_ids]
+
+
+def refresh_book_documents(book_ids=None, batch_size=1000):
+    """ This rewrites the stored documents of the given books, or all books. """
+
+    if book_ids is None:
+        book_ids = Book.objects.order_by('id').values_list('id', flat=True)
+    book_ids = list(book_ids)
+
+    for start in range(0, len(book_ids), batch_size):
+        books = Book.objects.filter(id__in=book_ids[start:start + batch_size])
+        books = books.prefetch_related(*BookSerializer.prefetch_fields)
+        BookDocument.objects.bulk_create(
+            [
+                BookDocument(book_id=book_id, document=document)
+                for book_id, document in render_book_documents(books).items()
+            ],
+            update_conflicts=True,
+            unique_fields=['book'],
+            update_fields=['document']
+        )
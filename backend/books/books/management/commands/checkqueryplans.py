@@ -0,0 +1,150 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.test import APIRequestFactory
+
+from books.synthetic import generate_catalog, load_catalog
+from books.views import BookViewSet
+
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'query_plan_baselines.json')
+
+PLAN_MATRIX = {
+    'all': {},
+    'languages': {'languages': 'en'},
+    'rare language': {'languages': 'eo'},
+    'several languages': {'languages': 'fr,de'},
+    'copyright': {'copyright': 'false'},
+    'ids': {'ids': '11,84,1342,2701'},
+    'mime type': {'mime_type': 'audio/'},
+    'author years': {'author_year_start': 1800, 'author_year_end': 1899},
+    'search': {'search': 'great voyage'},
+    'topic': {'topic': 'children'},
+    'combined': {'languages': 'en', 'copyright': 'false', 'mime_type': 'text/html'},
+}
+SORTS = ['popular', 'ascending', 'descending']
+
+# Cost and buffers may grow by this factor before a combination fails...
+DEFAULT_THRESHOLD = 1.5
+# ...and buffer counts by this many pages, which small catalogs swing by.
+BUFFER_SLACK = 64
+
+
+def get_queryset(parameters):
+    """ This gives the rows `BookViewSet.list` pages through for a request. """
+
+    view = BookViewSet()
+    view.request = APIRequestFactory().get('/books/', parameters)
+    view.format_kwarg = None
+    queryset = view.filter_queryset(view.get_queryset())
+    sort_fields = [field.lstrip('-') for field in queryset.query.order_by]
+    return queryset.prefetch_related(None).values(*sort_fields)
+
+
+def get_plan_shape(node, depth=0):
+    """ This names each plan node and what it scans, indented by depth. """
+
+    label = node['Node Type']
+    for key in ('Relation Name', 'Index Name', 'Strategy'):
+        if key in node:
+            label += ' %s=%s' % (key.split()[0].lower(), node[key])
+    lines = ['  ' * depth + label]
+    for child in node.get('Plans', []):
+        lines += get_plan_shape(child, depth + 1)
+    return lines
+
+
+def explain(queryset):
+    plan = json.loads(queryset.explain(analyze=True, buffers=True, format='json'))
+    root = plan[0]['Plan']
+    return {
+        'shape': get_plan_shape(root),
+        'cost': root['Total Cost'],
+        'buffers': root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0),
+        'time': plan[0]['Execution Time'],
+    }
+
+
+def get_seq_scans(shape):
+    return {line.strip() for line in shape if line.strip().startswith('Seq Scan')}
+
+
+def compare(baseline, current, threshold):
+    """ This gives the reasons the current plan is a regression, if any. """
+
+    problems = []
+    if current['cost'] > baseline['cost'] * threshold:
+        problems.append('cost %.0f -> %.0f' % (baseline['cost'], current['cost']))
+    buffer_limit = max(baseline['buffers'] * threshold, baseline['buffers'] + BUFFER_SLACK)
+    if current['buffers'] > buffer_limit:
+        problems.append('buffers %d -> %d' % (baseline['buffers'], current['buffers']))
+    new_scans = get_seq_scans(current['shape']) - get_seq_scans(baseline['shape'])
+    for scan in sorted(new_scans):
+        problems.append('new ' + scan)
+    return problems
+
+
+class Command(BaseCommand):
+    help = (
+        'This runs the book list queries for a matrix of filters and sorts '
+        'under EXPLAIN (ANALYZE, BUFFERS) and fails if any of their plans '
+        'regressed from the stored baselines.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baselines', default=BASELINE_PATH)
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Record the current plans as the baselines.'
+        )
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+        parser.add_argument(
+            '--books', type=int,
+            help='Replace the catalog with a synthetic one of this many books first.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['books']:
+            self.stdout.write('Loading a synthetic catalog of %d books...' % options['books'])
+            load_catalog(generate_catalog(options['books'], options['seed']))
+
+        baselines = {}
+        if os.path.exists(options['baselines']):
+            with open(options['baselines']) as baseline_file:
+                baselines = json.load(baseline_file)
+
+        # The page query differs by sort; the count query doesn't.
+        queries = {}
+        for name, filters in PLAN_MATRIX.items():
+            for sort in SORTS:
+                queryset = get_queryset(dict(filters, sort=sort))
+                queries['%s / %s' % (name, sort)] = queryset[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+            queries['%s / count' % name] = get_queryset(filters).order_by().distinct()
+
+        results = {}
+        regressions = 0
+        for key, queryset in queries.items():
+            results[key] = current = explain(queryset)
+            if options['update']:
+                status = 'recorded'
+            elif key not in baselines:
+                status = 'no baseline'
+            else:
+                problems = compare(baselines[key], current, options['threshold'])
+                regressions += bool(problems)
+                status = 'REGRESSED: ' + '; '.join(problems) if problems else 'ok'
+            self.stdout.write('%-36s%12.0f%9d%10.2f ms  %s' % (
+                key, current['cost'], current['buffers'], current['time'], status
+            ))
+
+        if options['update']:
+            with open(options['baselines'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+                baseline_file.write('\n')
+            self.stdout.write('Baselines written to %s' % options['baselines'])
+        elif regressions:
+            raise CommandError('%d combination(s) regressed.' % regressions)
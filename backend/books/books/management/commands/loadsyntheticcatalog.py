@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from books.synthetic import generate_catalog, load_catalog, write_rdf_files
+
+
+class Command(BaseCommand):
+    help = (
+        'This replaces the catalog in the database with a synthetic one, or '
+        'writes it as RDF files for `updatecatalog` to read.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=70000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--language-skew', type=float, default=1.0,
+            help='0 for evenly spread languages, above 1 for more English.'
+        )
+        parser.add_argument('--books-per-author', type=float, default=3.0)
+        parser.add_argument(
+            '--download-alpha', type=float, default=1.2,
+            help='The Pareto shape of download counts; lower means a longer tail.'
+        )
+        parser.add_argument(
+            '--rdf', metavar='DIRECTORY',
+            help='Write RDF files here instead of loading the database.'
+        )
+        parser.add_argument(
+            '--no-documents', action='store_true',
+            help="Don't write book documents."
+        )
+
+    def handle(self, *args, **options):
+        catalog = generate_catalog(
+            options['books'],
+            options['seed'],
+            language_skew=options['language_skew'],
+            books_per_author=options['books_per_author'],
+            download_alpha=options['download_alpha']
+        )
+        if options['rdf']:
+            write_rdf_files(catalog, options['rdf'])
+            self.stdout.write('Wrote %d RDF files to %s.' % (len(catalog['books']), options['rdf']))
+        else:
+            load_catalog(catalog, documents=not options['no_documents'])
+            self.stdout.write('Loaded %d books.' % len(catalog['books']))
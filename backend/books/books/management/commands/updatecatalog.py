@@ -11,7 +11,11 @@ from django.core.mail import send_mail
 from django.core.management.base import BaseCommand, CommandError
 
 from books import utils
+from books.bulk_load import bulk_load_books
+from books.catalog import bump_catalog_version
+from books.documents import refresh_book_documents
 from books.models import *
+from books.search import update_search_vector
 
 
 TEMP_PATH = settings.CATALOG_TEMP_DIR
@@ -46,7 +50,7 @@ def log(*args):
         log_file.write(text)
 
 
-def put_catalog_in_db():
+def get_catalog_book_paths():
     book_ids = []
     for directory_item in os.listdir(settings.CATALOG_RDF_DIR):
         item_path = os.path.join(settings.CATALOG_RDF_DIR, directory_item)
@@ -59,21 +63,144 @@ def put_catalog_in_db():
             else:
                 book_ids.append(book_id)
     book_ids.sort()
-    book_directories = [str(id) for id in book_ids]
+    return [
+        (id, os.path.join(settings.CATALOG_RDF_DIR, str(id), 'pg%d.rdf' % id))
+        for id in book_ids
+    ]
+
+
+class CatalogChanges:
+    """ This tallies what a catalog update did to the books in the database. """
+
+    def __init__(self):
+        # These are the Gutenberg IDs of every book in the new catalog...
+        self.book_ids = set()
+        # ...and these the database IDs of the ones that were written.
+        self.written_ids = []
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+        # This holds the `DimensionMap`s of a book-by-book load, by name.
+        self.dimensions = {}
+
+    def __str__(self):
+        return '%d added, %d changed, %d unchanged, %d removed' % (
+            self.added, self.changed, self.unchanged, self.removed
+        )
+
+
+class DimensionMap:
+    """
+    This maps the keys of a table's rows, like a language's code or a
+    person's name and years, to their IDs for the length of a catalog update.
+    It's filled with one query on the first lookup, so that a run with
+    nothing to write doesn't read the table. The rows it doesn't have are
+    created and added to it, so no lookup after that costs a query.
+    """
+
+    def __init__(self, model, key_fields):
+        self.model = model
+        self.key_fields = key_fields
+        self.ids = None
+        self.preloaded = 0
+        self.hits = 0
+        self.created = 0
+
+    def get_id(self, *key):
+        if self.ids is None:
+            self.ids = {}
+            rows = self.model.objects.order_by('id').values_list(
+                'id', *self.key_fields
+            )
+            for id, *row_key in rows:
+                self.ids.setdefault(tuple(row_key), id)
+            self.preloaded = len(self.ids)
+
+        id = self.ids.get(key)
+        if id is None:
+            id = self.model.objects.create(**dict(zip(self.key_fields, key))).id
+            self.ids[key] = id
+            self.created += 1
+        else:
+            self.hits += 1
+        return id
+
+    def __str__(self):
+        lookups = self.hits + self.created
+        return '%d preloaded, %d lookups, %d hits (%.1f%%), %d created' % (
+            self.preloaded,
+            lookups,
+            self.hits,
+            100 * self.hits / lookups if lookups else 0,
+            self.created
+        )
+
 
-    for directory in book_directories:
-        id = int(directory)
+def get_dimension_maps():
+    return {
+        'people': DimensionMap(Person, ['name', 'birth_year', 'death_year']),
+        'bookshelves': DimensionMap(Bookshelf, ['name']),
+        'languages': DimensionMap(Language, ['code']),
+        'subjects': DimensionMap(Subject, ['name']),
+    }
 
+
+def get_changed_books(book_files, fingerprints, changes, workers=None, full=False):
+    """
+    This parses the given RDF files and gives `(id, book, fingerprint)` for
+    each book whose fingerprint doesn't match the stored one, or for every
+    book if `full` is set. It counts the others as unchanged.
+    """
+
+    # The RDF files are parsed in worker processes, a few chunks ahead of the
+    # database work, which still takes the books in the given order.
+    for id, book in utils.get_books(book_files, workers=workers):
+        changes.book_ids.add(id)
         if (id > 0) and (id % 500 == 0):
             log('    %d' % id)
 
-        book_path = os.path.join(
-            settings.CATALOG_RDF_DIR,
-            directory,
-            'pg' + directory + '.rdf'
-        )
+        fingerprint = utils.get_book_fingerprint(book)
+        if fingerprints.get(id) == fingerprint and not full:
+            changes.unchanged += 1
+        else:
+            yield id, book, fingerprint
+
+
+def put_catalog_in_db(workers=None, book_files=None, full=False, bulk=False):
+    """
+    This puts the given `(id, path or bytes)` RDF files in the database, or
+    every one in the catalog directory, and gives the `CatalogChanges`. Books
+    whose fingerprint matches the stored one are skipped unless `full` is set.
+    With `bulk`, the books are written together by `bulk_load_books` instead
+    of one at a time.
+    """
+
+    if book_files is None:
+        book_files = get_catalog_book_paths()
+    changes = CatalogChanges()
+    fingerprints = dict(Book.objects.values_list('gutenberg_id', 'fingerprint'))
+    books = get_changed_books(
+        book_files, fingerprints, changes, workers=workers, full=full
+    )
 
-        book = utils.get_book(id, book_path)
+    if bulk:
+        for id, book_id in bulk_load_books(books):
+            if id in fingerprints:
+                changes.changed += 1
+            else:
+                changes.added += 1
+            changes.written_ids.append(book_id)
+        return changes
+
+    # Every person, bookshelf, language and subject is looked up here, so
+    # only new ones cost a query.
+    dimensions = changes.dimensions = get_dimension_maps()
+    for id, book, fingerprint in books:
+        if id in fingerprints:
+            changes.changed += 1
+        else:
+            changes.added += 1
 
         try:
             '''Make/update the book.'''
@@ -98,64 +225,40 @@ def put_catalog_in_db():
 
             ''' Make/update the authors. '''
 
-            authors = []
-            for author in book['authors']:
-                person = Person.objects.filter(
-                    name=author['name'],
-                    birth_year=author['birth'],
-                    death_year=author['death']
+            author_ids = [
+                dimensions['people'].get_id(
+                    author['name'], author['birth'], author['death']
                 )
-                if person.exists():
-                    person = person[0]
-                else:
-                    person = Person.objects.create(
-                        name=author['name'],
-                        birth_year=author['birth'],
-                        death_year=author['death']
-                    )
-                authors.append(person)
-
+                for author in book['authors']
+            ]
             book_in_db.authors.clear()
-            for author in authors:
-                book_in_db.authors.add(author)
+            book_in_db.authors.add(*author_ids)
+
+            update_search_vector(
+                book_in_db.id,
+                book['title'],
+                [author['name'] for author in book['authors']]
+            )
 
             ''' Make/update the translators. '''
 
-            translators = []
-            for translator in book['translators']:
-                person = Person.objects.filter(
-                    name=translator['name'],
-                    birth_year=translator['birth'],
-                    death_year=translator['death']
+            translator_ids = [
+                dimensions['people'].get_id(
+                    translator['name'], translator['birth'], translator['death']
                 )
-                if person.exists():
-                    person = person[0]
-                else:
-                    person = Person.objects.create(
-                        name=translator['name'],
-                        birth_year=translator['birth'],
-                        death_year=translator['death']
-                    )
-                translators.append(person)
-
+                for translator in book['translators']
+            ]
             book_in_db.translators.clear()
-            for translator in translators:
-                book_in_db.translators.add(translator)
+            book_in_db.translators.add(*translator_ids)
 
             ''' Make/update the book shelves. '''
 
-            bookshelves = []
-            for shelf in book['bookshelves']:
-                shelf_in_db = Bookshelf.objects.filter(name=shelf)
-                if shelf_in_db.exists():
-                    shelf_in_db = shelf_in_db[0]
-                else:
-                    shelf_in_db = Bookshelf.objects.create(name=shelf)
-                bookshelves.append(shelf_in_db)
-
+            bookshelf_ids = [
+                dimensions['bookshelves'].get_id(shelf)
+                for shelf in book['bookshelves']
+            ]
             book_in_db.bookshelves.clear()
-            for bookshelf in bookshelves:
-                book_in_db.bookshelves.add(bookshelf)
+            book_in_db.bookshelves.add(*bookshelf_ids)
 
             ''' Make/update the formats. '''
 
@@ -184,33 +287,21 @@ def put_catalog_in_db():
 
             ''' Make/update the languages. '''
 
-            languages = []
-            for language in book['languages']:
-                language_in_db = Language.objects.filter(code=language)
-                if language_in_db.exists():
-                    language_in_db = language_in_db[0]
-                else:
-                    language_in_db = Language.objects.create(code=language)
-                languages.append(language_in_db)
-
+            language_ids = [
+                dimensions['languages'].get_id(language)
+                for language in book['languages']
+            ]
             book_in_db.languages.clear()
-            for language in languages:
-                book_in_db.languages.add(language)
+            book_in_db.languages.add(*language_ids)
 
             ''' Make/update subjects. '''
 
-            subjects = []
-            for subject in book['subjects']:
-                subject_in_db = Subject.objects.filter(name=subject)
-                if subject_in_db.exists():
-                    subject_in_db = subject_in_db[0]
-                else:
-                    subject_in_db = Subject.objects.create(name=subject)
-                subjects.append(subject_in_db)
-
+            subject_ids = [
+                dimensions['subjects'].get_id(subject)
+                for subject in book['subjects']
+            ]
             book_in_db.subjects.clear()
-            for subject in subjects:
-                book_in_db.subjects.add(subject)
+            book_in_db.subjects.add(*subject_ids)
 
             ''' Make/update summaries. '''
 
@@ -231,6 +322,12 @@ def put_catalog_in_db():
                 if old_summary.id not in summary_ids:
                     old_summary.delete()
 
+            # This goes last, so that a book that failed partway through is
+            # written again next time.
+            book_in_db.fingerprint = fingerprint
+            book_in_db.save(update_fields=['fingerprint'])
+            changes.written_ids.append(book_in_db.id)
+
         except Exception as error:
             book_json = json.dumps(book, indent=4)
             log(
@@ -240,6 +337,25 @@ def put_catalog_in_db():
             )
             raise error
 
+    return changes
+
+
+def remove_stale_books(changes, rdf_directory=None):
+    """
+    This deletes the books that weren't in the new catalog, along with their
+    directories in `rdf_directory` if there is one.
+    """
+
+    stale_ids = (
+        set(Book.objects.values_list('gutenberg_id', flat=True)) - changes.book_ids
+    )
+    Book.objects.filter(gutenberg_id__in=stale_ids).delete()
+    changes.removed += len(stale_ids)
+    if rdf_directory is not None:
+        for directory in get_directory_set(rdf_directory):
+            if directory.isdigit() and int(directory) not in changes.book_ids:
+                shutil.rmtree(os.path.join(rdf_directory, directory))
+
 
 def send_log_email():
     if not (settings.ADMIN_EMAILS or settings.EMAIL_HOST_ADDRESS):
@@ -288,7 +404,32 @@ def send_log_email():
 class Command(BaseCommand):
     help = 'This replaces the catalog files with the latest ones.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            help='The number of processes parsing RDF files (default: one per CPU).'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rewrite every book, even those whose RDF record is unchanged.'
+        )
+        parser.add_argument(
+            '--bulk', action='store_true',
+            help='Write the books with a few set-based statements in one transaction instead of one by one.'
+        )
+        parser.add_argument(
+            '--stream', action='store_true',
+            help='Read the RDF files straight from the downloaded archive instead of extracting it.'
+        )
+        parser.add_argument(
+            '--keep-rdf', action='store_true',
+            help='With --stream, also write the RDF files to the catalog directory.'
+        )
+
     def handle(self, *args, **options):
+        # This is set before the first write to the database, so that a run
+        # that fails after committing some books still stamps a new version.
+        catalog_changed = False
         try:
             date_and_time = strftime('%H:%M:%S on %B %d, %Y')
             log('Starting script at', date_and_time)
@@ -304,52 +445,85 @@ class Command(BaseCommand):
             log('  Downloading compressed catalog...')
             urllib.request.urlretrieve(URL, DOWNLOAD_PATH)
 
-            log('  Decompressing catalog...')
-            if not os.path.exists(DOWNLOAD_PATH):
-                os.makedirs(DOWNLOAD_PATH)
-            with open(os.devnull, 'w') as null:
-                call(
-                    ['tar', 'fjvx', DOWNLOAD_PATH, '-C', TEMP_PATH],
-                    stdout=null,
-                    stderr=null
+            if options['stream']:
+                # Each RDF file goes from the archive to the parser without
+                # touching the disk, unless the files are to be kept.
+                rdf_directory = MOVE_TARGET_PATH if options['keep_rdf'] else None
+                if rdf_directory and not os.path.exists(rdf_directory):
+                    os.makedirs(rdf_directory)
+
+                log('  Putting the catalog in the database from the archive...')
+                catalog_changed = True
+                changes = put_catalog_in_db(
+                    workers=options['workers'],
+                    book_files=utils.get_archive_books(DOWNLOAD_PATH, rdf_directory),
+                    full=options['full'],
+                    bulk=options['bulk']
                 )
 
-            log('  Detecting stale directories...')
-            if not os.path.exists(MOVE_TARGET_PATH):
-                os.makedirs(MOVE_TARGET_PATH)
-            new_directory_set = get_directory_set(MOVE_SOURCE_PATH)
-            old_directory_set = get_directory_set(MOVE_TARGET_PATH)
-            stale_directory_set = old_directory_set - new_directory_set
-
-            log('  Removing stale directories and books...')
-            for directory in stale_directory_set:
-                try:
-                    book_id = int(directory)
-                except ValueError:
-                    # Ignore the directory if its name isn't a book ID number.
-                    continue
-                book = Book.objects.filter(gutenberg_id=book_id)
-                book.delete()
-                path = os.path.join(MOVE_TARGET_PATH, directory)
-                shutil.rmtree(path)
-
-            log('  Replacing old catalog files...')
-            with open(os.devnull, 'w') as null:
-                with open(LOG_PATH, 'a') as log_file:
+                log('  Removing stale books...')
+                remove_stale_books(changes, rdf_directory)
+            else:
+                log('  Decompressing catalog...')
+                if not os.path.exists(DOWNLOAD_PATH):
+                    os.makedirs(DOWNLOAD_PATH)
+                with open(os.devnull, 'w') as null:
                     call(
-                        [
-                            'rsync',
-                            '-va',
-                            '--delete-after',
-                            MOVE_SOURCE_PATH + '/',
-                            MOVE_TARGET_PATH
-                        ],
+                        ['tar', 'fjvx', DOWNLOAD_PATH, '-C', TEMP_PATH],
                         stdout=null,
-                        stderr=log_file
+                        stderr=null
                     )
 
-            log('  Putting the catalog in the database...')
-            put_catalog_in_db()
+                log('  Detecting stale directories...')
+                if not os.path.exists(MOVE_TARGET_PATH):
+                    os.makedirs(MOVE_TARGET_PATH)
+                new_directory_set = get_directory_set(MOVE_SOURCE_PATH)
+                old_directory_set = get_directory_set(MOVE_TARGET_PATH)
+                stale_directory_set = old_directory_set - new_directory_set
+
+                log('  Removing stale directories and books...')
+                catalog_changed = True
+                removed = 0
+                for directory in stale_directory_set:
+                    try:
+                        book_id = int(directory)
+                    except ValueError:
+                        # Ignore the directory if its name isn't a book ID number.
+                        continue
+                    book = Book.objects.filter(gutenberg_id=book_id)
+                    removed += book.delete()[1].get('books.Book', 0)
+                    path = os.path.join(MOVE_TARGET_PATH, directory)
+                    shutil.rmtree(path)
+
+                log('  Replacing old catalog files...')
+                with open(os.devnull, 'w') as null:
+                    with open(LOG_PATH, 'a') as log_file:
+                        call(
+                            [
+                                'rsync',
+                                '-va',
+                                '--delete-after',
+                                MOVE_SOURCE_PATH + '/',
+                                MOVE_TARGET_PATH
+                            ],
+                            stdout=null,
+                            stderr=log_file
+                        )
+
+                log('  Putting the catalog in the database...')
+                changes = put_catalog_in_db(
+                    workers=options['workers'],
+                    full=options['full'],
+                    bulk=options['bulk']
+                )
+                changes.removed = removed
+
+            log('  Books: %s' % changes)
+            for name, dimension_map in changes.dimensions.items():
+                log('  %s: %s' % (name.capitalize(), dimension_map))
+
+            log('  Writing book documents...')
+            refresh_book_documents(changes.written_ids)
 
             log('  Removing temporary files...')
             shutil.rmtree(TEMP_PATH)
@@ -360,5 +534,9 @@ class Command(BaseCommand):
             log('Error:', error_message)
             log('')
             shutil.rmtree(TEMP_PATH)
+        finally:
+            if catalog_changed:
+                log('Stamping the catalog version...')
+                bump_catalog_version()
 
         send_log_email()
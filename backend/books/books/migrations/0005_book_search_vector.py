@@ -0,0 +1,44 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def fill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        """
+        UPDATE books_book
+        SET search_vector = to_tsvector(
+            'simple',
+            coalesce(books_book.title, '') || ' ' || coalesce((
+                SELECT string_agg(books_person.name, ' ')
+                FROM books_book_authors
+                JOIN books_person ON books_person.id = books_book_authors.person_id
+                WHERE books_book_authors.book_id = books_book.id
+            ), '')
+        )
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("books", "0004_summary")]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="books_book_search_vector_gin"
+            ),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
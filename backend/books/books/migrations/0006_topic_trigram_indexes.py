@@ -0,0 +1,35 @@
+# Generated by Django 4.2.22 on 2026-10-18 10:03
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("books", "0005_book_search_vector")]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="bookshelf",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"),
+                    name="gin_trgm_ops",
+                ),
+                name="books_bookshelf_name_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="subject",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"),
+                    name="gin_trgm_ops",
+                ),
+                name="books_subject_name_trgm",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.22 on 2026-10-18 11:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("books", "0006_topic_trigram_indexes")]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookDocument",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="books.book",
+                    ),
+                ),
+                ("document", models.TextField()),
+            ],
+        )
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.22 on 2026-10-18 14:29
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Building the indexes concurrently keeps the API serving while they build.
+    atomic = False
+
+    dependencies = [("books", "0007_bookdocument")]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(
+                fields=["-download_count", "-id"], name="books_book_download_count_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="person",
+            index=models.Index(
+                fields=["name", "birth_year", "death_year"],
+                name="books_person_name_years_idx",
+            ),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
 
 
 class Book(models.Model):
@@ -6,30 +9,72 @@ class Book(models.Model):
     bookshelves = models.ManyToManyField('Bookshelf')
     copyright = models.BooleanField(null=True)
     download_count = models.PositiveIntegerField(blank=True, null=True)
+    # This is the hash of the book's parsed RDF record when it was last
+    # loaded, which lets the catalog updater skip books that haven't changed.
+    fingerprint = models.CharField(blank=True, max_length=64, null=True)
     gutenberg_id = models.PositiveIntegerField(unique=True)
     languages = models.ManyToManyField('Language')
     media_type = models.CharField(max_length=16)
+    # This holds the title and author names, and is kept up to date by the
+    # catalog updater.
+    search_vector = SearchVectorField(null=True)
     subjects = models.ManyToManyField('Subject')
     title = models.CharField(blank=True, max_length=1024, null=True)
     translators = models.ManyToManyField(
         'Person', related_name='books_translated')
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='books_book_search_vector_gin'),
+            # This serves the default sort, so that a page is read in order
+            # from the index instead of sorting every matching book.
+            models.Index(
+                fields=['-download_count', '-id'],
+                name='books_book_download_count_idx'
+            ),
+        ]
+
     def __str__(self):
         if self.title:
             return self.title
         else:
             return str(self.id)
 
+    # These go through the reverse relations so that they are served from the
+    # `prefetch_related` cache when `BookViewSet` has filled it.
     def get_formats(self):
-        return Format.objects.filter(book_id=self.id)
+        return self.format_set.all()
 
     def get_summaries(self):
-        return Summary.objects.filter(book_id=self.id)
+        return self.summary_set.all()
+
+
+class BookDocument(models.Model):
+    """
+    This is the finished JSON of a book as the API serves it. The catalog
+    updater writes it so that requests don't have to fetch and serialize the
+    book's relations.
+    """
+
+    book = models.OneToOneField('Book', on_delete=models.CASCADE, primary_key=True)
+    document = models.TextField()
+
+    def __str__(self):
+        return self.book.__str__()
 
 
 class Bookshelf(models.Model):
     name = models.CharField(max_length=64, unique=True)
 
+    class Meta:
+        indexes = [
+            # This serves `name__icontains`, which compares `UPPER(name)`.
+            GinIndex(
+                OpClass(Upper('name'), name='gin_trgm_ops'),
+                name='books_bookshelf_name_trgm'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -58,6 +103,15 @@ class Person(models.Model):
     death_year = models.SmallIntegerField(blank=True, null=True)
     name = models.CharField(max_length=128)
 
+    class Meta:
+        indexes = [
+            # This serves the catalog updater's lookups of existing people.
+            models.Index(
+                fields=['name', 'birth_year', 'death_year'],
+                name='books_person_name_years_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -65,6 +119,15 @@ class Person(models.Model):
 class Subject(models.Model):
     name = models.CharField(max_length=256)
 
+    class Meta:
+        indexes = [
+            # This serves `name__icontains`, which compares `UPPER(name)`.
+            GinIndex(
+                OpClass(Upper('name'), name='gin_trgm_ops'),
+                name='books_subject_name_trgm'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -0,0 +1,101 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+
+from rest_framework import exceptions as drf_exceptions, pagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class BookCursorPagination(pagination.BasePagination):
+    """
+    This pages through a queryset by seeking to the sort key of the last row
+    served, so the cost of a page doesn't grow with its depth. It works with
+    any total ordering on the queryset, e.g. `('-download_count', '-id')`.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = list(queryset.query.order_by)
+
+        position, backwards = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_seek_filter(position, backwards)
+            )
+        if backwards:
+            queryset = queryset.reverse()
+
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if backwards:
+            page.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if page:
+            if has_more or backwards:
+                self.next_cursor = self.encode_cursor(page[-1], False)
+            if has_more if backwards else position is not None:
+                self.previous_cursor = self.encode_cursor(page[0], True)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.next_cursor)),
+            ('previous', self.get_link(self.previous_cursor)),
+            ('results', data)
+        ]))
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    # This gives a filter for the rows strictly after (or before, going
+    # backwards) the given position in the queryset's ordering.
+    def get_seek_filter(self, position, backwards):
+        seek_filter = Q()
+        equal_fields = {}
+        for field, value in zip(self.ordering, position):
+            descending = field.startswith('-') != backwards
+            name = field.lstrip('-')
+            lookup = '%s__%s' % (name, 'lt' if descending else 'gt')
+            seek_filter |= Q(**equal_fields, **{lookup: value})
+            equal_fields[name] = value
+        return seek_filter
+
+    # Items can be model instances or `values()` dictionaries.
+    def encode_cursor(self, item, backwards):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(item, dict):
+            position = [item[name] for name in names]
+        else:
+            position = [getattr(item, name) for name in names]
+        payload = json.dumps({'k': position, 'b': backwards}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position, backwards = payload['k'], payload['b']
+        except Exception:
+            raise drf_exceptions.ParseError(self.invalid_cursor_message)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+            or not all(isinstance(value, int) for value in position)
+        ):
+            raise drf_exceptions.ParseError(self.invalid_cursor_message)
+        return position, bool(backwards)
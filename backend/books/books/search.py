@@ -0,0 +1,38 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db.models import Value
+
+from .models import Book
+
+
+# 'simple' neither stems nor drops stop words, which keeps full-text matches
+# close to the substring search they replaced across the catalog's languages.
+SEARCH_CONFIG = 'simple'
+SEARCH_WORD_PATTERN = re.compile(r'\w+')
+
+
+def get_search_query(search_string):
+    """
+    This turns a `search` parameter into a query in which every word must
+    match the start of a word in the title or an author's name. It gives
+    `None` if there are no words to search for.
+    """
+
+    words = []
+    for term in search_string.split(' ')[:32]:
+        words += SEARCH_WORD_PATTERN.findall(term.lower())
+    if not words:
+        return None
+    return SearchQuery(
+        ' & '.join(word + ':*' for word in words),
+        config=SEARCH_CONFIG,
+        search_type='raw'
+    )
+
+
+def update_search_vector(book_id, title, author_names):
+    text = ' '.join([title or ''] + list(author_names))
+    Book.objects.filter(id=book_id).update(
+        search_vector=SearchVector(Value(text), config=SEARCH_CONFIG)
+    )
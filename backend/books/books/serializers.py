@@ -51,6 +51,18 @@ class BookSerializer(serializers.ModelSerializer):
 
     lookup_field = 'gutenberg_id'
 
+    # These are the relations read for each book. Prefetching them serializes
+    # a list of books in one query per relation.
+    prefetch_fields = (
+        'authors',
+        'bookshelves',
+        'format_set',
+        'languages',
+        'subjects',
+        'summary_set',
+        'translators',
+    )
+
     class Meta:
         model = Book
         fields = (
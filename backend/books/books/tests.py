@@ -1,3 +1,581 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+
+from rest_framework.test import APITestCase
+
+from .catalog import bump_catalog_version, get_catalog_version
+from .documents import refresh_book_documents
+from .management.commands import updatecatalog
+from .management.commands.checkqueryplans import compare
+from .models import *
+from .search import update_search_vector
+from .serializers import BookSerializer
+from .synthetic import generate_catalog, load_catalog, write_rdf_files
+from .utils import get_archive_books, get_book, get_books
+
+
+def make_book(gutenberg_id, **kwargs):
+    book = Book.objects.create(
+        gutenberg_id=gutenberg_id,
+        title=kwargs.get('title', 'Book %d' % gutenberg_id),
+        copyright=kwargs.get('copyright', False),
+        download_count=kwargs.get('download_count', gutenberg_id),
+        media_type='Text'
+    )
+    author, _ = Person.objects.get_or_create(
+        name=kwargs.get('author', 'Author %d' % (gutenberg_id % 5)),
+        birth_year=1800,
+        death_year=1870
+    )
+    translator, _ = Person.objects.get_or_create(name='Translator', birth_year=None, death_year=None)
+    shelf, _ = Bookshelf.objects.get_or_create(name=kwargs.get('bookshelf', 'Shelf'))
+    language, _ = Language.objects.get_or_create(code=kwargs.get('language', 'en'))
+    subject, _ = Subject.objects.get_or_create(name=kwargs.get('subject', 'Fiction'))
+    book.authors.add(author)
+    book.translators.add(translator)
+    book.bookshelves.add(shelf)
+    book.languages.add(language)
+    book.subjects.add(subject)
+    Format.objects.create(book=book, mime_type='text/html', url='https://example.org/%d.html' % gutenberg_id)
+    Format.objects.create(book=book, mime_type='text/plain', url='https://example.org/%d.txt' % gutenberg_id)
+    Summary.objects.create(book=book, text='Summary of book %d.' % gutenberg_id)
+    if connection.vendor == 'postgresql':
+        update_search_vector(book.id, book.title, [author.name])
+    return book
+
+
+class BookListQueryCountTests(APITestCase):
+    # One count query, one page query, one stored document query, then one book
+    # query and one query per prefetched relation for books without documents.
+    PAGE_QUERY_COUNT = 11
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        make_book(1)
+        with self.assertNumQueries(self.PAGE_QUERY_COUNT):
+            response = self.client.get('/books/')
+        self.assertEqual(len(response.json()['results']), 1)
+
+        for gutenberg_id in range(2, 41):
+            make_book(gutenberg_id)
+        with self.assertNumQueries(self.PAGE_QUERY_COUNT):
+            response = self.client.get('/books/')
+        self.assertEqual(len(response.json()['results']), 32)
+
+    def test_prefetched_relations_are_serialized(self):
+        make_book(7)
+        book = self.client.get('/books/7/').json()
+        self.assertEqual(book['authors'][0]['name'], 'Author 2')
+        self.assertEqual(book['formats'], {
+            'text/html': 'https://example.org/7.html',
+            'text/plain': 'https://example.org/7.txt',
+        })
+        self.assertEqual(book['summaries'], ['Summary of book 7.'])
+
+
+class BookDocumentTests(APITestCase):
+    def setUp(self):
+        for gutenberg_id in range(1, 6):
+            make_book(gutenberg_id)
+        refresh_book_documents()
+
+    def test_stored_documents_skip_serializing(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/books/')
+        books = Book.objects.order_by('-download_count', '-id')
+        self.assertEqual(
+            response.json()['results'],
+            [BookSerializer(book).data for book in books]
+        )
+
+    def test_single_book(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/books/3/')
+        self.assertEqual(response.json(), BookSerializer(Book.objects.get(gutenberg_id=3)).data)
+        self.assertEqual(self.client.get('/books/999/').status_code, 404)
+
+    def test_refresh_replaces_documents(self):
+        Book.objects.filter(gutenberg_id=3).update(title='Renamed')
+        refresh_book_documents([Book.objects.get(gutenberg_id=3).id])
+        self.assertEqual(self.client.get('/books/3/').json()['title'], 'Renamed')
+
+
+class BookCursorPaginationTests(APITestCase):
+    def setUp(self):
+        # Repeated download counts make the ID tie-breaker matter.
+        for gutenberg_id in range(1, 80):
+            make_book(gutenberg_id, download_count=gutenberg_id % 7)
+
+    def get_all_ids(self, query):
+        response = self.client.get('/books/?%s' % query)
+        ids = [book['id'] for book in response.json()['results']]
+        next_url = response.json()['next']
+        while next_url:
+            response = self.client.get(next_url)
+            ids += [book['id'] for book in response.json()['results']]
+            next_url = response.json()['next']
+        return ids
+
+    def test_cursor_pages_match_page_number_pages(self):
+        for sort in ('popular', 'ascending', 'descending'):
+            expected = self.get_all_ids('sort=%s' % sort)
+            self.assertEqual(len(expected), 79)
+            self.assertEqual(self.get_all_ids('sort=%s&cursor=' % sort), expected)
+
+    def test_previous_cursor_walks_back(self):
+        first = self.client.get('/books/?cursor=').json()
+        self.assertIsNone(first['previous'])
+        self.assertNotIn('count', first)
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_invalid_cursor(self):
+        # Another sort's cursor has the wrong number of keys.
+        next_url = self.client.get('/books/?sort=ascending&cursor=').json()['next']
+        ascending_cursor = parse_qs(urlsplit(next_url).query)['cursor'][0]
+        for cursor in ('not-a-cursor', ascending_cursor):
+            response = self.client.get('/books/', {'cursor': cursor, 'sort': 'popular'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Full-text search needs PostgreSQL.')
+class BookSearchTests(APITestCase):
+    def setUp(self):
+        make_book(1, title='Great Expectations', author='Dickens, Charles', download_count=10)
+        make_book(2, title='A Tale of Two Cities', author='Dickens, Charles', download_count=20)
+        make_book(3, title='Great Gatsby', author='Fitzgerald, F. Scott', download_count=30)
+        make_book(4, title='Great great great', author='Nobody', download_count=5)
+
+    def search(self, query):
+        response = self.client.get('/books/?%s' % query)
+        return [book['id'] for book in response.json()['results']]
+
+    def test_search_matches_title_and_author_word_prefixes(self):
+        self.assertEqual(self.search('search=dickens'), [2, 1])
+        self.assertEqual(self.search('search=dick%20great'), [1])
+        self.assertEqual(self.search('search=GREAT'), [3, 1, 4])
+        self.assertEqual(self.search('search=expect%20fitz'), [])
+
+    def test_relevance_sort(self):
+        self.assertEqual(self.search('search=great&sort=relevance')[0], 4)
+        response = self.client.get('/books/?search=great&sort=relevance&cursor=')
+        self.assertEqual(response.status_code, 400)
+
+
+class BookTopicTests(APITestCase):
+    def test_topic_matches_bookshelves_or_subjects_once(self):
+        make_book(1, bookshelf="Children's Literature", subject='Fiction')
+        make_book(2, bookshelf='Poetry', subject='Sick children -- Fiction')
+        make_book(3, bookshelf='Poetry', subject='Fiction')
+        book = Book.objects.get(gutenberg_id=1)
+        book.subjects.add(Subject.objects.create(name='Children -- Juvenile fiction'))
+
+        response = self.client.get('/books/?topic=CHILDREN')
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(
+            sorted(book['id'] for book in response.json()['results']), [1, 2]
+        )
+
+
+class BookETagTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            CATALOG_VERSION_PATH=os.path.join(directory.name, 'version')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        make_book(1)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get('/books/?languages=en&sort=ascending')['ETag']
+        self.assertTrue(etag)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/books/?sort=ascending&languages=en', HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        book_etag = self.client.get('/books/1/')['ETag']
+        self.assertNotEqual(book_etag, etag)
+        response = self.client.get('/books/1/', HTTP_IF_NONE_MATCH=book_etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_update_changes_etag(self):
+        etag = self.client.get('/books/')['ETag']
+        bump_catalog_version()
+        response = self.client.get('/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans need PostgreSQL.')
+class QueryPlanCheckTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            CATALOG_VERSION_PATH=os.path.join(directory.name, 'version')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.baseline_path = os.path.join(directory.name, 'baselines.json')
+
+    def test_synthetic_catalog_is_deterministic(self):
+        self.assertEqual(generate_catalog(50, seed=3), generate_catalog(50, seed=3))
+        self.assertNotEqual(generate_catalog(50, seed=3), generate_catalog(50, seed=4))
+
+        load_catalog(generate_catalog(50))
+        self.assertEqual(Book.objects.count(), 50)
+        self.assertEqual(BookDocument.objects.count(), 50)
+        self.assertEqual(self.client.get('/books/').json()['count'], 50)
+
+    def test_rdf_files_read_back_as_generated(self):
+        catalog = generate_catalog(20, seed=5, language_skew=0)
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('loadsyntheticcatalog', books=20, seed=5, language_skew=0, rdf=directory, stdout=StringIO())
+            book = catalog['books'][6]
+            parsed = get_book(book['id'], os.path.join(directory, '7', 'pg7.rdf'))
+        person_names = {person['id']: person['name'] for person in catalog['persons']}
+        self.assertEqual(parsed['title'], book['title'])
+        self.assertEqual(parsed['copyright'], book['copyright'])
+        self.assertEqual(parsed['downloads'], book['download_count'])
+        self.assertEqual(
+            sorted(author['name'] for author in parsed['authors']),
+            sorted(person_names[link['person_id']] for link in catalog['book_author'] if link['book_id'] == 7)
+        )
+        self.assertEqual(parsed['formats'], {
+            format_['mime_type']: format_['url'] for format_ in catalog['formats'] if format_['book_id'] == 7
+        })
+
+    def test_regressions_fail_the_check(self):
+        call_command('checkqueryplans', books=200, update=True, baselines=self.baseline_path, stdout=StringIO())
+        call_command('checkqueryplans', baselines=self.baseline_path, stdout=StringIO())
+
+        with open(self.baseline_path) as baseline_file:
+            baselines = json.load(baseline_file)
+        baselines['all / popular']['cost'] /= 10
+        with open(self.baseline_path, 'w') as baseline_file:
+            json.dump(baselines, baseline_file)
+        with self.assertRaisesMessage(CommandError, '1 combination(s) regressed.'):
+            call_command('checkqueryplans', baselines=self.baseline_path, stdout=StringIO())
+
+    def test_new_sequential_scan_is_a_regression(self):
+        baseline = {'shape': ['Limit', '  Index Scan relation=books_book'], 'cost': 10, 'buffers': 5}
+        current = {'shape': ['Limit', '  Seq Scan relation=books_book'], 'cost': 12, 'buffers': 5}
+        self.assertEqual(compare(baseline, current, 1.5), ['new Seq Scan relation=books_book'])
+        self.assertEqual(compare(baseline, baseline, 1.5), [])
+
+
+class ParallelParsingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        write_rdf_files(generate_catalog(30), directory.name)
+        self.book_paths = [
+            (id, os.path.join(directory.name, str(id), 'pg%d.rdf' % id))
+            for id in range(1, 31)
+        ]
+        self.bad_path = os.path.join(directory.name, 'bad.rdf')
+        with open(self.bad_path, 'w') as bad_file:
+            bad_file.write('<rdf:RDF')
+
+    def test_books_come_in_order(self):
+        books = list(get_books(self.book_paths, workers=2, chunk_size=4))
+        self.assertEqual(books, [(id, get_book(id, path)) for id, path in self.book_paths])
+
+    def test_error_is_raised_in_place(self):
+        book_paths = self.book_paths[:9] + [(99, self.bad_path)] + self.book_paths[9:]
+        parsed_ids = []
+        with self.assertRaisesMessage(Exception, 'The XML file could not be parsed.'):
+            for id, book in get_books(book_paths, workers=2, chunk_size=4):
+                parsed_ids.append(id)
+        self.assertEqual(parsed_ids, list(range(1, 10)))
+
+
+class RdfParserTests(SimpleTestCase):
+    testdata = os.path.join(os.path.dirname(__file__), 'testdata')
+
+    def test_books_match_golden_output(self):
+        # These records are modeled on real catalog files, with the oddities
+        # the parser has to get right: agents that aren't creators, LCC
+        # subjects, `noimages` files listed first, multi-line titles, and so
+        # on. Bookshelves come out in no particular order.
+        with open(os.path.join(self.testdata, 'golden.json')) as golden_file:
+            golden = json.load(golden_file)
+        for id, expected in golden.items():
+            path = os.path.join(self.testdata, 'rdf', id, 'pg%s.rdf' % id)
+            with self.subTest(id=id):
+                book = get_book(id, path)
+                book['bookshelves'].sort()
+                self.assertEqual(book, expected)
+                with open(path, 'rb') as rdf_file:
+                    self.assertEqual(get_book(id, rdf_file), get_book(id, path))
+
+    def test_entities_are_refused(self):
+        content = (
+            b'<?xml version="1.0"?>'
+            b'<!DOCTYPE rdf:RDF [<!ENTITY a "aaaaaaaaaa">]>'
+            b'<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+            b'&a;</rdf:RDF>'
+        )
+        with self.assertRaisesMessage(Exception, 'The XML file could not be parsed.'):
+            get_book(1, content)
+
+
+class ArchiveIngestionTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        rdf_directory = os.path.join(self.directory, 'cache', 'epub')
+        write_rdf_files(generate_catalog(12), rdf_directory)
+        self.archive_path = os.path.join(self.directory, 'rdf-files.tar.bz2')
+        with tarfile.open(self.archive_path, 'w:bz2') as archive:
+            archive.add(os.path.join(self.directory, 'cache'), arcname='cache')
+
+    def test_archive_books_match_extracted_files(self):
+        kept_directory = os.path.join(self.directory, 'kept')
+        books = list(get_archive_books(self.archive_path, kept_directory))
+        self.assertEqual(sorted(id for id, _ in books), list(range(1, 13)))
+        for id, content in books:
+            path = os.path.join(kept_directory, str(id), 'pg%d.rdf' % id)
+            self.assertEqual(get_book(id, content), get_book(id, path))
+
+    def test_streamed_catalog_replaces_stale_books(self):
+        make_book(500)
+        changes = updatecatalog.put_catalog_in_db(
+            workers=1, book_files=get_archive_books(self.archive_path)
+        )
+        updatecatalog.remove_stale_books(changes)
+        self.assertEqual(
+            sorted(Book.objects.values_list('gutenberg_id', flat=True)),
+            list(range(1, 13))
+        )
+        self.assertEqual(str(changes), '12 added, 0 changed, 0 unchanged, 1 removed')
+
+    def test_failed_update_still_stamps_written_books(self):
+        temp_path = os.path.join(self.directory, 'tmp')
+        patches = [
+            mock.patch.multiple(
+                updatecatalog,
+                TEMP_PATH=temp_path,
+                DOWNLOAD_PATH=os.path.join(temp_path, 'catalog.tar.bz2'),
+                LOG_DIRECTORY=self.directory,
+                LOG_PATH=os.path.join(self.directory, 'log.txt'),
+            ),
+            mock.patch.object(
+                updatecatalog.urllib.request, 'urlretrieve',
+                side_effect=lambda url, path: shutil.copy(self.archive_path, path)
+            ),
+            # The books are committed by then, but their documents aren't.
+            mock.patch.object(
+                updatecatalog, 'refresh_book_documents',
+                side_effect=RuntimeError('documents failed')
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        settings_override = override_settings(
+            CATALOG_VERSION_PATH=os.path.join(self.directory, 'version')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        version = get_catalog_version()
+        with mock.patch('sys.stdout', StringIO()):
+            call_command('updatecatalog', stream=True, workers=1)
+        self.assertEqual(Book.objects.count(), 12)
+        self.assertNotEqual(get_catalog_version(), version)
+
+
+class IncrementalIngestionTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        write_rdf_files(generate_catalog(10), directory.name)
+        self.book_files = [
+            (id, os.path.join(directory.name, str(id), 'pg%d.rdf' % id))
+            for id in range(1, 11)
+        ]
+
+    def test_unchanged_books_are_skipped(self):
+        changes = updatecatalog.put_catalog_in_db(workers=1, book_files=self.book_files)
+        self.assertEqual(str(changes), '10 added, 0 changed, 0 unchanged, 0 removed')
+        self.assertEqual(len(changes.written_ids), 10)
+
+        with open(self.book_files[3][1]) as rdf_file:
+            rdf = rdf_file.read()
+        with open(self.book_files[3][1], 'w') as rdf_file:
+            rdf_file.write(rdf.replace('<pg:downloads>', '<pg:downloads>1'))
+        with self.assertNumQueries(1):
+            changes = updatecatalog.put_catalog_in_db(
+                workers=1, book_files=self.book_files[:3] + self.book_files[4:]
+            )
+        self.assertEqual(str(changes), '0 added, 0 changed, 9 unchanged, 0 removed')
+
+        changes = updatecatalog.put_catalog_in_db(workers=1, book_files=self.book_files)
+        self.assertEqual(str(changes), '0 added, 1 changed, 9 unchanged, 0 removed')
+        self.assertEqual(changes.written_ids, [Book.objects.get(gutenberg_id=4).id])
+
+        changes = updatecatalog.put_catalog_in_db(
+            workers=1, book_files=self.book_files, full=True
+        )
+        self.assertEqual(str(changes), '0 added, 10 changed, 0 unchanged, 0 removed')
+
+
+class BulkLoadTests(APITestCase):
+    def setUp(self):
+        self.book_files = []
+        for seed in (0, 1):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            write_rdf_files(generate_catalog(20, seed), directory.name)
+            self.book_files.append([
+                (id, os.path.join(directory.name, str(id), 'pg%d.rdf' % id))
+                for id in range(1, 21)
+            ])
+
+    def get_catalog_state(self):
+        def people(related):
+            return sorted(related.values_list('name', 'birth_year', 'death_year'))
+
+        state = {}
+        for book in Book.objects.order_by('gutenberg_id'):
+            state[book.gutenberg_id] = {
+                'fields': (
+                    book.title, book.copyright, book.download_count,
+                    book.media_type, book.fingerprint, book.search_vector
+                ),
+                'authors': people(book.authors),
+                'translators': people(book.translators),
+                'bookshelves': sorted(book.bookshelves.values_list('name', flat=True)),
+                'languages': sorted(book.languages.values_list('code', flat=True)),
+                'subjects': sorted(book.subjects.values_list('name', flat=True)),
+                'formats': sorted(book.format_set.values_list('mime_type', 'url')),
+                'summaries': sorted(book.summary_set.values_list('text', flat=True)),
+            }
+        counts = [
+            model.objects.count()
+            for model in (Person, Bookshelf, Language, Subject, Format, Summary)
+        ]
+        return state, counts
+
+    def load_both_catalogs(self, bulk):
+        for book_files in self.book_files:
+            changes = updatecatalog.put_catalog_in_db(
+                workers=1, book_files=book_files, bulk=bulk
+            )
+        return changes
+
+    def test_bulk_load_matches_book_by_book_load(self):
+        self.load_both_catalogs(bulk=False)
+        expected = self.get_catalog_state()
+        for model in (Book, Person, Bookshelf, Language, Subject):
+            model.objects.all().delete()
+
+        changes = self.load_both_catalogs(bulk=True)
+        self.assertEqual(str(changes), '0 added, 20 changed, 0 unchanged, 0 removed')
+        self.assertEqual(
+            sorted(changes.written_ids), sorted(Book.objects.values_list('id', flat=True))
+        )
+        self.assertEqual(self.get_catalog_state(), expected)
+
+    def test_bulk_load_skips_unchanged_books(self):
+        changes = updatecatalog.put_catalog_in_db(
+            workers=1, book_files=self.book_files[0], bulk=True
+        )
+        self.assertEqual(str(changes), '20 added, 0 changed, 0 unchanged, 0 removed')
+        changes = updatecatalog.put_catalog_in_db(
+            workers=1, book_files=self.book_files[0], bulk=True
+        )
+        self.assertEqual(str(changes), '0 added, 0 changed, 20 unchanged, 0 removed')
+        self.assertEqual(changes.written_ids, [])
+
+    def test_bulk_load_links_the_first_of_duplicate_rows(self):
+        updatecatalog.put_catalog_in_db(
+            workers=1, book_files=self.book_files[0], bulk=False
+        )
+
+        def get_links():
+            return {
+                book.gutenberg_id: (
+                    sorted(book.authors.values_list('id', flat=True)),
+                    sorted(book.translators.values_list('id', flat=True)),
+                    sorted(book.subjects.values_list('id', flat=True)),
+                )
+                for book in Book.objects.all()
+            }
+
+        expected = get_links()
+        # Copies of every person and subject, with higher IDs.
+        for person in list(Person.objects.all()):
+            Person.objects.create(
+                name=person.name, birth_year=person.birth_year, death_year=person.death_year
+            )
+        for subject in list(Subject.objects.all()):
+            Subject.objects.create(name=subject.name)
+        Book.objects.update(fingerprint=None)
+
+        changes = updatecatalog.put_catalog_in_db(
+            workers=1, book_files=self.book_files[0], bulk=True
+        )
+        self.assertEqual(str(changes), '0 added, 20 changed, 0 unchanged, 0 removed')
+        self.assertEqual(get_links(), expected)
+
+
+class DimensionMapTests(APITestCase):
+    def test_lookups_after_the_first_cost_no_queries(self):
+        Person.objects.create(name='Austen, Jane', birth_year=1775, death_year=1817)
+        Person.objects.create(name='Anonymous')
+        people = updatecatalog.DimensionMap(
+            Person, ['name', 'birth_year', 'death_year']
+        )
+        with self.assertNumQueries(1):
+            austen_id = people.get_id('Austen, Jane', 1775, 1817)
+        with self.assertNumQueries(1):
+            new_id = people.get_id('Austen, Jane', 1775, None)
+        with self.assertNumQueries(0):
+            self.assertEqual(people.get_id('Austen, Jane', 1775, 1817), austen_id)
+            self.assertEqual(people.get_id('Austen, Jane', 1775, None), new_id)
+            people.get_id('Anonymous', None, None)
+        self.assertEqual(
+            str(people), '2 preloaded, 5 lookups, 4 hits (80.0%), 1 created'
+        )
+
+    def test_catalog_load_reports_lookups(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        write_rdf_files(generate_catalog(30), directory.name)
+        book_files = [
+            (id, os.path.join(directory.name, str(id), 'pg%d.rdf' % id))
+            for id in range(1, 31)
+        ]
+
+        changes = updatecatalog.put_catalog_in_db(workers=1, book_files=book_files)
+        languages = changes.dimensions['languages']
+        self.assertEqual(languages.created, Language.objects.count())
+        self.assertEqual(
+            languages.hits + languages.created,
+            Book.languages.through.objects.count()
+        )
+
+        changes = updatecatalog.put_catalog_in_db(
+            workers=1, book_files=book_files, full=True
+        )
+        for dimension_map in changes.dimensions.values():
+            self.assertEqual(dimension_map.created, 0)
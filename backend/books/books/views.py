@@ -1,8 +1,18 @@
-from django.db.models import Q
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F, Q
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from rest_framework import exceptions as drf_exceptions, viewsets
+from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import JSONRenderer
 
+from .catalog import get_request_etag
+from .documents import get_book_documents
 from .models import *
+from .pagination import BookCursorPagination
+from .search import get_search_query
 from .serializers import *
 
 
@@ -16,16 +26,33 @@ class BookViewSet(viewsets.ModelViewSet):
 
     serializer_class = BookSerializer
 
+    @property
+    def paginator(self):
+        # Clients opt in to keyset pagination by sending `cursor` (empty for
+        # the first page); everyone else keeps the page-number pagination.
+        if not hasattr(self, '_paginator'):
+            if BookCursorPagination.cursor_query_param in self.request.GET:
+                if self.request.GET.get('sort') == 'relevance':
+                    raise drf_exceptions.ValidationError(
+                        'Cursor pagination is not available for the relevance sort.'
+                    )
+                self._paginator = BookCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
         queryset = self.queryset
 
         sort = self.request.GET.get('sort')
+        # The ID closes every ordering so that it's total, which keyset
+        # pagination depends on.
         if sort == 'ascending':
             queryset = queryset.order_by('id')
         elif sort == 'descending':
             queryset = queryset.order_by('-id')
         else:
-            queryset = queryset.order_by('-download_count')
+            queryset = queryset.order_by('-download_count', '-id')
 
         author_year_end = self.request.GET.get('author_year_end')
         try:
@@ -85,17 +112,66 @@ class BookViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(format__mime_type__startswith=mime_type)
 
         search_string = self.request.GET.get('search')
+        search_query = None
         if search_string is not None:
-            search_terms = search_string.split(' ')
-            for term in search_terms[:32]:
-                queryset = queryset.filter(
-                    Q(authors__name__icontains=term) | Q(title__icontains=term)
-                )
-
+            search_query = get_search_query(search_string)
+        if search_query is not None:
+            queryset = queryset.filter(search_vector=search_query)
+            if sort == 'relevance':
+                queryset = queryset.annotate(
+                    rank=SearchRank(F('search_vector'), search_query)
+                ).order_by('-rank', 'id')
+
+        # The few matching bookshelves and subjects are found through their
+        # trigram indexes first, and books are then semi-joined to them, so
+        # books are never multiplied by their bookshelves and subjects.
         topic = self.request.GET.get('topic')
         if topic is not None:
+            shelf_books = Book.bookshelves.through.objects.filter(
+                bookshelf__in=Bookshelf.objects.filter(name__icontains=topic)
+            )
+            subject_books = Book.subjects.through.objects.filter(
+                subject__in=Subject.objects.filter(name__icontains=topic)
+            )
             queryset = queryset.filter(
-                Q(bookshelves__name__icontains=topic) | Q(subjects__name__icontains=topic)
+                Q(id__in=shelf_books.values('book_id')) |
+                Q(id__in=subject_books.values('book_id'))
             )
 
-        return queryset.distinct()
+        return queryset.distinct().prefetch_related(
+            *BookSerializer.prefetch_fields
+        )
+
+    # Lists and single books are served from their stored documents: one query
+    # finds the IDs and another fetches their documents, with no serializing.
+    # Their ETags come from the catalog version, so a conditional request gets
+    # `304 Not Modified` before any book query runs.
+
+    @method_decorator(condition(etag_func=get_request_etag))
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        sort_fields = [field.lstrip('-') for field in queryset.query.order_by]
+        rows = queryset.prefetch_related(None).values(*sort_fields)
+        page = self.paginate_queryset(rows)
+        documents = get_book_documents([row['id'] for row in page])
+
+        envelope = self.get_paginated_response([]).data
+        del envelope['results']
+        content = b''.join([
+            JSONRenderer().render(envelope)[:-1],
+            b',"results":[',
+            b','.join(document.encode() for document in documents),
+            b']}'
+        ])
+        return HttpResponse(content, content_type='application/json')
+
+    @method_decorator(condition(etag_func=get_request_etag))
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.prefetch_related(None).order_by()
+        book_id = get_object_or_404(
+            queryset.values_list('id', flat=True),
+            **{self.lookup_field: kwargs[self.lookup_field]}
+        )
+        document = get_book_documents([book_id])[0]
+        return HttpResponse(document.encode(), content_type='application/json')
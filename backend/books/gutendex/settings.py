@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Other third-party apps
     'corsheaders',
@@ -184,6 +185,7 @@ CATALOG_RDF_DIR = os.path.join(BASE_CATALOG_DIR, 'rdf')
 CATALOG_INDEX_DIR = os.path.join(CATALOG_RDF_DIR, 'index.json')
 CATALOG_LOG_DIR = os.path.join(BASE_CATALOG_DIR, 'log')
 CATALOG_TEMP_DIR = os.path.join(BASE_CATALOG_DIR, 'tmp')
+CATALOG_VERSION_PATH = os.path.join(BASE_CATALOG_DIR, 'version')
 
 
 # Settings for Django REST Framework JSON API
@@ -0,0 +1,34 @@
+"""Topic trigram indexes
+
+Trigram indexes on bookshelf and subject names for `topic`, which need the
+pg_trgm extension.
+
+Revision ID: 08993a7bcc2d
+Revises: 2b0e7c2594f0
+Create Date: 2026-10-18 14:30:02.377150
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '08993a7bcc2d'
+down_revision: Union[str, None] = '2b0e7c2594f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_bookshelves_name_trgm', 'bookshelves', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_subjects_name_trgm', 'subjects', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The extension is left in place, as other database objects may use it.
+    op.drop_index('ix_subjects_name_trgm', table_name='subjects', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.drop_index('ix_bookshelves_name_trgm', table_name='bookshelves', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
@@ -0,0 +1,49 @@
+"""Book search vectors
+
+The `search_vector` column behind `search`, with its GIN index. Existing
+books get their vectors from their titles and authors' names, as
+`services.books.get_search_vector` builds them.
+
+Revision ID: 2b0e7c2594f0
+Revises: 6341e7bd03e7
+Create Date: 2026-10-18 14:30:01.204417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '2b0e7c2594f0'
+down_revision: Union[str, None] = '6341e7bd03e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('books', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # Filled before the index is built, which is quicker than updating it.
+    op.execute(
+        """
+        UPDATE books
+        SET search_vector = to_tsvector(
+            'simple',
+            coalesce(books.title, '') || ' ' || coalesce((
+                SELECT string_agg(persons.name, ' ')
+                FROM book_author
+                JOIN persons ON persons.id = book_author.person_id
+                WHERE book_author.book_id = books.id
+            ), '')
+        )
+        """
+    )
+    op.create_index('ix_books_search_vector', 'books', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_search_vector', table_name='books', postgresql_using='gin')
+    op.drop_column('books', 'search_vector')
@@ -0,0 +1,34 @@
+"""Book documents
+
+Each book's serialized JSON, which the list and detail endpoints serve.
+
+Revision ID: 2dad1e866271
+Revises: 08993a7bcc2d
+Create Date: 2026-10-18 14:30:03.516928
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '2dad1e866271'
+down_revision: Union[str, None] = '08993a7bcc2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('book_documents',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('document', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('book_documents')
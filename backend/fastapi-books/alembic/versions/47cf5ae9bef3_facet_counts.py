@@ -0,0 +1,34 @@
+"""Facet counts
+
+The unfiltered facet counts, stored by the loader for `/books/facets`.
+
+Revision ID: 47cf5ae9bef3
+Revises: 2dad1e866271
+Create Date: 2026-10-18 14:30:04.662381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '47cf5ae9bef3'
+down_revision: Union[str, None] = '2dad1e866271'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('facet_counts',
+    sa.Column('facet', sa.String(length=16), nullable=False),
+    sa.Column('value', sa.String(length=64), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('facet', 'value')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('facet_counts')
@@ -0,0 +1,65 @@
+"""Performance indexes
+
+Composite primary keys and reverse-direction indexes for the association
+tables, `book_id` indexes for formats and summaries, the default sort's index
+on books, and the loader's get-or-create key on persons.
+
+Revision ID: 9bf26f6e8739
+Revises: 47cf5ae9bef3
+Create Date: 2026-10-18 14:30:05.918780
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# Each association table and the column linking it to the other side.
+ASSOCIATION_TABLES = [
+    ('book_author', 'person_id'),
+    ('book_translator', 'person_id'),
+    ('book_bookshelf', 'bookshelf_id'),
+    ('book_language', 'language_id'),
+    ('book_subject', 'subject_id'),
+]
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9bf26f6e8739'
+down_revision: Union[str, None] = '47cf5ae9bef3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, other in ASSOCIATION_TABLES:
+        # Links without both ends or repeated links would break the keys.
+        op.execute(f'DELETE FROM {table} WHERE book_id IS NULL OR {other} IS NULL')
+        op.execute(
+            f'DELETE FROM {table} a USING {table} b '
+            f'WHERE a.ctid < b.ctid AND a.book_id = b.book_id AND a.{other} = b.{other}'
+        )
+        op.alter_column(table, 'book_id', existing_type=sa.Integer(), nullable=False)
+        op.alter_column(table, other, existing_type=sa.Integer(), nullable=False)
+        op.create_primary_key(f'{table}_pkey', table, ['book_id', other])
+        op.create_index(f'ix_{table}_{other}_book_id', table, [other, 'book_id'], unique=False)
+    op.create_index(op.f('ix_formats_book_id'), 'formats', ['book_id'], unique=False)
+    op.create_index(op.f('ix_summaries_book_id'), 'summaries', ['book_id'], unique=False)
+    op.create_index('ix_books_download_count_id', 'books', ['download_count', 'id'], unique=False)
+    op.create_index(
+        'ix_persons_name_birth_year_death_year', 'persons', ['name', 'birth_year', 'death_year'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_persons_name_birth_year_death_year', table_name='persons')
+    op.drop_index('ix_books_download_count_id', table_name='books')
+    op.drop_index(op.f('ix_summaries_book_id'), table_name='summaries')
+    op.drop_index(op.f('ix_formats_book_id'), table_name='formats')
+    for table, other in reversed(ASSOCIATION_TABLES):
+        op.drop_index(f'ix_{table}_{other}_book_id', table_name=table)
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.alter_column(table, other, existing_type=sa.Integer(), nullable=True)
+        op.alter_column(table, 'book_id', existing_type=sa.Integer(), nullable=True)
@@ -1,7 +1,14 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import defusedxml.ElementTree as parser
+import hashlib
+import json
+import os
 import re
+import tarfile
 
 
+ARCHIVE_MEMBER_PATTERN = re.compile(r'(?:^|/)(\d+)/pg\1\.rdf$')
 LINE_BREAK_PATTERN = re.compile(r'[ \t]*[\n\r]+[ \t]*')
 NAMESPACES = {
     'dc': 'http://purl.org/dc/terms/',
@@ -27,19 +34,220 @@ def fix_subtitles(title):
     return LINE_BREAK_PATTERN.sub('; ', new_title)
 
 
-def get_book(id, xml_file_path):
-    """ Based on https://gist.github.com/andreasvc/b3b4189120d84dec8857 """
+# The tags and attributes `get_book` reads, spelled the way the parser gives
+# them, so they're only formatted once.
+ABOUT = '{%(rdf)s}about' % NAMESPACES
+BIRTHDATE = '{%(pg)s}birthdate' % NAMESPACES
+BOOKSHELF = '{%(pg)s}bookshelf' % NAMESPACES
+CREATOR = '{%(dc)s}creator' % NAMESPACES
+DEATHDATE = '{%(pg)s}deathdate' % NAMESPACES
+DOWNLOADS = '{%(pg)s}downloads' % NAMESPACES
+EBOOK = '{%(pg)s}ebook' % NAMESPACES
+FILE = '{%(pg)s}file' % NAMESPACES
+FORMAT = '{%(dc)s}format' % NAMESPACES
+LANGUAGE = '{%(dc)s}language' % NAMESPACES
+LCSH = '%(dc)sLCSH' % NAMESPACES
+MEMBER_OF = '{%(dcam)s}memberOf' % NAMESPACES
+NAME = '{%(pg)s}name' % NAMESPACES
+RESOURCE = '{%(rdf)s}resource' % NAMESPACES
+RIGHTS = '{%(dc)s}rights' % NAMESPACES
+SUBJECT = '{%(dc)s}subject' % NAMESPACES
+SUMMARY = '{%(pg)s}marc520' % NAMESPACES
+TITLE = '{%(dc)s}title' % NAMESPACES
+TRANSLATOR = '{%(marcrel)s}trl' % NAMESPACES
+TYPE = '{%(dc)s}type' % NAMESPACES
+VALUE = '{%(rdf)s}value' % NAMESPACES
+
+PERSON_FIELDS = {NAME: 'name', BIRTHDATE: 'birth', DEATHDATE: 'death'}
+BOOK_FIELDS = (TITLE, RIGHTS, DOWNLOADS)
+
+
+class BookTarget:
+    """
+    This is a parser target that picks out the parts of an RDF file's ebook
+    node that `get_book` needs as the file is read, without building a tree.
+
+    Every part is read the way `Element.find` would find it: a person's name
+    and dates, a subject's, bookshelf's or format's value, the title, rights,
+    download count and type are the first ones inside their element, and
+    languages and summaries are all of them. Only text is kept, so turning it
+    into numbers is left to `get_book`.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_ebook = False
+        self.found_ebook = False
+        # The kind of each element open inside the ebook, or `None`.
+        self.kinds = []
+        # Where the text of the element being read goes, as
+        # `(container, key)` pairs, and its pieces so far.
+        self.text_targets = []
+        self.text = None
+
+        self.fields = {}
+        self.authors = []
+        self.translators = []
+        self.subjects = []
+        self.bookshelves = []
+        self.files = []
+        self.languages = []
+        self.summaries = []
+
+        self.open_people = []
+        self.open_subjects = []
+        self.open_bookshelves = []
+        self.open_files = []
+        self.open_formats = []
+        self.open_types = 0
+        self.open_languages = 0
+
+    def capture(self, container, key):
+        container[key] = None
+        self.text_targets.append((container, key))
+
+    def flush(self):
+        # Like `Element.text`, this is only the text before the first child.
+        text = ''.join(self.text) if self.text else None
+        for container, key in self.text_targets:
+            container[key] = text
+        self.text_targets = []
+        self.text = None
+
+    def start(self, tag, attrib):
+        if self.text is not None:
+            self.flush()
+        if not self.in_ebook:
+            if self.depth == 1 and tag == EBOOK and not self.found_ebook:
+                self.in_ebook = self.found_ebook = True
+            else:
+                self.depth += 1
+            return
+
+        kind = None
+        if tag == VALUE:
+            for record in self.open_subjects:
+                if 'value' not in record:
+                    self.capture(record, 'value')
+            for record in self.open_bookshelves:
+                if 'value' not in record:
+                    self.capture(record, 'value')
+            for record in self.open_formats:
+                if 'format' not in record:
+                    self.capture(record, 'format')
+            if self.open_types and TYPE not in self.fields:
+                self.capture(self.fields, TYPE)
+            if self.open_languages:
+                self.languages.append(None)
+                self.capture(self.languages, len(self.languages) - 1)
+        elif tag in PERSON_FIELDS:
+            field = PERSON_FIELDS[tag]
+            for record in self.open_people:
+                if field not in record:
+                    self.capture(record, field)
+        elif tag == CREATOR or tag == TRANSLATOR:
+            record = {}
+            (self.authors if tag == CREATOR else self.translators).append(record)
+            self.open_people.append(record)
+            kind = 'person'
+        elif tag == MEMBER_OF:
+            for record in self.open_subjects:
+                if 'member_of' not in record:
+                    record['member_of'] = attrib.get(RESOURCE)
+        elif tag == SUBJECT:
+            record = {}
+            self.subjects.append(record)
+            self.open_subjects.append(record)
+            kind = 'subject'
+        elif tag == BOOKSHELF:
+            record = {}
+            self.bookshelves.append(record)
+            self.open_bookshelves.append(record)
+            kind = 'bookshelf'
+        elif tag == FILE:
+            record = {'url': attrib.get(ABOUT)}
+            self.files.append(record)
+            self.open_files.append(record)
+            kind = 'file'
+        elif tag == FORMAT:
+            # Only a file's own format counts.
+            if self.kinds and self.kinds[-1] == 'file':
+                self.open_formats.append(self.open_files[-1])
+                kind = 'format'
+        elif tag == TYPE:
+            self.open_types += 1
+            kind = 'type'
+        elif tag == LANGUAGE:
+            self.open_languages += 1
+            kind = 'language'
+        elif tag == SUMMARY:
+            self.summaries.append(None)
+            self.capture(self.summaries, len(self.summaries) - 1)
+        elif tag in BOOK_FIELDS and tag not in self.fields:
+            self.capture(self.fields, tag)
+
+        if self.text_targets:
+            self.text = []
+        self.kinds.append(kind)
+
+    def data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    def end(self, tag):
+        if self.text is not None:
+            self.flush()
+        if not self.in_ebook:
+            self.depth -= 1
+            return
+        if not self.kinds:
+            # This is the end of the ebook node.
+            self.in_ebook = False
+            return
+
+        kind = self.kinds.pop()
+        if kind == 'person':
+            self.open_people.pop()
+        elif kind == 'subject':
+            self.open_subjects.pop()
+        elif kind == 'bookshelf':
+            self.open_bookshelves.pop()
+        elif kind == 'file':
+            self.open_files.pop()
+        elif kind == 'format':
+            self.open_formats.pop()
+        elif kind == 'type':
+            self.open_types -= 1
+        elif kind == 'language':
+            self.open_languages -= 1
+
+    def close(self):
+        return self
+
+
+def get_book(id, xml_file):
+    """
+    Based on https://gist.github.com/andreasvc/b3b4189120d84dec8857
+
+    `xml_file` is a path, a file object, or the file's bytes. It's read in one
+    pass by `BookTarget`, through defusedxml's parser.
+    """
 
     # Parse the XML.
-    document = None
     try:
-        document = parser.parse(xml_file_path)
+        if isinstance(xml_file, str):
+            with open(xml_file, 'rb') as rdf_file:
+                xml_file = rdf_file.read()
+        elif not isinstance(xml_file, bytes):
+            xml_file = xml_file.read()
+        xml_parser = parser.DefusedXMLParser(target=BookTarget())
+        xml_parser.feed(xml_file)
+        book = xml_parser.close()
     except:
         raise Exception('The XML file could not be parsed.')
 
-    # Get the book node.
-    root = document.getroot()
-    book = root.find('{%(pg)s}ebook' % NAMESPACES)
+    if not book.found_ebook:
+        raise AttributeError('The XML file has no ebook node.')
 
     result = {
         'id': int(id),
@@ -56,110 +264,177 @@ def get_book(id, xml_file_path):
         'copyright': None
     }
 
-    # Authors
-    creators = book.findall('.//{%(dc)s}creator' % NAMESPACES)
-    for creator in creators:
-        author = {'birth': None, 'death': None}
-        name = creator.find('.//{%(pg)s}name' % NAMESPACES)
-        if name is None:
-            continue
-        author['name'] = safe_unicode(name.text, encoding='UTF-8')
-        birth = creator.find('.//{%(pg)s}birthdate' % NAMESPACES)
-        if birth is not None:
-            author['birth'] = int(birth.text)
-        death = creator.find('.//{%(pg)s}deathdate' % NAMESPACES)
-        if death is not None:
-            author['death'] = int(death.text)
-        result['authors'] += [author]
-
-    # Translators
-    translator_elements = book.findall('.//{%(marcrel)s}trl' % NAMESPACES)
-    for translator_element in translator_elements:
-        translator = {'birth': None, 'death': None}
-        name = translator_element.find('.//{%(pg)s}name' % NAMESPACES)
-        if name is None:
-            continue
-        translator['name'] = safe_unicode(name.text, encoding='UTF-8')
-        birth = translator_element.find('.//{%(pg)s}birthdate' % NAMESPACES)
-        if birth is not None:
-            translator['birth'] = int(birth.text)
-        death = translator_element.find('.//{%(pg)s}deathdate' % NAMESPACES)
-        if death is not None:
-            translator['death'] = int(death.text)
-        result['translators'] += [translator]
+    # Authors and translators
+    for key, records in (('authors', book.authors), ('translators', book.translators)):
+        for record in records:
+            if 'name' not in record:
+                continue
+            person = {'birth': None, 'death': None}
+            person['name'] = safe_unicode(record['name'], encoding='UTF-8')
+            if 'birth' in record:
+                person['birth'] = int(record['birth'])
+            if 'death' in record:
+                person['death'] = int(record['death'])
+            result[key] += [person]
 
     # Title
-    title = book.find('.//{%(dc)s}title' % NAMESPACES)
-    if title is not None:
+    if TITLE in book.fields:
         result['title'] = fix_subtitles(
-            safe_unicode(title.text, encoding='UTF-8')
+            safe_unicode(book.fields[TITLE], encoding='UTF-8')
         )
 
     # Subjects
     result['subjects'] = set()
-    for subject in book.findall('.//{%(dc)s}subject' % NAMESPACES):
-        subject_type = subject.find('.//{%(dcam)s}memberOf' % NAMESPACES)
-        if subject_type is None:
+    for record in book.subjects:
+        if 'member_of' not in record:
             continue
-        subject_type = subject_type.get('{%(rdf)s}resource' % NAMESPACES)
-        value = subject.find('.//{%(rdf)s}value' % NAMESPACES)
-        value = value.text
-        if subject_type in ('%(dc)sLCSH' % NAMESPACES):
+        value = record['value']
+        if record['member_of'] in LCSH:
             result['subjects'].add(value)
     result['subjects'] = list(result['subjects'])
     result['subjects'].sort()
 
     # Book Shelves
     result['bookshelves'] = set()
-    for bookshelf in book.findall('.//{%(pg)s}bookshelf' % NAMESPACES):
-        value = bookshelf.find('.//{%(rdf)s}value' % NAMESPACES)
-        if value is not None:
-            result['bookshelves'].add(value.text)
+    for record in book.bookshelves:
+        if 'value' in record:
+            result['bookshelves'].add(record['value'])
     result['bookshelves'] = list(result['bookshelves'])
 
     # Copyright
-    rights = book.find('.//{%(dc)s}rights' % NAMESPACES)
-    if rights.text.startswith('Public domain in the USA.'):
+    rights = book.fields.get(RIGHTS)
+    if rights.startswith('Public domain in the USA.'):
         result['copyright'] = False
-    elif rights.text.startswith('Copyrighted.'):
+    elif rights.startswith('Copyrighted.'):
         result['copyright'] = True
     else:
         result['copyright'] = None
 
     # Formats (preferring image URLs to `noimages` URLs)
-    for file in book.findall('.//{%(pg)s}file' % NAMESPACES):
-        content_type = file.find('{%(dc)s}format//{%(rdf)s}value' % NAMESPACES)
+    for record in book.files:
+        content_type = record['format']
         if (
-            content_type.text not in result['formats']
-            or 'noimages' in result['formats'][content_type.text]
+            content_type not in result['formats']
+            or 'noimages' in result['formats'][content_type]
         ):
-            url = file.get('{%(rdf)s}about' % NAMESPACES)
-            result['formats'][content_type.text] = url
+            result['formats'][content_type] = record['url']
 
     # Type
-    book_type = book.find(
-        './/{%(dc)s}type//{%(rdf)s}value' % NAMESPACES
-    )
-    result['type'] = 'Text' if book_type is None else book_type.text
+    result['type'] = book.fields.get(TYPE, 'Text')
 
     # Languages
-    languages = book.findall(
-        './/{%(dc)s}language//{%(rdf)s}value' % NAMESPACES
-    )
-    result['languages'] = [language.text for language in languages] or []
+    result['languages'] = book.languages
 
     # Download Count
-    download_count = book.find('.//{%(pg)s}downloads' % NAMESPACES)
-    if download_count is not None:
-        result['downloads'] = int(download_count.text)
-    
+    if DOWNLOADS in book.fields:
+        result['downloads'] = int(book.fields[DOWNLOADS])
+
     # Summary
-    summaries = book.findall('.//{%(pg)s}marc520' % NAMESPACES)
-    result['summaries'] = [summary.text for summary in summaries]
+    result['summaries'] = book.summaries
 
     return result
 
 
+def get_book_fingerprint(book):
+    """
+    This gives a hash of a book as `get_book` parses it, which only changes
+    when the record does. Bookshelves come out in no particular order, so
+    they're sorted first.
+    """
+
+    canonical = dict(book, bookshelves=sorted(book['bookshelves']))
+    return hashlib.sha256(
+        json.dumps(canonical, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def get_book_chunk(chunk):
+    """
+    This parses a list of `(id, xml_file)` pairs in a worker process. A book
+    that fails gives its exception in place of its dictionary.
+    """
+
+    results = []
+    for id, xml_file in chunk:
+        try:
+            results.append(get_book(id, xml_file))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+def get_books(books, workers=None, chunk_size=100):
+    """
+    This parses `(id, xml_file)` pairs, where `xml_file` is a path or the
+    file's bytes, in a pool of `workers` processes
+    (all cores by default, none with 1) and yields `(id, book)` in the order
+    given. Only a few chunks per worker are parsed ahead of the consumer, and a
+    parse error is raised where that book would have been yielded.
+    """
+
+    books = iter(books)
+    if workers == 1:
+        for id, xml_file in books:
+            yield id, get_book(id, xml_file)
+        return
+
+    def next_chunk():
+        chunk = []
+        for pair in books:
+            chunk.append(pair)
+            if len(chunk) == chunk_size:
+                break
+        return chunk
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for _ in range(workers * 2):
+            chunk = next_chunk()
+            if not chunk:
+                break
+            pending.append((chunk, executor.submit(get_book_chunk, chunk)))
+        while pending:
+            chunk, future = pending.popleft()
+            results = future.result()
+            next_pairs = next_chunk()
+            if next_pairs:
+                pending.append((next_pairs, executor.submit(get_book_chunk, next_pairs)))
+            for (id, _), result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    raise result
+                yield id, result
+
+
+def get_archive_books(archive, directory=None):
+    """
+    This yields `(id, rdf_bytes)` for every book in a Project Gutenberg
+    `rdf-files.tar.bz2` archive (a path or a file object), in archive order.
+    The archive is read as a stream, one member at a time, so nothing is
+    extracted unless `directory` is given, in which case each file is also
+    written to `<directory>/<id>/pg<id>.rdf`.
+    """
+
+    if isinstance(archive, str):
+        tar = tarfile.open(archive, mode='r|*')
+    else:
+        tar = tarfile.open(fileobj=archive, mode='r|*')
+    with tar:
+        for member in tar:
+            match = ARCHIVE_MEMBER_PATTERN.search(member.name)
+            if match is None or not member.isfile():
+                continue
+            id = int(match.group(1))
+            content = tar.extractfile(member).read()
+            if directory is not None:
+                book_directory = os.path.join(directory, str(id))
+                os.makedirs(book_directory, exist_ok=True)
+                path = os.path.join(book_directory, 'pg%d.rdf' % id)
+                with open(path, 'wb') as rdf_file:
+                    rdf_file.write(content)
+            yield id, content
+
+
 def safe_unicode(arg, *args, **kwargs):
     """ Coerce argument to Unicode if it's not already. """
     return arg if isinstance(arg, str) else str(arg, *args, **kwargs)
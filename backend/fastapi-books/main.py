@@ -1,7 +1,24 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 
+from db import SessionLocal
 from routers import books
+from services.books import CATALOG_INDEX_ENABLED
+
+def load_catalog_index():
+    from services.catalog_index import get_catalog_index
+    with SessionLocal() as db:
+        get_catalog_index(db)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the in-memory index before the first request rather than during it.
+    if CATALOG_INDEX_ENABLED:
+        await run_in_threadpool(load_catalog_index)
+    yield
 
-app = FastAPI(title="Gutendex FastAPI")
+app = FastAPI(title="Gutendex FastAPI", lifespan=lifespan)
 
-app.include_router(books.router, prefix="/books", tags=["books"]) 
\ No newline at end of file
+app.include_router(books.router, prefix="/books", tags=["books"])
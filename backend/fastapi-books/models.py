@@ -1,36 +1,45 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table, Text
+from sqlalchemy import Column, Integer, String, Boolean, DDL, ForeignKey, Index, Table, Text, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from db import Base
 
-# Association tables for many-to-many relationships
+# Association tables for many-to-many relationships. The `(book_id, ...)`
+# primary key serves lookups from books and rules out duplicate links; the
+# reverse index serves lookups from the other side, like the filters'
+# semi-joins.
 book_author = Table(
     'book_author', Base.metadata,
-    Column('book_id', Integer, ForeignKey('books.id')),
-    Column('person_id', Integer, ForeignKey('persons.id'))
+    Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
+    Column('person_id', Integer, ForeignKey('persons.id'), primary_key=True),
+    Index('ix_book_author_person_id_book_id', 'person_id', 'book_id'),
 )
 
 book_translator = Table(
     'book_translator', Base.metadata,
-    Column('book_id', Integer, ForeignKey('books.id')),
-    Column('person_id', Integer, ForeignKey('persons.id'))
+    Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
+    Column('person_id', Integer, ForeignKey('persons.id'), primary_key=True),
+    Index('ix_book_translator_person_id_book_id', 'person_id', 'book_id'),
 )
 
 book_bookshelf = Table(
     'book_bookshelf', Base.metadata,
-    Column('book_id', Integer, ForeignKey('books.id')),
-    Column('bookshelf_id', Integer, ForeignKey('bookshelves.id'))
+    Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
+    Column('bookshelf_id', Integer, ForeignKey('bookshelves.id'), primary_key=True),
+    Index('ix_book_bookshelf_bookshelf_id_book_id', 'bookshelf_id', 'book_id'),
 )
 
 book_language = Table(
     'book_language', Base.metadata,
-    Column('book_id', Integer, ForeignKey('books.id')),
-    Column('language_id', Integer, ForeignKey('languages.id'))
+    Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
+    Column('language_id', Integer, ForeignKey('languages.id'), primary_key=True),
+    Index('ix_book_language_language_id_book_id', 'language_id', 'book_id'),
 )
 
 book_subject = Table(
     'book_subject', Base.metadata,
-    Column('book_id', Integer, ForeignKey('books.id')),
-    Column('subject_id', Integer, ForeignKey('subjects.id'))
+    Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
+    Column('subject_id', Integer, ForeignKey('subjects.id'), primary_key=True),
+    Index('ix_book_subject_subject_id_book_id', 'subject_id', 'book_id'),
 )
 
 class Book(Base):
@@ -41,6 +50,11 @@ class Book(Base):
     copyright = Column(Boolean, nullable=True)
     download_count = Column(Integer, nullable=True)
     media_type = Column(String(16), nullable=False)
+    # Hash of the parsed RDF record when it was last loaded, so that the
+    # loader can skip books that haven't changed.
+    fingerprint = Column(String(64), nullable=True)
+    # Title and author names, kept up to date by the catalog loader.
+    search_vector = Column(TSVECTOR, nullable=True)
 
     authors = relationship('Person', secondary=book_author, back_populates='books_authored')
     translators = relationship('Person', secondary=book_translator, back_populates='books_translated')
@@ -50,16 +64,42 @@ class Book(Base):
     formats = relationship('Format', back_populates='book')
     summaries = relationship('Summary', back_populates='book')
 
+    __table_args__ = (
+        Index('ix_books_search_vector', 'search_vector', postgresql_using='gin'),
+        # The default sort, read in order instead of sorting every match.
+        Index('ix_books_download_count_id', 'download_count', 'id'),
+    )
+
+class BookDocument(Base):
+    # The finished JSON of a book as the API serves it, written by the catalog
+    # loader so that reads skip hydrating and serializing its relationships.
+    __tablename__ = 'book_documents'
+    book_id = Column(Integer, ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    document = Column(Text, nullable=False)
+
+class FacetCount(Base):
+    # Book counts per facet value over the whole catalog, written by the
+    # catalog loader so that unfiltered facet requests read a few rows.
+    __tablename__ = 'facet_counts'
+    facet = Column(String(16), primary_key=True)
+    value = Column(String(64), primary_key=True)
+    count = Column(Integer, nullable=False)
+
 class Bookshelf(Base):
     __tablename__ = 'bookshelves'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(64), unique=True, nullable=False)
     books = relationship('Book', secondary=book_bookshelf, back_populates='bookshelves')
 
+    # Serves the `ilike '%topic%'` lookups of the topic filter.
+    __table_args__ = (
+        Index('ix_bookshelves_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+
 class Format(Base):
     __tablename__ = 'formats'
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey('books.id'))
+    book_id = Column(Integer, ForeignKey('books.id'), index=True)
     mime_type = Column(String(32), nullable=False)
     url = Column(String(256), nullable=False)
     book = relationship('Book', back_populates='formats')
@@ -79,15 +119,32 @@ class Person(Base):
     books_authored = relationship('Book', secondary=book_author, back_populates='authors')
     books_translated = relationship('Book', secondary=book_translator, back_populates='translators')
 
+    # The catalog loader's get-or-create key.
+    __table_args__ = (
+        Index('ix_persons_name_birth_year_death_year', 'name', 'birth_year', 'death_year'),
+    )
+
 class Subject(Base):
     __tablename__ = 'subjects'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(256), nullable=False)
     books = relationship('Book', secondary=book_subject, back_populates='subjects')
 
+    # Serves the `ilike '%topic%'` lookups of the topic filter.
+    __table_args__ = (
+        Index('ix_subjects_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+
 class Summary(Base):
     __tablename__ = 'summaries'
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey('books.id'))
+    book_id = Column(Integer, ForeignKey('books.id'), index=True)
     text = Column(Text, nullable=False)
-    book = relationship('Book', back_populates='summaries') 
\ No newline at end of file
+    book = relationship('Book', back_populates='summaries') 
+
+# The trigram indexes above need the pg_trgm extension.
+event.listen(
+    Base.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
@@ -0,0 +1,28 @@
+from typing import Any, Sequence
+
+import orjson
+from fastapi import Response
+
+class BookJSONResponse(Response):
+    """JSON response that skips FastAPI's `jsonable_encoder` and validation
+    passes. Content that is already encoded (stored book documents) is sent as
+    it is, and anything else is encoded in one go by orjson."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, str):
+            return content.encode()
+        return orjson.dumps(content)
+
+def encode_book_list(envelope: dict, documents: Sequence[str]) -> bytes:
+    # The documents are spliced into the envelope as they are rather than
+    # decoded and encoded again.
+    return b"".join([
+        orjson.dumps(envelope)[:-1],
+        b',"results":[',
+        ",".join(documents).encode(),
+        b"]}",
+    ])
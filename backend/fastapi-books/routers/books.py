@@ -1,15 +1,51 @@
-from fastapi import APIRouter, Query, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Query, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 
-from db import get_db
-from schemas import BookOut
-from services.books import get_books, get_book_by_gutenberg_id
+from db import EndpointSession, SessionLocal, get_endpoint_db
+from responses import BookJSONResponse, encode_book_list
+from schemas import BookBatchIn, BookOut
+from services.cache import CACHE_STATS_ENABLED
+from services.catalog import get_etag
+from services.books import (
+    fill_documents,
+    get_book_document,
+    get_book_documents,
+    get_books_by_cursor,
+    get_books_with_count,
+    get_facets,
+    get_page_cache_key,
+    iter_book_documents,
+    page_cache,
+)
 
 router = APIRouter()
 
-@router.get("/", response_model=dict)
-def list_books(
+async def check_etag(request: Request) -> str:
+    # Declared ahead of `get_endpoint_db`, so a conditional request that still
+    # matches the catalog version gets its 304 before a session is opened.
+    # `*` is left to fall through: it only matches a representation that
+    # exists, which isn't known until the endpoint has looked for it.
+    etag = get_etag(request.url.path, request.url.query)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in tags:
+            raise HTTPException(status_code=304, headers={"ETag": etag})
+    return etag
+
+def book_list_response(envelope: dict, documents: List[str], etag: str) -> BookJSONResponse:
+    return BookJSONResponse(encode_book_list(envelope, documents), headers={"ETag": etag})
+
+# The endpoints are coroutines on an asyncpg session, so a request waiting on
+# Postgres holds no threadpool worker. The service functions are shared with
+# the sync loader scripts and run on the async connection through `run_sync`,
+# which keeps their Python work on the event loop. With `BOOKS_SYNC_DB=1`
+# they run on a sync session in the threadpool instead.
+
+@router.get("/", response_model=dict, response_class=BookJSONResponse)
+async def list_books(
+    request: Request,
     sort: Optional[str] = Query(None),
     author_year_end: Optional[int] = Query(None),
     author_year_start: Optional[int] = Query(None),
@@ -21,11 +57,82 @@ def list_books(
     topic: Optional[str] = Query(None),
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", pattern="^(exact|estimated)$"),
+    etag: str = Depends(check_etag),
+    db: EndpointSession = Depends(get_endpoint_db),
+):
+    filters = dict(
+        author_year_end=author_year_end,
+        author_year_start=author_year_start,
+        copyright=copyright,
+        ids=ids,
+        languages=languages,
+        mime_type=mime_type,
+        search=search,
+        topic=topic,
+    )
+    cache_key = get_page_cache_key(
+        str(request.base_url), sort=sort, limit=limit, offset=offset, cursor=cursor, count=count, **filters
+    )
+    body = await page_cache.get_async(cache_key)
+    if body is not None:
+        return BookJSONResponse(body, headers={"ETag": etag})
+
+    if cursor is not None:
+        # Keyset mode: `?cursor=` starts at the first page, and `next` and
+        # `previous` carry opaque cursors instead of offsets. No count is
+        # returned, since counting would cost as much as the deep scan the
+        # cursor avoids.
+        try:
+            rows, next_cursor, previous_cursor = await db.run_sync(
+                get_books_by_cursor, cursor=cursor, limit=limit, sort=sort, documents=True, **filters
+            )
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        response = book_list_response({
+            "next": str(request.url.include_query_params(cursor=next_cursor)) if next_cursor else None,
+            "previous": str(request.url.include_query_params(cursor=previous_cursor)) if previous_cursor else None,
+        }, await db.run_sync(fill_documents, rows), etag)
+    else:
+        total, rows = await db.run_sync(
+            get_books_with_count,
+            limit=limit,
+            offset=offset,
+            sort=sort,
+            estimated=count == "estimated",
+            documents=True,
+            **filters,
+        )
+        base_url = str(router.prefix or "")
+        next_offset = offset + limit if offset + limit < total else None
+        prev_offset = offset - limit if offset - limit >= 0 else None
+        next_url = f"{base_url}/?limit={limit}&offset={next_offset}" if next_offset is not None else None
+        prev_url = f"{base_url}/?limit={limit}&offset={prev_offset}" if prev_offset is not None else None
+        response = book_list_response({
+            "count": total,
+            "next": next_url,
+            "previous": prev_url,
+        }, await db.run_sync(fill_documents, rows), etag)
+    await page_cache.set_async(cache_key, response.body)
+    return response
+
+@router.get("/export", response_class=StreamingResponse)
+def export_books(
+    sort: Optional[str] = Query(None),
+    author_year_end: Optional[int] = Query(None),
+    author_year_start: Optional[int] = Query(None),
+    copyright: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None),
+    languages: Optional[str] = Query(None),
+    mime_type: Optional[str] = Query(None),
+    search: Optional[str] = Query(None),
+    topic: Optional[str] = Query(None),
+    etag: str = Depends(check_etag),
 ):
-    total = get_books(
-        db=db,
-        sort=sort,
+    """Every matching book as newline-delimited JSON, one document per line,
+    in the order `/books/` would page through them."""
+    filters = dict(
         author_year_end=author_year_end,
         author_year_start=author_year_start,
         copyright=copyright,
@@ -34,11 +141,44 @@ def list_books(
         mime_type=mime_type,
         search=search,
         topic=topic,
-        count_only=True
     )
-    books = get_books(
-        db=db,
-        sort=sort,
+
+    # The stream outlives the endpoint, so it opens its own session rather
+    # than taking one from a dependency. Each chunk is a whole batch of
+    # lines, which keeps the per-chunk overhead off the hot path.
+    def generate_lines():
+        with SessionLocal() as db:
+            for documents in iter_book_documents(db, sort=sort, **filters):
+                yield "".join(document + "\n" for document in documents).encode()
+
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson", headers={"ETag": etag})
+
+@router.post("/batch", response_model=dict, response_class=BookJSONResponse)
+async def get_book_batch(batch: BookBatchIn, db: EndpointSession = Depends(get_endpoint_db)):
+    """Books for a list of Gutenberg IDs, in request order. IDs without a
+    book get `null` in `results` and are listed in `not_found`."""
+    documents = await db.run_sync(get_book_documents, batch.ids)
+    not_found = [gutenberg_id for gutenberg_id in dict.fromkeys(batch.ids) if gutenberg_id not in documents]
+    return BookJSONResponse(encode_book_list(
+        {"not_found": not_found},
+        [documents.get(gutenberg_id, "null") for gutenberg_id in batch.ids],
+    ))
+
+@router.get("/facets", response_model=dict, response_class=BookJSONResponse)
+async def get_book_facets(
+    author_year_end: Optional[int] = Query(None),
+    author_year_start: Optional[int] = Query(None),
+    copyright: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None),
+    languages: Optional[str] = Query(None),
+    mime_type: Optional[str] = Query(None),
+    search: Optional[str] = Query(None),
+    topic: Optional[str] = Query(None),
+    etag: str = Depends(check_etag),
+    db: EndpointSession = Depends(get_endpoint_db),
+):
+    facets = await db.run_sync(
+        get_facets,
         author_year_end=author_year_end,
         author_year_start=author_year_start,
         copyright=copyright,
@@ -47,53 +187,20 @@ def list_books(
         mime_type=mime_type,
         search=search,
         topic=topic,
-        limit=limit,
-        offset=offset
     )
-    base_url = str(router.prefix or "")
-    next_offset = offset + limit if offset + limit < total else None
-    prev_offset = offset - limit if offset - limit >= 0 else None
-    next_url = f"{base_url}/?limit={limit}&offset={next_offset}" if next_offset is not None else None
-    prev_url = f"{base_url}/?limit={limit}&offset={prev_offset}" if prev_offset is not None else None
-    return {
-        "count": total,
-        "next": next_url,
-        "previous": prev_url,
-        "results": [
-            {
-                "id": book.id,
-                "title": book.title,
-                "authors": [{"name": a.name, "birth_year": a.birth_year, "death_year": a.death_year} for a in book.authors],
-                "summaries": [s.text for s in book.summaries],
-                "translators": [{"name": t.name, "birth_year": t.birth_year, "death_year": t.death_year} for t in book.translators],
-                "subjects": [s.name for s in book.subjects],
-                "bookshelves": [b.name for b in book.bookshelves],
-                "languages": [l.code for l in book.languages],
-                "copyright": book.copyright,
-                "media_type": book.media_type,
-                "formats": {f.mime_type: f.url for f in book.formats},
-                "download_count": book.download_count,
-            }
-            for book in books
-        ]
-    }
+    return BookJSONResponse(facets, headers={"ETag": etag})
 
-@router.get("/{gutenberg_id}", response_model=BookOut)
-def get_book(gutenberg_id: int, db: Session = Depends(get_db)):
-    book = get_book_by_gutenberg_id(db, gutenberg_id)
-    if not book:
+@router.get("/cache/stats", response_model=dict, response_class=BookJSONResponse, include_in_schema=CACHE_STATS_ENABLED)
+def get_cache_stats():
+    if not CACHE_STATS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return page_cache.stats()
+
+@router.get("/{gutenberg_id}", response_model=BookOut, response_class=BookJSONResponse)
+async def get_book(
+    gutenberg_id: int, etag: str = Depends(check_etag), db: EndpointSession = Depends(get_endpoint_db)
+):
+    document = await db.run_sync(get_book_document, gutenberg_id)
+    if document is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    return {
-        "id": book.id,
-        "title": book.title,
-        "authors": [{"name": a.name, "birth_year": a.birth_year, "death_year": a.death_year} for a in book.authors],
-        "summaries": [s.text for s in book.summaries],
-        "translators": [{"name": t.name, "birth_year": t.birth_year, "death_year": t.death_year} for t in book.translators],
-        "subjects": [s.name for s in book.subjects],
-        "bookshelves": [b.name for b in book.bookshelves],
-        "languages": [l.code for l in book.languages],
-        "copyright": book.copyright,
-        "media_type": book.media_type,
-        "formats": {f.mime_type: f.url for f in book.formats},
-        "download_count": book.download_count,
-    } 
\ No newline at end of file
+    return BookJSONResponse(document, headers={"ETag": etag}) 
\ No newline at end of file
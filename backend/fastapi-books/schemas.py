@@ -1,5 +1,8 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# Enough for any saved-books list, small enough to bound one request's work.
+MAX_BATCH_IDS = 5000
 
 class PersonOut(BaseModel):
     name: str
@@ -50,4 +53,7 @@ class BookOut(BaseModel):
     download_count: Optional[int]
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True 
+
+class BookBatchIn(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
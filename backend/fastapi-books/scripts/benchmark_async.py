@@ -0,0 +1,118 @@
+"""
+Compares sync and async session throughput for book lookups under concurrent clients.
+
+Sync clients share a thread pool the size of FastAPI's default (40 workers),
+the way sync endpoints do. Async clients are coroutines on one event loop.
+Run it from the service directory against a loaded catalog:
+
+    python -m scripts.benchmark_async --clients 200 --requests 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from sqlalchemy import func, select
+
+from db import AsyncSessionLocal, SessionLocal, async_engine, engine
+from models import Book
+from services.books import (
+    get_book_by_gutenberg_id,
+    get_book_by_gutenberg_id_async,
+    get_books,
+    get_books_async,
+)
+
+# Each client request is a list page or a single book, in this proportion.
+PAGE_SHARE = 0.5
+PAGE_FILTERS = [{}, {'languages': 'en'}, {'languages': 'fr,de'}, {'copyright': 'false'}, {'sort': 'ascending'}]
+
+
+def make_plan(gutenberg_ids, clients, requests, seed):
+    rng = random.Random(seed)
+    return [
+        [
+            ('page', rng.choice(PAGE_FILTERS)) if rng.random() < PAGE_SHARE else ('book', rng.choice(gutenberg_ids))
+            for _ in range(requests)
+        ]
+        for _ in range(clients)
+    ]
+
+
+def run_sync_client(steps, limit):
+    latencies = []
+    for kind, argument in steps:
+        start = time.perf_counter()
+        with SessionLocal() as db:
+            if kind == 'page':
+                get_books(db, limit=limit, **argument)
+            else:
+                get_book_by_gutenberg_id(db, argument)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_async_client(steps, limit):
+    latencies = []
+    for kind, argument in steps:
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            if kind == 'page':
+                await get_books_async(db, limit=limit, **argument)
+            else:
+                await get_book_by_gutenberg_id_async(db, argument)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_sync(plan, limit, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda steps: run_sync_client(steps, limit), plan))
+    return time.perf_counter() - start, [latency for result in results for latency in result]
+
+
+async def run_async(plan, limit):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_async_client(steps, limit) for steps in plan))
+    elapsed = time.perf_counter() - start
+    await async_engine.dispose()
+    return elapsed, [latency for result in results for latency in result]
+
+
+def report(name, elapsed, latencies):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f'{name:<8}{len(latencies) / elapsed:>12.1f}{quantiles[49] * 1000:>12.1f}'
+        f'{quantiles[94] * 1000:>12.1f}{quantiles[98] * 1000:>12.1f}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--limit', type=int, default=32, help='books per list page')
+    parser.add_argument('--threads', type=int, default=40, help='sync thread pool size')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        gutenberg_ids = db.scalars(select(Book.gutenberg_id).order_by(func.random()).limit(1000)).all()
+    if not gutenberg_ids:
+        sys.exit('The catalog is empty.')
+    plan = make_plan(gutenberg_ids, args.clients, args.requests, args.seed)
+
+    print(f'{args.clients} clients x {args.requests} requests, pool size {engine.pool.size()}')
+    print(f'{"mode":<8}{"req/s":>12}{"p50 ms":>12}{"p95 ms":>12}{"p99 ms":>12}')
+    report('sync', *run_sync(plan, args.limit, args.threads))
+    report('async', *asyncio.run(run_async(plan, args.limit)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares finding list pages with the in-memory catalog index against SQL.
+
+Both paths give the total and one page of book IDs; hydrating the page is the
+same for both and left out. Run it from the service directory against a
+loaded catalog:
+
+    python -m scripts.benchmark_catalog_index --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from db import SessionLocal
+from services.books import get_books
+from services.catalog_index import CatalogIndex
+
+FILTER_SETS = [
+    {},
+    {'languages': 'en'},
+    {'languages': 'fr,de'},
+    {'copyright': 'false'},
+    {'mime_type': 'audio/'},
+    {'author_year_start': 1800, 'author_year_end': 1899},
+    {'languages': 'en', 'copyright': 'false', 'mime_type': 'text/html'},
+]
+SORTS = [None, 'ascending']
+
+
+def time_calls(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=32)
+    parser.add_argument('--offset', type=int, default=0)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    start = time.perf_counter()
+    index = CatalogIndex(db)
+    print(f'Index of {len(index.ids)} books built in {time.perf_counter() - start:.2f} s')
+
+    print(f'{"filters":<64}{"sort":<11}{"SQL ms":>9}{"index ms":>10}{"speedup":>9}')
+    for filters in FILTER_SETS:
+        for sort in SORTS:
+            def sql_page():
+                total, rows = get_books(
+                    db, sort=sort, limit=args.limit, offset=args.offset, with_count=True, documents=True, **filters
+                )
+                return total, [row.id for row in rows]
+
+            def index_page():
+                return index.page(sort, args.limit, args.offset, **filters)
+
+            sql = time_calls(sql_page, args.repeat)
+            memory = time_calls(index_page, args.repeat)
+            label = ', '.join(f'{name}={value}' for name, value in filters.items()) or '(none)'
+            print(f'{label:<64}{sort or "popular":<11}{sql * 1000:>9.2f}{memory * 1000:>10.3f}{sql / memory:>8.1f}x')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
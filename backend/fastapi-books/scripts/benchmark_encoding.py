@@ -0,0 +1,84 @@
+"""
+Times encoding one page of books the old way and the new way.
+
+The old path is what FastAPI does with a `response_model`: validate every book
+against `BookOut`, run the page through `jsonable_encoder`, then encode it
+with the stdlib `json`. The new paths are orjson on the serialized dicts, and
+splicing stored documents. Run it from the service directory against a
+loaded catalog:
+
+    python -m scripts.benchmark_encoding --limit 100 --repeat 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from db import SessionLocal
+from responses import encode_book_list
+from schemas import BookOut
+from services.books import get_books, serialize_book
+
+
+def encode_pydantic(envelope, books):
+    validated = [BookOut.model_validate(book).model_dump() for book in books]
+    content = jsonable_encoder({**envelope, 'results': validated})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+def encode_stdlib(envelope, books):
+    content = jsonable_encoder({**envelope, 'results': books})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+def encode_orjson(envelope, books):
+    return orjson.dumps({**envelope, 'results': books})
+
+
+def encode_documents(envelope, documents):
+    return encode_book_list(envelope, documents)
+
+
+def time_encoder(encode, envelope, page, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(envelope, page)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--limit', type=int, default=100, help='books per page')
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        serialized = [serialize_book(book) for book in get_books(db, limit=args.limit)]
+    envelope = {'count': 70000, 'next': '/books/?limit=100&offset=100', 'previous': None}
+    documents = [orjson.dumps(book).decode() for book in serialized]
+
+    candidates = [
+        ('BookOut + jsonable_encoder + json', encode_pydantic, serialized),
+        ('jsonable_encoder + json', encode_stdlib, serialized),
+        ('orjson', encode_orjson, serialized),
+        ('stored documents', encode_documents, documents),
+    ]
+    baseline = None
+    print(f'{len(serialized)} books per page')
+    print(f'{"encoder":<36}{"p50 ms":>10}{"speedup":>10}')
+    for name, encode, page in candidates:
+        median = time_encoder(encode, envelope, page, args.repeat)
+        baseline = baseline or median
+        print(f'{name:<36}{median * 1000:>10.3f}{baseline / median:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
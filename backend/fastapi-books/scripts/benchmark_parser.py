@@ -0,0 +1,159 @@
+"""
+Times parsing RDF files the old way and the new way, in books per second.
+
+The old path is what `books.utils.get_book` used to do: build the whole tree
+with defusedxml, then search it with a dozen `find`/`findall` calls, each
+formatting its namespaced path again. The new path reads the file once,
+through the same defusedxml parser, into a target that only keeps what the
+book needs. Both must give the same books. Run it from the service directory
+on unpacked RDF files, such as the ones `scripts.synthetic_catalog --rdf`
+writes:
+
+    python -m scripts.benchmark_parser --directory ./catalog_files/rdf --repeat 3
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import defusedxml.ElementTree as parser
+
+from books.utils import NAMESPACES, fix_subtitles, get_book, safe_unicode
+
+RDF_FILE_PATTERN = re.compile(r'^pg(\d+)\.rdf$')
+
+
+def get_book_with_finds(id, xml_file):
+    """The old `get_book`, kept to compare against."""
+    if isinstance(xml_file, bytes):
+        xml_file = io.BytesIO(xml_file)
+    try:
+        document = parser.parse(xml_file)
+    except:
+        raise Exception('The XML file could not be parsed.')
+    book = document.getroot().find('{%(pg)s}ebook' % NAMESPACES)
+
+    result = {
+        'id': int(id), 'title': None, 'authors': [], 'summaries': [], 'translators': [],
+        'type': None, 'subjects': [], 'languages': [], 'formats': {}, 'downloads': None,
+        'bookshelves': [], 'copyright': None,
+    }
+    for key, tag in (('authors', './/{%(dc)s}creator'), ('translators', './/{%(marcrel)s}trl')):
+        for element in book.findall(tag % NAMESPACES):
+            person = {'birth': None, 'death': None}
+            name = element.find('.//{%(pg)s}name' % NAMESPACES)
+            if name is None:
+                continue
+            person['name'] = safe_unicode(name.text, encoding='UTF-8')
+            birth = element.find('.//{%(pg)s}birthdate' % NAMESPACES)
+            if birth is not None:
+                person['birth'] = int(birth.text)
+            death = element.find('.//{%(pg)s}deathdate' % NAMESPACES)
+            if death is not None:
+                person['death'] = int(death.text)
+            result[key] += [person]
+
+    title = book.find('.//{%(dc)s}title' % NAMESPACES)
+    if title is not None:
+        result['title'] = fix_subtitles(safe_unicode(title.text, encoding='UTF-8'))
+
+    subjects = set()
+    for subject in book.findall('.//{%(dc)s}subject' % NAMESPACES):
+        subject_type = subject.find('.//{%(dcam)s}memberOf' % NAMESPACES)
+        if subject_type is None:
+            continue
+        subject_type = subject_type.get('{%(rdf)s}resource' % NAMESPACES)
+        value = subject.find('.//{%(rdf)s}value' % NAMESPACES).text
+        if subject_type in ('%(dc)sLCSH' % NAMESPACES):
+            subjects.add(value)
+    result['subjects'] = sorted(subjects)
+
+    bookshelves = set()
+    for bookshelf in book.findall('.//{%(pg)s}bookshelf' % NAMESPACES):
+        value = bookshelf.find('.//{%(rdf)s}value' % NAMESPACES)
+        if value is not None:
+            bookshelves.add(value.text)
+    result['bookshelves'] = list(bookshelves)
+
+    rights = book.find('.//{%(dc)s}rights' % NAMESPACES)
+    if rights.text.startswith('Public domain in the USA.'):
+        result['copyright'] = False
+    elif rights.text.startswith('Copyrighted.'):
+        result['copyright'] = True
+
+    for file in book.findall('.//{%(pg)s}file' % NAMESPACES):
+        content_type = file.find('{%(dc)s}format//{%(rdf)s}value' % NAMESPACES).text
+        if content_type not in result['formats'] or 'noimages' in result['formats'][content_type]:
+            result['formats'][content_type] = file.get('{%(rdf)s}about' % NAMESPACES)
+
+    book_type = book.find('.//{%(dc)s}type//{%(rdf)s}value' % NAMESPACES)
+    result['type'] = 'Text' if book_type is None else book_type.text
+    result['languages'] = [
+        language.text for language in book.findall('.//{%(dc)s}language//{%(rdf)s}value' % NAMESPACES)
+    ]
+    download_count = book.find('.//{%(pg)s}downloads' % NAMESPACES)
+    if download_count is not None:
+        result['downloads'] = int(download_count.text)
+    result['summaries'] = [summary.text for summary in book.findall('.//{%(pg)s}marc520' % NAMESPACES)]
+    return result
+
+
+def read_rdf_files(directory, limit=None):
+    """`(id, bytes)` for the RDF files under `directory`, read up front so
+    only parsing is timed."""
+    books = []
+    for path, _, file_names in os.walk(directory):
+        for file_name in sorted(file_names):
+            match = RDF_FILE_PATTERN.match(file_name)
+            if match is None:
+                continue
+            with open(os.path.join(path, file_name), 'rb') as rdf_file:
+                books.append((int(match.group(1)), rdf_file.read()))
+            if limit and len(books) == limit:
+                return books
+    return books
+
+
+def time_parser(parse, books, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for id, content in books:
+            parse(id, content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(books) / best
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argument_parser.add_argument('--directory', required=True, help='unpacked RDF files')
+    argument_parser.add_argument('--books', type=int, help='parse only this many files')
+    argument_parser.add_argument('--repeat', type=int, default=3)
+    args = argument_parser.parse_args()
+
+    books = read_rdf_files(args.directory, args.books)
+    if not books:
+        sys.exit(f'No RDF files in {args.directory}.')
+    for id, content in books:
+        old, new = get_book_with_finds(id, content), get_book(id, content)
+        old['bookshelves'].sort()
+        new['bookshelves'].sort()
+        if old != new:
+            sys.exit(f'Book {id} parses differently.')
+
+    candidates = [('tree + find', get_book_with_finds), ('single pass', get_book)]
+    baseline = None
+    print(f'{len(books)} books, {sum(len(content) for _, content in books) // len(books)} bytes each on average')
+    print(f'{"parser":<16}{"books/s":>10}{"speedup":>10}')
+    for name, parse in candidates:
+        rate = time_parser(parse, books, args.repeat)
+        baseline = baseline or rate
+        print(f'{name:<16}{rate:>10.0f}{rate / baseline:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Compares the full-text `search` filter with the substring filter it replaced.
+
+Run it from the service directory against a loaded catalog:
+
+    python -m scripts.benchmark_search --repeat 20 dickens "great expectations"
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from sqlalchemy import func
+
+from db import SessionLocal
+from models import Book
+from services.books import filter_books, filter_search_fulltext, filter_search_substring
+
+DEFAULT_SEARCHES = ['dickens', 'great expectations', 'shakespeare hamlet', 'war', 'tolstoy peace']
+
+
+def time_search(db, filter_search, search, repeat, limit):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        statement = filter_search(filter_books(db.bind.dialect.name), search)
+        db.execute(statement.with_only_columns(func.count())).scalar()
+        db.execute(statement.with_only_columns(Book.id).order_by(
+            Book.download_count.desc(), Book.id.desc()
+        ).limit(limit)).all()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('searches', nargs='*', default=DEFAULT_SEARCHES)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=32)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    print(f'{"search":<32}{"substring p50 ms":>18}{"full-text p50 ms":>18}{"speedup":>10}')
+    for search in args.searches:
+        substring = statistics.median(time_search(db, filter_search_substring, search, args.repeat, args.limit))
+        fulltext = statistics.median(time_search(db, filter_search_fulltext, search, args.repeat, args.limit))
+        print(f'{search:<32}{substring * 1000:>18.1f}{fulltext * 1000:>18.1f}{substring / fulltext:>9.1f}x')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Checks the list queries' plans against stored baselines.
+
+Every filter and sort combination in `PLAN_MATRIX` has its first page query
+run under `EXPLAIN (ANALYZE, BUFFERS)`. Its plan shape, estimated cost and
+buffer count are compared with the baseline file, as is any join that could
+repeat books, and the script exits with status 1 when any of them regressed.
+Run it from the service directory against a disposable database, loading the
+synthetic catalog first:
+
+    python -m scripts.check_query_plans --books 20000 --update   # record baselines
+    python -m scripts.check_query_plans --books 20000            # compare
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from services.books import explain, get_books_statement
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'query_plan_baselines.json')
+
+PLAN_MATRIX = {
+    'all': {},
+    'languages': {'languages': 'en'},
+    'rare language': {'languages': 'eo'},
+    'several languages': {'languages': 'fr,de'},
+    'copyright': {'copyright': 'false'},
+    'ids': {'ids': '11,84,1342,2701'},
+    'mime type': {'mime_type': 'audio/'},
+    'author years': {'author_year_start': 1800, 'author_year_end': 1899},
+    'search': {'search': 'great voyage'},
+    'topic': {'topic': 'children'},
+    'combined': {'languages': 'en', 'copyright': 'false', 'mime_type': 'text/html'},
+}
+SORTS = ['popular', 'ascending', 'descending']
+
+# Cost and buffers may grow by this factor before a combination fails...
+DEFAULT_THRESHOLD = 1.5
+# ...and buffer counts by this many pages, which small catalogs swing by.
+BUFFER_SLACK = 64
+
+
+def get_plan_shape(node, depth=0):
+    """Lines naming each plan node and what it scans, indented by depth."""
+    label = node['Node Type']
+    for key in ('Relation Name', 'Index Name', 'Strategy'):
+        if key in node:
+            label += f' {key.split()[0].lower()}={node[key]}'
+    lines = ['  ' * depth + label]
+    for child in node.get('Plans', []):
+        lines += get_plan_shape(child, depth + 1)
+    return lines
+
+
+JOIN_NODES = {'Nested Loop', 'Hash Join', 'Merge Join'}
+
+
+def scans_books(node):
+    return node.get('Relation Name') == 'books' or any(scans_books(child) for child in node.get('Plans', []))
+
+
+def get_fan_out(node):
+    """Plan nodes that could repeat a book or had to collapse repeats."""
+    problems = []
+    if scans_books(node):
+        if node['Node Type'] in ('Unique', 'Aggregate'):
+            problems.append(node['Node Type'])
+        elif node['Node Type'] in JOIN_NODES:
+            if node.get('Join Type') not in ('Semi', 'Anti') and not node.get('Inner Unique'):
+                problems.append(f'{node["Join Type"]} {node["Node Type"]}')
+    for child in node.get('Plans', []):
+        problems += get_fan_out(child)
+    return problems
+
+
+def measure_plan(db: Session, sort, filters, limit):
+    """The measurements compared for one combination."""
+    statement = get_books_statement(
+        db.bind.dialect.name, sort=sort, limit=limit, offset=0, with_count=True, documents=True, **filters
+    )
+    plan = explain(db, statement, 'ANALYZE, BUFFERS, FORMAT JSON')
+    root = plan[0]['Plan']
+    return {
+        'shape': get_plan_shape(root),
+        'fan_out': get_fan_out(root),
+        'cost': root['Total Cost'],
+        'buffers': root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0),
+        'time': plan[0]['Execution Time'],
+    }
+
+
+def measure_plans(db: Session, limit):
+    """Measurements for every combination, keyed by `<filters> / <sort>`."""
+    return {
+        f'{name} / {sort}': measure_plan(db, sort, filters, limit)
+        for name, filters in PLAN_MATRIX.items()
+        for sort in SORTS
+    }
+
+
+def seq_scans(shape):
+    return {line.strip() for line in shape if line.strip().startswith('Seq Scan')}
+
+
+def compare(baseline, current, threshold):
+    """Reasons the current plan is a regression, if any."""
+    problems = []
+    if current['cost'] > baseline['cost'] * threshold:
+        problems.append(f'cost {baseline["cost"]:.0f} -> {current["cost"]:.0f}')
+    if current['buffers'] > max(baseline['buffers'] * threshold, baseline['buffers'] + BUFFER_SLACK):
+        problems.append(f'buffers {baseline["buffers"]} -> {current["buffers"]}')
+    for scan in sorted(seq_scans(current['shape']) - seq_scans(baseline['shape'])):
+        problems.append(f'new {scan}')
+    for node in sorted(set(current['fan_out']) - set(baseline.get('fan_out', []))):
+        problems.append(f'fan-out at {node}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--baselines', default=BASELINE_PATH)
+    parser.add_argument('--update', action='store_true', help='record the current plans as the baselines')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--limit', type=int, default=32)
+    parser.add_argument('--books', type=int, help='load a synthetic catalog of this many books first')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    if args.books:
+        from scripts.synthetic_catalog import generate_catalog, load_catalog
+        print(f'Loading a synthetic catalog of {args.books} books...')
+        load_catalog(db, generate_catalog(args.books, args.seed))
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as baseline_file:
+            baselines = json.load(baseline_file)
+
+    results = measure_plans(db, args.limit)
+    db.close()
+    regressions = 0
+    for key, current in results.items():
+        if args.update:
+            status = 'recorded'
+        elif key not in baselines:
+            status = 'no baseline'
+        else:
+            problems = compare(baselines[key], current, args.threshold)
+            regressions += bool(problems)
+            status = 'REGRESSED: ' + '; '.join(problems) if problems else 'ok'
+        print(f'{key:<36}{current["cost"]:>12.0f}{current["buffers"]:>9}{current["time"]:>10.2f} ms  {status}')
+
+    if args.update:
+        with open(args.baselines, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f'Baselines written to {args.baselines}')
+    elif regressions:
+        print(f'{regressions} combination(s) regressed.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
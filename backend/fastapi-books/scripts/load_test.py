@@ -0,0 +1,162 @@
+"""
+Replays a weighted mix of book list and detail requests against a running API.
+
+It works with this service and with the Django Gutendex (`--api django`),
+and reports throughput and latency percentiles overall and per request kind.
+With `--record`, each run is appended to a JSON lines file under a label, so
+runs before and after a change can be compared. Load a catalog first (e.g.
+`python -m scripts.synthetic_catalog --books 70000`), then:
+
+    python -m scripts.load_test http://localhost:8000 --duration 30 --concurrency 16
+    python -m scripts.load_test http://localhost:8001 --api django --record runs.jsonl --label before
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# `(weight, name, parameters)`; a parameter given as a list is picked from at
+# random for each request. `page` is a page number, which `PAGE_PARAMETERS`
+# turns into each API's own paging parameters.
+LIST_MIX = [
+    (20, 'list', {}),
+    (15, 'languages', {'languages': ['en', 'fr', 'de', 'fi', 'nl', 'fr,de', 'eo']}),
+    (8, 'copyright', {'copyright': ['false', 'true', 'false,null']}),
+    (6, 'mime type', {'mime_type': ['text/html', 'application/epub', 'audio/']}),
+    (6, 'author years', {'author_year_start': ['1700', '1800'], 'author_year_end': ['1850', '1899', '1950']}),
+    (10, 'search', {'search': ['great', 'voyage', 'love war', 'king queen', 'dickens', 'secret garden']}),
+    (5, 'topic', {'topic': ['children', 'history', 'fiction', 'science']}),
+    (5, 'sorted', {'sort': ['ascending', 'descending'], 'languages': ['en', 'fr']}),
+    (5, 'deep page', {'page': [5, 20, 100]}),
+]
+DETAIL_WEIGHT = 40
+DETAIL_PATHS = {'fastapi': '/books/{id}', 'django': '/books/{id}/'}
+# Django pages by 32 books, so FastAPI is asked for the same books through
+# `limit` and `offset`.
+PAGE_SIZE = 32
+PAGE_PARAMETERS = {
+    'fastapi': lambda page: {'limit': PAGE_SIZE, 'offset': (page - 1) * PAGE_SIZE},
+    'django': lambda page: {'page': page},
+}
+
+
+def make_request_picker(rng, api, max_id):
+    """A function giving the next `(name, path)` to request."""
+    kinds = LIST_MIX + [(DETAIL_WEIGHT, 'detail', None)]
+    weights = [weight for weight, _, _ in kinds]
+
+    def pick():
+        _, name, parameters = rng.choices(kinds, weights)[0]
+        if parameters is None:
+            return name, DETAIL_PATHS[api].format(id=rng.randint(1, max_id))
+        query = {
+            key: rng.choice(value) if isinstance(value, list) else value
+            for key, value in parameters.items()
+        }
+        if 'page' in query:
+            query.update(PAGE_PARAMETERS[api](query.pop('page')))
+        return name, '/books/' + ('?' + urllib.parse.urlencode(query) if query else '')
+
+    return pick
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(timings):
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 2),
+    }
+
+
+def run(base_url, api, duration, concurrency, max_id, seed, timeout):
+    """Timings per request kind and the number of failed requests."""
+    timings = {}
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_number):
+        pick = make_request_picker(random.Random(seed * 1000 + worker_number), api, max_id)
+        while time.perf_counter() < deadline:
+            name, path = pick()
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=timeout) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError) as error:
+                # A missing ID is a normal answer for a detail lookup.
+                if not (isinstance(error, urllib.error.HTTPError) and error.code == 404):
+                    with lock:
+                        errors.append(f'{path}: {error}')
+                    continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                timings.setdefault(name, []).append(elapsed)
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return timings, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('base_url', help='e.g. http://localhost:8000')
+    parser.add_argument('--api', choices=sorted(DETAIL_PATHS), default='fastapi')
+    parser.add_argument('--duration', type=float, default=30, help='seconds (default 30)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of unmeasured requests first (default 3)')
+    parser.add_argument('--max-id', type=int, default=70000, help='highest Gutenberg ID to look up (default 70000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--record', metavar='FILE', help='append the results to this JSON lines file')
+    parser.add_argument('--label', default='', help='name for the recorded run')
+    args = parser.parse_args()
+    base_url = args.base_url.rstrip('/')
+
+    if args.warmup:
+        run(base_url, args.api, args.warmup, args.concurrency, args.max_id, args.seed + 1, args.timeout)
+    timings, errors = run(base_url, args.api, args.duration, args.concurrency, args.max_id, args.seed, args.timeout)
+    every_timing = [timing for kind_timings in timings.values() for timing in kind_timings]
+    if not every_timing:
+        raise SystemExit(f'No request succeeded: {errors[0] if errors else "nothing was sent"}')
+
+    results = {
+        'label': args.label,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'base_url': base_url,
+        'api': args.api,
+        'duration_s': args.duration,
+        'concurrency': args.concurrency,
+        'throughput_rps': round(len(every_timing) / args.duration, 1),
+        'errors': len(errors),
+        'overall': summarize(every_timing),
+        'kinds': {name: summarize(kind_timings) for name, kind_timings in sorted(timings.items())},
+    }
+
+    print(f'{results["throughput_rps"]} requests/s, {len(errors)} errors')
+    print(f'{"kind":<16}{"requests":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for name, summary in [('overall', results['overall']), *results['kinds'].items()]:
+        print(f'{name:<16}{summary["requests"]:>10}{summary["p50_ms"]:>10}{summary["p95_ms"]:>10}{summary["p99_ms"]:>10}')
+    for error in errors[:5]:
+        print('  error:', error)
+
+    if args.record:
+        with open(args.record, 'a') as record_file:
+            record_file.write(json.dumps(results) + '\n')
+
+
+if __name__ == '__main__':
+    main()
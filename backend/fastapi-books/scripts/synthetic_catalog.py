@@ -0,0 +1,265 @@
+"""
+Replaces the database's catalog with a synthetic one, or writes it as RDF files.
+
+The catalog is deterministic for a given size, shape and seed, so plans and
+timings taken on it can be compared between runs. Run it from the service
+directory against a migrated, disposable database, or write the RDF files
+that `update_catalog` reads with `books.utils.get_book`:
+
+    python -m scripts.synthetic_catalog --books 70000 --language-skew 1.5
+    python -m scripts.synthetic_catalog --books 5000 --rdf ./catalog_files/rdf
+"""
+import argparse
+import os
+import random
+import sys
+from xml.etree import ElementTree
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+import models
+from books.utils import NAMESPACES
+from db import SessionLocal
+from services.books import SEARCH_CONFIG, refresh_book_documents, refresh_facet_counts
+from services.catalog import bump_catalog_version
+
+# Roughly the real catalog's mix: mostly English, then a long tail.
+LANGUAGE_WEIGHTS = {
+    'en': 0.72, 'fr': 0.055, 'fi': 0.045, 'de': 0.035, 'nl': 0.018, 'it': 0.016,
+    'es': 0.014, 'pt': 0.01, 'zh': 0.008, 'sv': 0.004, 'la': 0.003, 'eo': 0.002,
+}
+MIME_TYPES = [
+    'text/html', 'text/plain; charset=us-ascii', 'text/plain; charset=utf-8', 'application/epub+zip',
+    'application/x-mobipocket-ebook', 'application/rdf+xml', 'image/jpeg', 'application/zip', 'audio/mpeg',
+]
+WORDS = (
+    'adventure history love war peace sea island mystery journey king queen city river night '
+    'garden letters life death poems stories travels memoirs science nature children house '
+    'great little old new lost secret voyage world winter summer'
+).split()
+SURNAMES = (
+    'Smith Dickens Austen Twain Tolstoy Hugo Verne Doyle Shelley Poe Wilde Bronte Eliot Hardy '
+    'Kipling Stevenson Melville Dumas Goethe Chekhov Balzac Zola Scott Defoe Swift Milton'
+).split()
+BATCH_SIZE = 5000
+
+
+def generate_catalog(books, seed=0, language_skew=1.0, books_per_author=3.0, download_alpha=1.2):
+    """Rows for every catalog table, keyed by table name.
+
+    `language_skew` raises the languages' weights to that power: 0 spreads
+    books evenly over them and anything above 1 favors English further.
+    `books_per_author` sets how many people there are for the catalog's size,
+    and `download_alpha` is the shape of the Pareto distribution download
+    counts follow; the lower it is, the longer their tail.
+    """
+    rng = random.Random(seed)
+    languages = list(LANGUAGE_WEIGHTS)
+    language_weights = [weight ** language_skew for weight in LANGUAGE_WEIGHTS.values()]
+    catalog = {
+        'languages': [{'id': i + 1, 'code': code} for i, code in enumerate(languages)],
+        'persons': [],
+        'bookshelves': [{'id': i + 1, 'name': f'{rng.choice(WORDS).title()} Shelf {i + 1}'} for i in range(300)],
+        'subjects': [
+            {'id': i + 1, 'name': f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} -- Fiction'} for i in range(5000)
+        ],
+        'books': [], 'formats': [], 'summaries': [],
+        'book_author': [], 'book_translator': [], 'book_bookshelf': [], 'book_language': [], 'book_subject': [],
+    }
+    for person_id in range(1, int(books / books_per_author) + 2):
+        birth_year = rng.randint(1400, 1950) if rng.random() < 0.85 else None
+        catalog['persons'].append({
+            'id': person_id,
+            'name': f'{rng.choice(SURNAMES)}, {rng.choice(WORDS).title()} {person_id}',
+            'birth_year': birth_year,
+            'death_year': birth_year + rng.randint(20, 90) if birth_year and rng.random() < 0.9 else None,
+        })
+    person_count = len(catalog['persons'])
+
+    format_id = summary_id = 0
+    for book_id in range(1, books + 1):
+        catalog['books'].append({
+            'id': book_id,
+            'gutenberg_id': book_id,
+            'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).title(),
+            'copyright': rng.choice([False] * 8 + [True, None]),
+            # Heavy-tailed, like real download counts.
+            'download_count': int(rng.paretovariate(download_alpha)) - 1,
+            'media_type': 'Text' if rng.random() < 0.97 else 'Sound',
+        })
+        # Popular authors write many books.
+        for person_id in {int(rng.paretovariate(1.1)) % person_count + 1 for _ in range(rng.choice([1, 1, 1, 2]))}:
+            catalog['book_author'].append({'book_id': book_id, 'person_id': person_id})
+        if rng.random() < 0.1:
+            catalog['book_translator'].append({'book_id': book_id, 'person_id': rng.randint(1, person_count)})
+        for bookshelf_id in rng.sample(range(1, 301), rng.choice([0, 1, 1, 2])):
+            catalog['book_bookshelf'].append({'book_id': book_id, 'bookshelf_id': bookshelf_id})
+        language_id = rng.choices(range(1, len(languages) + 1), weights=language_weights)[0]
+        catalog['book_language'].append({'book_id': book_id, 'language_id': language_id})
+        for subject_id in rng.sample(range(1, 5001), rng.randint(1, 4)):
+            catalog['book_subject'].append({'book_id': book_id, 'subject_id': subject_id})
+        for mime_type in rng.sample(MIME_TYPES[:8], rng.randint(3, 8)):
+            format_id += 1
+            catalog['formats'].append({
+                'id': format_id, 'book_id': book_id, 'mime_type': mime_type, 'url': f'https://example.org/{book_id}/{format_id}',
+            })
+        if rng.random() < 0.6:
+            summary_id += 1
+            catalog['summaries'].append({'id': summary_id, 'book_id': book_id, 'text': f'A summary of book {book_id}.'})
+    return catalog
+
+
+COPYRIGHT_RIGHTS = {
+    False: 'Public domain in the USA.',
+    True: 'Copyrighted. Read the copyright notice.',
+    None: 'None',
+}
+
+
+def build_rdf(book, related):
+    """The Project Gutenberg RDF document of one generated book."""
+    def add(parent, tag, text=None, **attributes):
+        prefix, name = tag.split(':')
+        element = ElementTree.SubElement(parent, f'{{{NAMESPACES[prefix]}}}{name}', {
+            f'{{{NAMESPACES["rdf"]}}}{key}': value for key, value in attributes.items()
+        })
+        element.text = text
+        return element
+
+    def add_value(parent, tag, value):
+        add(add(add(parent, tag), 'rdf:Description'), 'rdf:value', value)
+
+    def add_person(tag, person):
+        agent = add(add(ebook, tag), 'pg:agent')
+        add(agent, 'pg:name', person['name'])
+        if person['birth_year'] is not None:
+            add(agent, 'pg:birthdate', str(person['birth_year']))
+        if person['death_year'] is not None:
+            add(agent, 'pg:deathdate', str(person['death_year']))
+
+    root = ElementTree.Element(f'{{{NAMESPACES["rdf"]}}}RDF')
+    ebook = add(root, 'pg:ebook', about=f'ebooks/{book["gutenberg_id"]}')
+    book_id = book['id']
+
+    add(ebook, 'dc:title', book['title'])
+    for person in related['authors'].get(book_id, []):
+        add_person('dc:creator', person)
+    for person in related['translators'].get(book_id, []):
+        add_person('marcrel:trl', person)
+    add(ebook, 'dc:rights', COPYRIGHT_RIGHTS[book['copyright']])
+    add(ebook, 'pg:downloads', str(book['download_count']))
+    add_value(ebook, 'dc:type', book['media_type'])
+    for language in related['languages'].get(book_id, []):
+        add_value(ebook, 'dc:language', language['code'])
+    for subject in related['subjects'].get(book_id, []):
+        description = add(add(ebook, 'dc:subject'), 'rdf:Description')
+        add(description, 'dcam:memberOf', resource=f'{NAMESPACES["dc"]}LCSH')
+        add(description, 'rdf:value', subject['name'])
+    for bookshelf in related['bookshelves'].get(book_id, []):
+        add_value(ebook, 'pg:bookshelf', bookshelf['name'])
+    for summary in related['summaries'].get(book_id, []):
+        add(ebook, 'pg:marc520', summary['text'])
+    for format_ in related['formats'].get(book_id, []):
+        file_element = add(add(ebook, 'dc:hasFormat'), 'pg:file', about=format_['url'])
+        add_value(file_element, 'dc:format', format_['mime_type'])
+
+    return ElementTree.tostring(root, encoding='utf-8', xml_declaration=True)
+
+
+def write_rdf_files(catalog, directory):
+    """Write every generated book as `<directory>/<id>/pg<id>.rdf`, the layout
+    of the unpacked Project Gutenberg catalog that `update_catalog` reads."""
+    for prefix, uri in NAMESPACES.items():
+        ElementTree.register_namespace(prefix, uri)
+
+    def group(links, table, column):
+        rows = {row['id']: row for row in catalog[table]}
+        grouped = {}
+        for link in links:
+            grouped.setdefault(link['book_id'], []).append(rows[link[column]])
+        return grouped
+
+    related = {
+        'authors': group(catalog['book_author'], 'persons', 'person_id'),
+        'translators': group(catalog['book_translator'], 'persons', 'person_id'),
+        'languages': group(catalog['book_language'], 'languages', 'language_id'),
+        'subjects': group(catalog['book_subject'], 'subjects', 'subject_id'),
+        'bookshelves': group(catalog['book_bookshelf'], 'bookshelves', 'bookshelf_id'),
+        'summaries': {},
+        'formats': {},
+    }
+    for name in ('summaries', 'formats'):
+        for row in catalog[name]:
+            related[name].setdefault(row['book_id'], []).append(row)
+
+    for book in catalog['books']:
+        book_directory = os.path.join(directory, str(book['gutenberg_id']))
+        os.makedirs(book_directory, exist_ok=True)
+        with open(os.path.join(book_directory, f'pg{book["gutenberg_id"]}.rdf'), 'wb') as rdf_file:
+            rdf_file.write(build_rdf(book, related))
+
+
+def load_catalog(db: Session, catalog, documents=True):
+    """Replace every catalog table's rows with the given ones."""
+    tables = [table for table in models.Base.metadata.sorted_tables if table.name in catalog]
+    db.execute(text('TRUNCATE ' + ', '.join(table.name for table in tables) + ' RESTART IDENTITY CASCADE'))
+    for table in tables:
+        rows = catalog[table.name]
+        for start in range(0, len(rows), BATCH_SIZE):
+            db.execute(insert(table), rows[start:start + BATCH_SIZE])
+        if 'id' in table.c and rows:
+            db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), {len(rows)})"))
+
+    # The same text `get_search_vector` indexes, built for every book at once.
+    author_names = (
+        select(func.string_agg(models.Person.name, ' '))
+        .join(models.book_author, models.book_author.c.person_id == models.Person.id)
+        .where(models.book_author.c.book_id == models.Book.id)
+        .scalar_subquery()
+    )
+    db.execute(update(models.Book).values(search_vector=func.to_tsvector(
+        SEARCH_CONFIG, func.concat_ws(' ', func.coalesce(models.Book.title, ''), author_names)
+    )))
+    db.commit()
+    if documents:
+        refresh_book_documents(db)
+    refresh_facet_counts(db)
+    db.execute(text('ANALYZE'))
+    db.commit()
+    bump_catalog_version()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=70000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--language-skew', type=float, default=1.0,
+                        help='0 for evenly spread languages, above 1 for more English (default 1)')
+    parser.add_argument('--books-per-author', type=float, default=3.0)
+    parser.add_argument('--download-alpha', type=float, default=1.2,
+                        help='Pareto shape of download counts; lower means a longer tail (default 1.2)')
+    parser.add_argument('--rdf', metavar='DIRECTORY', help='write RDF files here instead of loading the database')
+    parser.add_argument('--no-documents', action='store_true', help="don't write book documents")
+    args = parser.parse_args()
+
+    catalog = generate_catalog(
+        args.books,
+        args.seed,
+        language_skew=args.language_skew,
+        books_per_author=args.books_per_author,
+        download_alpha=args.download_alpha,
+    )
+    if args.rdf:
+        write_rdf_files(catalog, args.rdf)
+        print(f'Wrote {len(catalog["books"])} RDF files to {args.rdf}.')
+        return
+    db = SessionLocal()
+    load_catalog(db, catalog, documents=not args.no_documents)
+    db.close()
+    print(f'Loaded {len(catalog["books"])} books.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,19 @@
+import argparse
 import os
 import shutil
 import urllib.request
 from subprocess import call
 from time import strftime
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 from db import SessionLocal
 import models
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from books.utils import get_book
+from books.utils import get_archive_books, get_book_fingerprint, get_books
+from services.books import get_search_vector, refresh_book_documents, refresh_facet_counts
+from services.bulk_load import bulk_load_books
+from services.catalog import bump_catalog_version
 
 # Configuration
 TEMP_PATH = './catalog_temp'
@@ -27,8 +32,7 @@ def get_directory_set(path):
     return directory_set
 
 
-def put_catalog_in_db():
-    db: Session = SessionLocal()
+def get_catalog_book_paths():
     book_ids = []
     for directory_item in os.listdir(MOVE_TARGET_PATH):
         item_path = os.path.join(MOVE_TARGET_PATH, directory_item)
@@ -40,122 +44,274 @@ def put_catalog_in_db():
             else:
                 book_ids.append(book_id)
     book_ids.sort()
-    book_directories = [str(id) for id in book_ids]
-
-    for directory in book_directories:
-        id = int(directory)
-        print(f'Processing book {id}')
-        book_path = os.path.join(MOVE_TARGET_PATH, directory, f'pg{directory}.rdf')
-        book = get_book(id, book_path)
-        try:
-            # Book
-            book_in_db = db.query(models.Book).filter_by(gutenberg_id=id).first()
-            if book_in_db:
-                book_in_db.copyright = book['copyright']
-                book_in_db.download_count = book['downloads']
-                book_in_db.media_type = book['type']
-                book_in_db.title = book['title']
+    return [(id, os.path.join(MOVE_TARGET_PATH, str(id), f'pg{id}.rdf')) for id in book_ids]
+
+
+class CatalogChanges:
+    """What a catalog update did to the books in the database."""
+
+    def __init__(self):
+        # Gutenberg IDs of every book in the new catalog, and database IDs of
+        # the ones written.
+        self.book_ids = set()
+        self.written_ids = []
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.failed = 0
+        # The `DimensionMap`s of a book-by-book load, by name.
+        self.dimensions = {}
+
+    def __str__(self):
+        return (
+            f'{self.added} added, {self.changed} changed, {self.unchanged} unchanged, '
+            f'{self.removed} removed, {self.failed} failed'
+        )
+
+
+class DimensionMap:
+    """Keys of a table's rows, like a language's code or a person's name and
+    years, mapped to their IDs for the length of a catalog update. It's filled
+    with one query on the first lookup, so that a run with nothing to write
+    doesn't read the table, and the rows it doesn't have are inserted and
+    added to it, so no lookup after that costs a query."""
+
+    def __init__(self, db: Session, model, key_columns):
+        self.db = db
+        self.model = model
+        self.key_columns = key_columns
+        self.ids = None
+        # Keys inserted since the last commit, forgotten if it's rolled back.
+        self.uncommitted = []
+        self.preloaded = 0
+        self.hits = 0
+        self.created = 0
+
+    def get_id(self, *key):
+        if self.ids is None:
+            columns = [getattr(self.model, column) for column in self.key_columns]
+            self.ids = {}
+            for id, *row_key in self.db.execute(select(self.model.id, *columns).order_by(self.model.id)):
+                self.ids.setdefault(tuple(row_key), id)
+            self.preloaded = len(self.ids)
+
+        id = self.ids.get(key)
+        if id is None:
+            id = self.db.scalar(
+                insert(self.model).values(dict(zip(self.key_columns, key))).returning(self.model.id)
+            )
+            self.ids[key] = id
+            self.uncommitted.append(key)
+            self.created += 1
+        else:
+            self.hits += 1
+        return id
+
+    def commit(self):
+        self.uncommitted.clear()
+
+    def rollback(self):
+        for key in self.uncommitted:
+            del self.ids[key]
+        self.uncommitted.clear()
+
+    def __str__(self):
+        lookups = self.hits + self.created
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        return (
+            f'{self.preloaded} preloaded, {lookups} lookups, {self.hits} hits ({hit_rate:.1f}%), '
+            f'{self.created} created'
+        )
+
+
+def get_dimension_maps(db: Session):
+    return {
+        'people': DimensionMap(db, models.Person, ['name', 'birth_year', 'death_year']),
+        'bookshelves': DimensionMap(db, models.Bookshelf, ['name']),
+        'languages': DimensionMap(db, models.Language, ['code']),
+        'subjects': DimensionMap(db, models.Subject, ['name']),
+    }
+
+
+def set_links(db: Session, table, column, book_id, ids):
+    """Replace a book's rows in an association table without loading them.
+    A repeated ID would link the book twice, which the table's key rejects."""
+    db.execute(delete(table).where(table.c.book_id == book_id))
+    if ids:
+        db.execute(insert(table), [{'book_id': book_id, column: id} for id in dict.fromkeys(ids)])
+
+
+def get_changed_books(book_files, fingerprints, changes, workers=None, full=False):
+    """Parse the given RDF files and yield `(id, book, fingerprint)` for each
+    book whose fingerprint doesn't match the stored one, or for every book if
+    `full` is set, counting the others as unchanged."""
+    # RDF files are parsed in worker processes, a few chunks ahead of the
+    # database writes, which still go in the given order.
+    for id, book in get_books(book_files, workers=workers):
+        changes.book_ids.add(id)
+        fingerprint = get_book_fingerprint(book)
+        if fingerprints.get(id) == fingerprint and not full:
+            changes.unchanged += 1
+        else:
+            yield id, book, fingerprint
+
+
+def put_catalog_in_db(workers=None, book_files=None, full=False, bulk=False):
+    """Put the given `(id, path or bytes)` RDF files in the database, or every
+    one in the catalog directory, and return the `CatalogChanges`. Books whose
+    fingerprint matches the stored one are skipped unless `full` is set. With
+    `bulk`, the books are written together by `bulk_load_books` instead of
+    one at a time."""
+    db: Session = SessionLocal()
+    if book_files is None:
+        book_files = get_catalog_book_paths()
+    changes = CatalogChanges()
+    fingerprints = dict(db.execute(select(models.Book.gutenberg_id, models.Book.fingerprint)).all())
+    books = get_changed_books(book_files, fingerprints, changes, workers=workers, full=full)
+
+    if bulk:
+        for id, book_id in bulk_load_books(db, books):
+            if id in fingerprints:
+                changes.changed += 1
             else:
-                book_in_db = models.Book(
-                    gutenberg_id=id,
-                    copyright=book['copyright'],
-                    download_count=book['downloads'],
-                    media_type=book['type'],
-                    title=book['title']
-                )
-                db.add(book_in_db)
-                db.flush()
-            # Authors
-            authors = []
-            for author in book['authors']:
-                person = db.query(models.Person).filter_by(
-                    name=author['name'],
-                    birth_year=author['birth'],
-                    death_year=author['death']
-                ).first()
-                if not person:
-                    person = models.Person(
-                        name=author['name'],
-                        birth_year=author['birth'],
-                        death_year=author['death']
-                    )
-                    db.add(person)
-                    db.flush()
-                authors.append(person)
-            book_in_db.authors = authors
-            # Translators
-            translators = []
-            for translator in book['translators']:
-                person = db.query(models.Person).filter_by(
-                    name=translator['name'],
-                    birth_year=translator['birth'],
-                    death_year=translator['death']
-                ).first()
-                if not person:
-                    person = models.Person(
-                        name=translator['name'],
-                        birth_year=translator['birth'],
-                        death_year=translator['death']
+                changes.added += 1
+            changes.written_ids.append(book_id)
+    else:
+        # Every person, bookshelf, language and subject is looked up here, so
+        # only new ones cost a query.
+        dimensions = changes.dimensions = get_dimension_maps(db)
+        for id, book, fingerprint in books:
+            print(f'Processing book {id}')
+            try:
+                # Book
+                book_in_db = db.query(models.Book).filter_by(gutenberg_id=id).first()
+                if book_in_db:
+                    book_in_db.copyright = book['copyright']
+                    book_in_db.download_count = book['downloads']
+                    book_in_db.media_type = book['type']
+                    book_in_db.title = book['title']
+                else:
+                    book_in_db = models.Book(
+                        gutenberg_id=id,
+                        copyright=book['copyright'],
+                        download_count=book['downloads'],
+                        media_type=book['type'],
+                        title=book['title']
                     )
-                    db.add(person)
-                    db.flush()
-                translators.append(person)
-            book_in_db.translators = translators
-            # Bookshelves
-            bookshelves = []
-            for shelf in book['bookshelves']:
-                shelf_in_db = db.query(models.Bookshelf).filter_by(name=shelf).first()
-                if not shelf_in_db:
-                    shelf_in_db = models.Bookshelf(name=shelf)
-                    db.add(shelf_in_db)
-                    db.flush()
-                bookshelves.append(shelf_in_db)
-            book_in_db.bookshelves = bookshelves
-            # Formats
-            db.query(models.Format).filter_by(book_id=book_in_db.id).delete()
-            for mime_type, url in book['formats'].items():
-                format_in_db = models.Format(
-                    book=book_in_db,
-                    mime_type=mime_type,
-                    url=url
-                )
-                db.add(format_in_db)
-            # Languages
-            languages = []
-            for language in book['languages']:
-                language_in_db = db.query(models.Language).filter_by(code=language).first()
-                if not language_in_db:
-                    language_in_db = models.Language(code=language)
-                    db.add(language_in_db)
+                    db.add(book_in_db)
                     db.flush()
-                languages.append(language_in_db)
-            book_in_db.languages = languages
-            # Subjects
-            subjects = []
-            for subject in book['subjects']:
-                subject_in_db = db.query(models.Subject).filter_by(name=subject).first()
-                if not subject_in_db:
-                    subject_in_db = models.Subject(name=subject)
-                    db.add(subject_in_db)
-                    db.flush()
-                subjects.append(subject_in_db)
-            book_in_db.subjects = subjects
-            # Summaries
-            db.query(models.Summary).filter_by(book_id=book_in_db.id).delete()
-            for summary in book['summaries']:
-                summary_in_db = models.Summary(
-                    book=book_in_db,
-                    text=summary
+                # Authors
+                author_ids = [
+                    dimensions['people'].get_id(author['name'], author['birth'], author['death'])
+                    for author in book['authors']
+                ]
+                set_links(db, models.book_author, 'person_id', book_in_db.id, author_ids)
+                book_in_db.search_vector = get_search_vector(
+                    book['title'], [author['name'] for author in book['authors']]
                 )
-                db.add(summary_in_db)
-            db.commit()
-        except Exception as error:
-            print(f'Error while putting book {id} in the database:', error)
-            db.rollback()
+                # Translators
+                translator_ids = [
+                    dimensions['people'].get_id(translator['name'], translator['birth'], translator['death'])
+                    for translator in book['translators']
+                ]
+                set_links(db, models.book_translator, 'person_id', book_in_db.id, translator_ids)
+                # Bookshelves
+                bookshelf_ids = [dimensions['bookshelves'].get_id(shelf) for shelf in book['bookshelves']]
+                set_links(db, models.book_bookshelf, 'bookshelf_id', book_in_db.id, bookshelf_ids)
+                # Formats
+                db.query(models.Format).filter_by(book_id=book_in_db.id).delete()
+                for mime_type, url in book['formats'].items():
+                    format_in_db = models.Format(
+                        book=book_in_db,
+                        mime_type=mime_type,
+                        url=url
+                    )
+                    db.add(format_in_db)
+                # Languages
+                language_ids = [dimensions['languages'].get_id(language) for language in book['languages']]
+                set_links(db, models.book_language, 'language_id', book_in_db.id, language_ids)
+                # Subjects
+                subject_ids = [dimensions['subjects'].get_id(subject) for subject in book['subjects']]
+                set_links(db, models.book_subject, 'subject_id', book_in_db.id, subject_ids)
+                # Summaries
+                db.query(models.Summary).filter_by(book_id=book_in_db.id).delete()
+                for summary in book['summaries']:
+                    summary_in_db = models.Summary(
+                        book=book_in_db,
+                        text=summary
+                    )
+                    db.add(summary_in_db)
+                # Stored with the rest of the book, so a book that fails is
+                # written again next time.
+                book_in_db.fingerprint = fingerprint
+                db.commit()
+            except Exception as error:
+                print(f'Error while putting book {id} in the database:', error)
+                db.rollback()
+                for dimension_map in dimensions.values():
+                    dimension_map.rollback()
+                changes.failed += 1
+            else:
+                for dimension_map in dimensions.values():
+                    dimension_map.commit()
+                if id in fingerprints:
+                    changes.changed += 1
+                else:
+                    changes.added += 1
+                changes.written_ids.append(book_in_db.id)
+
+    print('Writing book documents...')
+    refresh_book_documents(db, changes.written_ids)
+    print('Counting facets...')
+    refresh_facet_counts(db)
+    db.close()
+    return changes
+
+
+def delete_books(db: Session, gutenberg_ids):
+    """Delete books with their formats, summaries and associations, which
+    nothing deletes along with them."""
+    book_ids = select(models.Book.id).where(models.Book.gutenberg_id.in_(gutenberg_ids))
+    for table in (
+        models.book_author, models.book_translator, models.book_bookshelf, models.book_language,
+        models.book_subject, models.Format.__table__, models.Summary.__table__,
+    ):
+        db.execute(delete(table).where(table.c.book_id.in_(book_ids)))
+    db.execute(delete(models.Book).where(models.Book.gutenberg_id.in_(gutenberg_ids)))
+    db.commit()
+
+
+def remove_stale_books(changes, rdf_directory=None):
+    """Delete the books that weren't in the new catalog, along with their
+    directories in `rdf_directory` if there is one."""
+    db = SessionLocal()
+    stale_ids = set(db.scalars(select(models.Book.gutenberg_id))) - changes.book_ids
+    changes.removed += len(stale_ids)
+    if stale_ids:
+        delete_books(db, stale_ids)
+        # The counts were taken with the stale books still in.
+        refresh_facet_counts(db)
     db.close()
+    if rdf_directory is not None:
+        for directory in get_directory_set(rdf_directory):
+            if directory.isdigit() and int(directory) not in changes.book_ids:
+                shutil.rmtree(os.path.join(rdf_directory, directory))
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Replaces the catalog with the latest Project Gutenberg one.')
+    parser.add_argument('--workers', type=int, help='processes parsing RDF files (default: one per CPU)')
+    parser.add_argument('--full', action='store_true',
+                        help='rewrite every book, even those whose RDF record is unchanged')
+    parser.add_argument('--bulk', action='store_true',
+                        help='write the books with a few set-based statements in one transaction instead of one by one')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the RDF files straight from the downloaded archive instead of extracting it')
+    parser.add_argument('--keep-rdf', action='store_true',
+                        help='with --stream, also write the RDF files to the catalog directory')
+    args = parser.parse_args()
+
     print('Making temporary directory...')
     if os.path.exists(TEMP_PATH):
         shutil.rmtree(TEMP_PATH)
@@ -164,42 +320,73 @@ def main():
     print('Downloading compressed catalog...')
     urllib.request.urlretrieve(URL, DOWNLOAD_PATH)
 
-    print('Decompressing catalog...')
-    with open(os.devnull, 'w') as null:
-        call(['tar', 'fjvx', DOWNLOAD_PATH, '-C', TEMP_PATH], stdout=null, stderr=null)
-
-    print('Detecting stale directories...')
-    if not os.path.exists(MOVE_TARGET_PATH):
-        os.makedirs(MOVE_TARGET_PATH)
-    new_directory_set = get_directory_set(MOVE_SOURCE_PATH)
-    old_directory_set = get_directory_set(MOVE_TARGET_PATH)
-    stale_directory_set = old_directory_set - new_directory_set
-
-    print('Removing stale directories and books...')
-    for directory in stale_directory_set:
-        try:
-            book_id = int(directory)
-        except ValueError:
-            continue
-        db = SessionLocal()
-        db.query(models.Book).filter_by(gutenberg_id=book_id).delete()
-        db.commit()
-        db.close()
-        path = os.path.join(MOVE_TARGET_PATH, directory)
-        shutil.rmtree(path)
-
-    print('Replacing old catalog files...')
-    with open(os.devnull, 'w') as null:
-        call([
-            'rsync',
-            '-va',
-            '--delete-after',
-            MOVE_SOURCE_PATH + '/',
-            MOVE_TARGET_PATH
-        ], stdout=null, stderr=null)
-
-    print('Putting the catalog in the database...')
-    put_catalog_in_db()
+    # Set before the first write to the database, so that a run that fails
+    # after committing some books still stamps a new version.
+    catalog_changed = False
+    try:
+        if args.stream:
+            # Each RDF file goes from the archive to the parser without touching
+            # the disk, unless the files are to be kept.
+            rdf_directory = MOVE_TARGET_PATH if args.keep_rdf else None
+            if rdf_directory and not os.path.exists(rdf_directory):
+                os.makedirs(rdf_directory)
+
+            print('Putting the catalog in the database from the archive...')
+            catalog_changed = True
+            changes = put_catalog_in_db(
+                workers=args.workers, book_files=get_archive_books(DOWNLOAD_PATH, rdf_directory), full=args.full,
+                bulk=args.bulk
+            )
+
+            print('Removing stale books...')
+            remove_stale_books(changes, rdf_directory)
+        else:
+            print('Decompressing catalog...')
+            with open(os.devnull, 'w') as null:
+                call(['tar', 'fjvx', DOWNLOAD_PATH, '-C', TEMP_PATH], stdout=null, stderr=null)
+
+            print('Detecting stale directories...')
+            if not os.path.exists(MOVE_TARGET_PATH):
+                os.makedirs(MOVE_TARGET_PATH)
+            new_directory_set = get_directory_set(MOVE_SOURCE_PATH)
+            old_directory_set = get_directory_set(MOVE_TARGET_PATH)
+            stale_directory_set = old_directory_set - new_directory_set
+
+            print('Removing stale directories and books...')
+            catalog_changed = True
+            removed = 0
+            for directory in stale_directory_set:
+                try:
+                    book_id = int(directory)
+                except ValueError:
+                    continue
+                db = SessionLocal()
+                delete_books(db, [book_id])
+                db.close()
+                removed += 1
+                path = os.path.join(MOVE_TARGET_PATH, directory)
+                shutil.rmtree(path)
+
+            print('Replacing old catalog files...')
+            with open(os.devnull, 'w') as null:
+                call([
+                    'rsync',
+                    '-va',
+                    '--delete-after',
+                    MOVE_SOURCE_PATH + '/',
+                    MOVE_TARGET_PATH
+                ], stdout=null, stderr=null)
+
+            print('Putting the catalog in the database...')
+            changes = put_catalog_in_db(workers=args.workers, full=args.full, bulk=args.bulk)
+            changes.removed = removed
+
+        print(f'Books: {changes}')
+        for name, dimension_map in changes.dimensions.items():
+            print(f'{name.capitalize()}: {dimension_map}')
+    finally:
+        if catalog_changed:
+            bump_catalog_version()
 
     print('Removing temporary files...')
     shutil.rmtree(TEMP_PATH)
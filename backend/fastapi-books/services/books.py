@@ -1,11 +1,112 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, not_
-from typing import List, Optional
-from models import Book, Person, Bookshelf, Language, Subject, Format
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
 
-def get_books(
-    db: Session,
-    sort: Optional[str] = None,
+import orjson
+
+from sqlalchemy.engine import Result
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.sql import ClauseElement, Executable, Select
+from sqlalchemy import ARRAY, Integer, String, any_, bindparam, case, cast, delete, literal, or_, and_, not_, tuple_, func, insert, select, union_all
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+from models import (
+    Book, BookDocument, FacetCount, Person, Bookshelf, Language, Subject, Format,
+    book_bookshelf, book_language, book_subject,
+)
+from services.cache import ResultCache, make_cache_backend
+from services.catalog import get_catalog_version
+
+# 'simple' neither stems nor drops stop words, which keeps full-text matches
+# close to the substring search it replaces across the catalog's languages.
+SEARCH_CONFIG = 'simple'
+SEARCH_WORD_PATTERN = re.compile(r'\w+')
+
+# Every relationship a serialized book touches. Each one is loaded with a
+# single `SELECT ... WHERE book_id IN (...)` per page instead of one lazy load
+# per book, so a page costs a constant number of queries whatever its size.
+BOOK_RELATIONS = (
+    selectinload(Book.authors),
+    selectinload(Book.translators),
+    selectinload(Book.subjects),
+    selectinload(Book.bookshelves),
+    selectinload(Book.languages),
+    selectinload(Book.formats),
+    selectinload(Book.summaries),
+)
+
+def get_sort_columns(sort: Optional[str]) -> Tuple[tuple, bool]:
+    """Columns of the active sort, most significant first, and its direction.
+
+    `id` always closes the tuple so that the ordering is total, which keyset
+    pagination depends on.
+    """
+    if sort == 'ascending':
+        return (Book.id,), False
+    if sort == 'descending':
+        return (Book.id,), True
+    return (Book.download_count, Book.id), True
+
+def encode_cursor(book: Book, sort: Optional[str], backwards: bool = False) -> str:
+    columns, _ = get_sort_columns(sort)
+    payload = {'k': [getattr(book, column.key) for column in columns], 'b': backwards}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+def decode_cursor(cursor: str, sort: Optional[str]) -> Tuple[list, bool]:
+    """Return the `(position, backwards)` pair a cursor stands for.
+
+    Raises `ValueError` for anything that was not produced by `encode_cursor`
+    for the same sort.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        position, backwards = payload['k'], payload['b']
+    except Exception:
+        raise ValueError('Invalid cursor')
+    columns, _ = get_sort_columns(sort)
+    if not isinstance(position, list) or len(position) != len(columns):
+        raise ValueError('Invalid cursor')
+    if not all(isinstance(value, int) for value in position):
+        raise ValueError('Invalid cursor')
+    return position, bool(backwards)
+
+def get_search_query(search: str) -> Optional[str]:
+    """Turn a `search` parameter into a `to_tsquery` string in which every
+    word must match the start of a title or author-name word."""
+    words = []
+    for term in search.split(' ')[:32]:
+        words += SEARCH_WORD_PATTERN.findall(term.lower())
+    if not words:
+        return None
+    return ' & '.join(f'{word}:*' for word in words)
+
+def get_search_vector(title: Optional[str], author_names: Sequence[str]):
+    return func.to_tsvector(SEARCH_CONFIG, ' '.join([title or '', *author_names]))
+
+def filter_search_fulltext(statement: Select, search: str) -> Select:
+    search_query = get_search_query(search)
+    if search_query is None:
+        return statement
+    return statement.where(
+        Book.search_vector.op('@@')(func.to_tsquery(SEARCH_CONFIG, search_query))
+    )
+
+def filter_search_substring(statement: Select, search: str) -> Select:
+    # Two unindexable `ilike`s per term; used where there is no full-text
+    # index to search.
+    for term in search.split(' ')[:32]:
+        statement = statement.where(Book.authors.any(
+            or_(Person.name.ilike(f"%{term}%"), Book.title.ilike(f"%{term}%"))
+        ))
+    return statement
+
+def filter_books(
+    dialect_name: str,
     author_year_end: Optional[int] = None,
     author_year_start: Optional[int] = None,
     copyright: Optional[str] = None,
@@ -14,32 +115,27 @@ def get_books(
     mime_type: Optional[str] = None,
     search: Optional[str] = None,
     topic: Optional[str] = None,
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-    count_only: bool = False,
-) -> List[Book]:
+) -> Select:
+    """`SELECT` of the books matching a filter set. Statements rather than
+    session queries, so that sync and async sessions can both run them."""
     # Start with base query: exclude books with null download_count or null title
-    query = db.query(Book).filter(Book.download_count != None, Book.title != None)
+    query = select(Book).where(Book.download_count != None, Book.title != None)
 
-    # Sorting
-    if sort == 'ascending':
-        query = query.order_by(Book.id.asc())
-    elif sort == 'descending':
-        query = query.order_by(Book.id.desc())
-    else:
-        query = query.order_by(Book.download_count.desc())
+    # Every filter below is a semi-join (`EXISTS` or `IN`) rather than a join,
+    # so a book matches at most once and the result never needs `DISTINCT`.
+    # That lets Postgres walk `books` in sort order and stop at `LIMIT`.
 
     # Author year end
     if author_year_end is not None:
-        query = query.join(Book.authors).filter(
+        query = query.where(Book.authors.any(
             or_(Person.birth_year <= author_year_end, Person.death_year <= author_year_end)
-        )
+        ))
 
     # Author year start
     if author_year_start is not None:
-        query = query.join(Book.authors).filter(
+        query = query.where(Book.authors.any(
             or_(Person.birth_year >= author_year_start, Person.death_year >= author_year_start)
-        )
+        ))
 
     # Copyright filter (exclude values not in the set)
     if copyright is not None:
@@ -54,47 +150,518 @@ def get_books(
                 copyright_values.add(None)
         for value in [True, False, None]:
             if value not in copyright_values:
-                query = query.filter(Book.copyright != value)
+                query = query.where(Book.copyright != value)
 
     # IDs filter
     if ids is not None:
         try:
             id_list = [int(i) for i in ids.split(',')]
-            query = query.filter(Book.gutenberg_id.in_(id_list))
+            query = query.where(Book.gutenberg_id.in_(id_list))
         except ValueError:
             pass
 
     # Languages filter
     if languages is not None:
         language_codes = [code.lower() for code in languages.split(',')]
-        query = query.join(Book.languages).filter(Language.code.in_(language_codes))
+        query = query.where(Book.languages.any(Language.code.in_(language_codes)))
 
     # Mime type filter
     if mime_type is not None:
-        query = query.join(Book.formats).filter(Format.mime_type.startswith(mime_type))
+        query = query.where(Book.formats.any(Format.mime_type.startswith(mime_type)))
 
     # Search filter (authors' name or title)
     if search is not None:
-        search_terms = search.split(' ')
-        for term in search_terms[:32]:
-            query = query.join(Book.authors).filter(
-                or_(Person.name.ilike(f"%{term}%"), Book.title.ilike(f"%{term}%"))
-            )
+        if dialect_name == 'postgresql':
+            query = filter_search_fulltext(query, search)
+        else:
+            query = filter_search_substring(query, search)
 
-    # Topic filter (bookshelves' name or subjects' name)
+    # Topic filter (bookshelves' name or subjects' name). The few matching
+    # shelves and subjects are found through their trigram indexes first, and
+    # books are then semi-joined to them, so books are never multiplied by
+    # their shelves and subjects.
     if topic is not None:
-        query = query.outerjoin(Book.bookshelves).outerjoin(Book.subjects).filter(
-            or_(Bookshelf.name.ilike(f"%{topic}%"), Subject.name.ilike(f"%{topic}%"))
-        )
+        shelf_ids = select(Bookshelf.id).where(Bookshelf.name.ilike(f"%{topic}%"))
+        subject_ids = select(Subject.id).where(Subject.name.ilike(f"%{topic}%"))
+        query = query.where(or_(
+            Book.id.in_(
+                select(book_bookshelf.c.book_id).where(book_bookshelf.c.bookshelf_id.in_(shelf_ids))
+            ),
+            Book.id.in_(
+                select(book_subject.c.book_id).where(book_subject.c.subject_id.in_(subject_ids))
+            ),
+        ))
+
+    return query
+
+def get_books_statement(
+    dialect_name: str,
+    sort: Optional[str] = None,
+    author_year_end: Optional[int] = None,
+    author_year_start: Optional[int] = None,
+    copyright: Optional[str] = None,
+    ids: Optional[str] = None,
+    languages: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    search: Optional[str] = None,
+    topic: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    count_only: bool = False,
+    with_count: bool = False,
+    keyset: Optional[Sequence[int]] = None,
+    backwards: bool = False,
+    documents: bool = False,
+) -> Select:
+    query = filter_books(
+        dialect_name,
+        author_year_end=author_year_end,
+        author_year_start=author_year_start,
+        copyright=copyright,
+        ids=ids,
+        languages=languages,
+        mime_type=mime_type,
+        search=search,
+        topic=topic,
+    )
 
-    query = query.distinct()
     if count_only:
-        return query.count()
+        return query.with_only_columns(func.count())
+
+    # Sorting. With `backwards` the order is inverted, so that the rows just
+    # before `keyset` come first; callers reverse the page themselves.
+    sort_columns, descending = get_sort_columns(sort)
+    descending = descending != backwards
+    if keyset is not None:
+        sort_key = tuple_(*sort_columns)
+        query = query.where(sort_key < tuple_(*keyset) if descending else sort_key > tuple_(*keyset))
+    ordering = [column.desc() if descending else column.asc() for column in sort_columns]
+    search_query = get_search_query(search) if search is not None else None
+    ranked = (
+        sort == 'relevance'
+        and search_query is not None
+        and dialect_name == 'postgresql'
+    )
+    if ranked:
+        ordering = [
+            func.ts_rank(Book.search_vector, func.to_tsquery(SEARCH_CONFIG, search_query)).desc(),
+            Book.id.asc(),
+        ]
+
+    if documents:
+        # Rows of `(id, download_count, document)` instead of books: the page
+        # is read from the stored documents, and the sort columns come along
+        # for cursors. `document` is `None` for books that have none yet.
+        query = query.with_only_columns(
+            Book.id, Book.download_count, BookDocument.document
+        ).outerjoin(BookDocument, BookDocument.book_id == Book.id)
+    else:
+        query = query.options(*BOOK_RELATIONS)
+    if with_count:
+        # Page and total in one pass: a window count over every matching
+        # book rides along with each page row.
+        query = query.add_columns(func.count().over())
+    query = query.order_by(*ordering)
     if limit is not None:
         query = query.limit(limit)
     if offset is not None:
         query = query.offset(offset)
-    return query.all()
+    return query
+
+def read_books(result: Result, count_only: bool = False, with_count: bool = False, documents: bool = False):
+    if count_only:
+        return result.scalar()
+    if with_count:
+        rows = result.all()
+        # An offset past the end returns no rows to read the total from.
+        total = rows[0][-1] if rows else None
+        return total, [row if documents else row[0] for row in rows]
+    return result.all() if documents else result.scalars().all()
+
+def get_books(
+    db: Session,
+    count_only: bool = False,
+    with_count: bool = False,
+    documents: bool = False,
+    **options,
+) -> List[Book]:
+    """Run `get_books_statement`. Gives books, or `(id, download_count,
+    document)` rows with `documents`, or the total alone with `count_only`;
+    `with_count` gives `(total, rows)`."""
+    statement = get_books_statement(
+        db.bind.dialect.name, count_only=count_only, with_count=with_count, documents=documents, **options
+    )
+    return read_books(db.execute(statement), count_only, with_count, documents)
+
+async def get_books_async(
+    db: AsyncSession,
+    count_only: bool = False,
+    with_count: bool = False,
+    documents: bool = False,
+    **options,
+) -> List[Book]:
+    """`get_books` for an `AsyncSession`."""
+    statement = get_books_statement(
+        db.bind.dialect.name, count_only=count_only, with_count=with_count, documents=documents, **options
+    )
+    return read_books(await db.execute(statement), count_only, with_count, documents)
+
+# The whole catalog's filterable columns fit in a few megabytes, so with
+# `BOOKS_CATALOG_INDEX=1` (and NumPy installed) offset pages whose filters
+# `services.catalog_index` covers are found in memory, and only the page's
+# own books are read from the database.
+CATALOG_INDEX_ENABLED = os.getenv("BOOKS_CATALOG_INDEX", "") == "1"
+
+# Totals for recently seen filter sets. Entries are keyed by the catalog
+# version, so a catalog reload makes every one of them unreachable.
+COUNT_CACHE_SIZE = 1024
+_count_cache: "OrderedDict[tuple, int]" = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+def normalize_filters(
+    author_year_end: Optional[int] = None,
+    author_year_start: Optional[int] = None,
+    copyright: Optional[str] = None,
+    ids: Optional[str] = None,
+    languages: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    search: Optional[str] = None,
+    topic: Optional[str] = None,
+) -> tuple:
+    """Hashable form of a filter set in which spellings that select the same
+    books (reordered or repeated values, letter case) compare equal."""
+    normalized = []
+    if author_year_end is not None:
+        normalized.append(('author_year_end', author_year_end))
+    if author_year_start is not None:
+        normalized.append(('author_year_start', author_year_start))
+    if copyright is not None:
+        values = {value for value in copyright.split(',') if value in ('true', 'false', 'null')}
+        normalized.append(('copyright', tuple(sorted(values))))
+    if ids is not None:
+        try:
+            normalized.append(('ids', tuple(sorted({int(i) for i in ids.split(',')}))))
+        except ValueError:
+            pass
+    if languages is not None:
+        normalized.append(('languages', tuple(sorted({code.lower() for code in languages.split(',')}))))
+    if mime_type is not None:
+        normalized.append(('mime_type', mime_type))
+    if search is not None:
+        normalized.append(('search', tuple(sorted(set(search.split(' ')[:32])))))
+    if topic is not None:
+        normalized.append(('topic', topic))
+    return tuple(normalized)
+
+def _get_cached_count(key: tuple) -> Optional[int]:
+    with _count_cache_lock:
+        total = _count_cache.get(key)
+        if total is not None:
+            _count_cache.move_to_end(key)
+        return total
+
+def _set_cached_count(key: tuple, total: int) -> None:
+    with _count_cache_lock:
+        _count_cache[key] = total
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+
+class Explain(Executable, ClauseElement):
+    """`EXPLAIN (<options>)` of a statement. It's compiled with the statement
+    by the session's dialect, so parameters are bound the way its driver
+    expects: named for psycopg2, positional for asyncpg."""
+
+    inherit_cache = False
+
+    def __init__(self, statement: Select, options: str = 'FORMAT JSON'):
+        self.statement = statement
+        self.options = options
+
+@compiles(Explain)
+def compile_explain(element: Explain, compiler, **kw) -> str:
+    return f'EXPLAIN ({element.options}) ' + compiler.process(element.statement, **kw)
+
+def explain(db: Session, statement: Select, options: str = 'FORMAT JSON') -> list:
+    """The JSON plan of a statement."""
+    plan = db.execute(Explain(statement, options)).scalar()
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+def estimate_book_count(db: Session, **filters) -> Optional[int]:
+    """The planner's row estimate for a filter set, or `None` when the
+    database can't provide one. It costs a plan, not a scan, which makes it
+    the cheap option for very broad filters."""
+    if db.bind.dialect.name != 'postgresql':
+        return None
+    statement = filter_books(db.bind.dialect.name, **filters).with_only_columns(Book.id)
+    return int(explain(db, statement)[0]['Plan']['Plan Rows'])
+
+def get_books_by_ids(db: Session, book_ids: Sequence[int], documents: bool = False) -> List[Book]:
+    """Books, or `(id, download_count, document)` rows with `documents`, in
+    the order of `book_ids`."""
+    if documents:
+        statement = select(Book.id, Book.download_count, BookDocument.document).outerjoin(
+            BookDocument, BookDocument.book_id == Book.id
+        )
+        rows = db.execute(statement.where(Book.id.in_(book_ids))).all()
+    else:
+        rows = db.scalars(select(Book).options(*BOOK_RELATIONS).where(Book.id.in_(book_ids))).all()
+    rows_by_id = {row.id: row for row in rows}
+    return [rows_by_id[book_id] for book_id in book_ids if book_id in rows_by_id]
+
+def get_books_with_count(
+    db: Session,
+    limit: int,
+    offset: int,
+    sort: Optional[str] = None,
+    estimated: bool = False,
+    documents: bool = False,
+    **filters,
+) -> Tuple[int, List[Book]]:
+    """Return `(total, books)` for one offset page.
+
+    A cached total only costs the page query. Otherwise the page and the total
+    come from a single query and the total is cached. With `estimated`, the
+    planner's estimate is used when there is no cached exact total.
+    """
+    if CATALOG_INDEX_ENABLED:
+        from services.catalog_index import CatalogIndex, get_catalog_index
+        if CatalogIndex.supports(**filters):
+            total, book_ids = get_catalog_index(db).page(sort, limit, offset, **filters)
+            return total, get_books_by_ids(db, book_ids, documents=documents)
+    key = (get_catalog_version(), normalize_filters(**filters))
+    total = _get_cached_count(key)
+    if total is None and estimated:
+        total = estimate_book_count(db, **filters)
+    if total is not None:
+        return total, get_books(db, sort=sort, limit=limit, offset=offset, documents=documents, **filters)
+    total, books = get_books(
+        db, sort=sort, limit=limit, offset=offset, with_count=True, documents=documents, **filters
+    )
+    if total is None:
+        total = get_books(db, count_only=True, **filters)
+    _set_cached_count(key, total)
+    return total, books
+
+def get_books_by_cursor(
+    db: Session,
+    cursor: Optional[str],
+    limit: int,
+    sort: Optional[str] = None,
+    documents: bool = False,
+    **filters,
+) -> Tuple[List[Book], Optional[str], Optional[str]]:
+    """Return one keyset page as `(books, next_cursor, previous_cursor)`.
+
+    The page is located by seeking to the cursor's sort key instead of
+    skipping rows, so its cost does not depend on how deep it is. An empty or
+    missing cursor starts at the first page.
+    """
+    if sort == 'relevance':
+        raise ValueError('Cursor pagination is not available for the relevance sort')
+    position, backwards = decode_cursor(cursor, sort) if cursor else (None, False)
+    books = get_books(
+        db,
+        sort=sort,
+        limit=limit + 1,
+        keyset=position,
+        backwards=backwards,
+        documents=documents,
+        **filters,
+    )
+    has_more = len(books) > limit
+    books = books[:limit]
+    if backwards:
+        books.reverse()
+    next_cursor = previous_cursor = None
+    if books:
+        if has_more or backwards:
+            next_cursor = encode_cursor(books[-1], sort)
+        if has_more if backwards else position is not None:
+            previous_cursor = encode_cursor(books[0], sort, backwards=True)
+    return books, next_cursor, previous_cursor
+
+# Facets are counted over the books that pass the filters, bookshelves only
+# for the most common ones.
+FACET_NAMES = ('languages', 'copyright', 'media_type', 'bookshelves')
+TOP_BOOKSHELVES = 20
+
+def get_facet_statement(dialect_name: str, top_bookshelves: Optional[int] = TOP_BOOKSHELVES, **filters) -> Select:
+    """One `UNION ALL` of `(facet, value, count)` rows for every facet, so all
+    of them are counted in a single round trip."""
+    books = filter_books(dialect_name, **filters)
+    book_ids = books.with_only_columns(Book.id)
+
+    def facet(name: str, value):
+        return (literal(name, String).label('facet'), cast(value, String).label('value'), func.count().label('count'))
+
+    languages = (
+        select(*facet('languages', Language.code))
+        .select_from(book_language.join(Language, Language.id == book_language.c.language_id))
+        .where(book_language.c.book_id.in_(book_ids))
+        .group_by(Language.code)
+    )
+    copyright_value = case((Book.copyright == True, 'true'), (Book.copyright == False, 'false'), else_='null')
+    copyright = books.with_only_columns(*facet('copyright', copyright_value)).group_by(copyright_value)
+    media_types = books.with_only_columns(*facet('media_type', Book.media_type)).group_by(Book.media_type)
+    bookshelves = (
+        select(*facet('bookshelves', Bookshelf.name))
+        .select_from(book_bookshelf.join(Bookshelf, Bookshelf.id == book_bookshelf.c.bookshelf_id))
+        .where(book_bookshelf.c.book_id.in_(book_ids))
+        .group_by(Bookshelf.name)
+    )
+    if top_bookshelves is not None:
+        bookshelves = bookshelves.order_by(func.count().desc(), Bookshelf.name).limit(top_bookshelves).subquery()
+        bookshelves = select(bookshelves.c.facet, bookshelves.c.value, bookshelves.c.count)
+    return union_all(languages, copyright, media_types, bookshelves)
+
+def get_facets(db: Session, **filters) -> dict:
+    """Book counts per language, copyright status, media type and top
+    bookshelves, most common first. Without filters they are read from the
+    counts the catalog loader keeps; with filters they are grouped on the
+    spot."""
+    rows = []
+    if not normalize_filters(**filters):
+        rows = db.execute(
+            select(FacetCount.facet, FacetCount.value, FacetCount.count)
+            .order_by(FacetCount.facet, FacetCount.count.desc(), FacetCount.value)
+        ).all()
+    if not rows:
+        statement = get_facet_statement(db.bind.dialect.name, **filters).subquery()
+        rows = db.execute(
+            select(statement).order_by(statement.c.facet, statement.c.count.desc(), statement.c.value)
+        ).all()
+    facets = {name: {} for name in FACET_NAMES}
+    for row in rows:
+        values = facets[row.facet]
+        if row.facet != 'bookshelves' or len(values) < TOP_BOOKSHELVES:
+            values[row.value] = row.count
+    return facets
+
+def refresh_facet_counts(db: Session) -> None:
+    """Recount the unfiltered facets, every bookshelf included."""
+    db.execute(delete(FacetCount))
+    db.execute(insert(FacetCount).from_select(
+        ['facet', 'value', 'count'], get_facet_statement(db.bind.dialect.name, top_bookshelves=None)
+    ))
+    db.commit()
+
+# Rendered list pages, shared between workers when `BOOKS_CACHE_URL` points
+# at a Redis server. Keys carry the catalog version, so a reload orphans the
+# old pages and the TTL clears them out.
+page_cache = ResultCache(make_cache_backend())
+
+def get_page_cache_key(
+    base_url: str,
+    sort: Optional[str],
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+    count: str,
+    **filters,
+) -> str:
+    """Fingerprint of a list request. Requests that differ only in parameter
+    order or in spellings that `normalize_filters` treats as equal share it."""
+    key = repr((
+        get_catalog_version(),
+        base_url,
+        sort,
+        limit,
+        offset if cursor is None else None,
+        cursor,
+        count,
+        normalize_filters(**filters),
+    ))
+    return "books:page:" + hashlib.sha256(key.encode()).hexdigest()
+
+def serialize_book(book: Book) -> dict:
+    return {
+        "id": book.id,
+        "title": book.title,
+        "authors": [{"name": a.name, "birth_year": a.birth_year, "death_year": a.death_year} for a in book.authors],
+        "summaries": [s.text for s in book.summaries],
+        "translators": [{"name": t.name, "birth_year": t.birth_year, "death_year": t.death_year} for t in book.translators],
+        "subjects": [s.name for s in book.subjects],
+        "bookshelves": [b.name for b in book.bookshelves],
+        "languages": [l.code for l in book.languages],
+        "copyright": book.copyright,
+        "media_type": book.media_type,
+        "formats": {f.mime_type: f.url for f in book.formats},
+        "download_count": book.download_count,
+    }
+
+def encode_book(book: Book) -> str:
+    return orjson.dumps(serialize_book(book)).decode()
+
+def fill_documents(db: Session, rows: Sequence) -> List[str]:
+    """The documents of rows from `get_books(documents=True)`, encoding the
+    books that have none stored yet."""
+    missing = [row.id for row in rows if row.document is None]
+    encoded = {}
+    if missing:
+        for book in db.scalars(select(Book).options(*BOOK_RELATIONS).where(Book.id.in_(missing))):
+            encoded[book.id] = encode_book(book)
+    return [row.document if row.document is not None else encoded[row.id] for row in rows]
+
+def iter_book_documents(db: Session, batch_size: int = 1000, **options) -> Iterator[List[str]]:
+    """Every matching book's document, in batches. The rows come through a
+    server-side cursor (`yield_per`), so memory stays flat however many
+    books match."""
+    statement = get_books_statement(db.bind.dialect.name, documents=True, **options)
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        yield fill_documents(db, rows)
+
+def get_book_document(db: Session, gutenberg_id: int) -> Optional[str]:
+    row = (
+        db.query(Book.id, BookDocument.document)
+        .outerjoin(BookDocument, BookDocument.book_id == Book.id)
+        .filter(Book.gutenberg_id == gutenberg_id)
+        .first()
+    )
+    if row is None:
+        return None
+    return fill_documents(db, [row])[0]
+
+def get_book_documents(db: Session, gutenberg_ids: Sequence[int]) -> dict:
+    """Documents of the given books keyed by Gutenberg ID, leaving out IDs
+    with no book. On Postgres the IDs go in as one array parameter, so the
+    statement is the same however many there are."""
+    unique_ids = list(dict.fromkeys(gutenberg_ids))
+    if db.bind.dialect.name == 'postgresql':
+        condition = Book.gutenberg_id == any_(bindparam('gutenberg_ids', unique_ids, type_=ARRAY(Integer)))
+    else:
+        condition = Book.gutenberg_id.in_(unique_ids)
+    rows = db.execute(
+        select(Book.id, Book.gutenberg_id, BookDocument.document)
+        .outerjoin(BookDocument, BookDocument.book_id == Book.id)
+        .where(condition)
+    ).all()
+    return dict(zip((row.gutenberg_id for row in rows), fill_documents(db, rows)))
+
+def refresh_book_documents(
+    db: Session, book_ids: Optional[Iterable[int]] = None, batch_size: int = 1000
+) -> None:
+    """Rewrite the stored documents of the given books, or of every book."""
+    if book_ids is None:
+        book_ids = [book_id for book_id, in db.query(Book.id).order_by(Book.id)]
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), batch_size):
+        batch = book_ids[start:start + batch_size]
+        books = db.query(Book).options(*BOOK_RELATIONS).filter(Book.id.in_(batch)).all()
+        db.query(BookDocument).filter(BookDocument.book_id.in_(batch)).delete(synchronize_session=False)
+        if books:
+            db.execute(insert(BookDocument), [
+                {'book_id': book.id, 'document': encode_book(book)} for book in books
+            ])
+        db.commit()
+        db.expunge_all()
+
+def get_book_statement(gutenberg_id: int) -> Select:
+    return select(Book).options(*BOOK_RELATIONS).where(Book.gutenberg_id == gutenberg_id)
 
 def get_book_by_gutenberg_id(db: Session, gutenberg_id: int) -> Optional[Book]:
-    return db.query(Book).filter(Book.gutenberg_id == gutenberg_id).first() 
\ No newline at end of file
+    return db.scalars(get_book_statement(gutenberg_id)).first()
+
+async def get_book_by_gutenberg_id_async(db: AsyncSession, gutenberg_id: int) -> Optional[Book]:
+    return (await db.scalars(get_book_statement(gutenberg_id))).first() 
\ No newline at end of file
@@ -0,0 +1,289 @@
+import io
+from typing import Iterable, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from services.books import SEARCH_CONFIG
+
+# The other way of putting parsed books in the database, used by
+# `scripts/update_catalog.py --bulk`. Instead of a few queries per book, the
+# books' rows are copied into staging tables and each catalog table is brought
+# in line with them by a handful of set-based statements, all in one
+# transaction. A record the database rejects fails the whole load and leaves
+# the catalog as it was.
+
+# The staging tables and the columns copied into them. They're temporary
+# tables, which Postgres doesn't write to its log any more than unlogged ones,
+# and each session gets its own.
+STAGING_TABLES = {
+    'staged_books': [
+        'gutenberg_id integer', 'title text', 'copyright boolean',
+        'download_count integer', 'media_type text', 'fingerprint text',
+    ],
+    # Authors and translators, in the order the record lists them.
+    'staged_people': [
+        'gutenberg_id integer', 'role text', 'position integer', 'name text',
+        'birth_year integer', 'death_year integer',
+    ],
+    'staged_bookshelves': ['gutenberg_id integer', 'name text'],
+    'staged_languages': ['gutenberg_id integer', 'code text'],
+    'staged_subjects': ['gutenberg_id integer', 'name text'],
+    'staged_formats': ['gutenberg_id integer', 'mime_type text', 'url text'],
+    'staged_summaries': ['gutenberg_id integer', 'text text'],
+}
+
+# Books whose rows are buffered before they're copied.
+BATCH_SIZE = 5000
+
+# The people, bookshelves, languages and subjects that aren't in the database
+# yet. People and subjects have no unique constraint to conflict on, so
+# they're compared with the existing rows instead.
+INSERT_DIMENSIONS_SQL = [
+    '''
+    INSERT INTO persons (name, birth_year, death_year)
+    SELECT DISTINCT name, birth_year, death_year FROM staged_people
+    WHERE NOT EXISTS (
+        SELECT 1 FROM persons
+        WHERE persons.name = staged_people.name
+        AND persons.birth_year IS NOT DISTINCT FROM staged_people.birth_year
+        AND persons.death_year IS NOT DISTINCT FROM staged_people.death_year
+    )
+    ''',
+    '''
+    INSERT INTO bookshelves (name)
+    SELECT DISTINCT name FROM staged_bookshelves
+    ON CONFLICT (name) DO NOTHING
+    ''',
+    '''
+    INSERT INTO languages (code)
+    SELECT DISTINCT code FROM staged_languages
+    ON CONFLICT (code) DO NOTHING
+    ''',
+    '''
+    INSERT INTO subjects (name)
+    SELECT DISTINCT name FROM staged_subjects
+    WHERE NOT EXISTS (SELECT 1 FROM subjects WHERE subjects.name = staged_subjects.name)
+    ''',
+]
+
+# The books, with the search vector `get_search_vector` would give them,
+# returning their database IDs.
+UPSERT_BOOKS_SQL = '''
+    INSERT INTO books (
+        gutenberg_id, title, copyright, download_count, media_type, fingerprint, search_vector
+    )
+    SELECT
+        gutenberg_id, title, copyright, download_count, media_type, fingerprint,
+        to_tsvector(%s, concat_ws(' ', coalesce(title, ''), author_names))
+    FROM staged_books
+    LEFT JOIN (
+        SELECT gutenberg_id, string_agg(name, ' ' ORDER BY position) AS author_names
+        FROM staged_people
+        WHERE role = 'author'
+        GROUP BY gutenberg_id
+    ) AS authors USING (gutenberg_id)
+    ON CONFLICT (gutenberg_id) DO UPDATE SET
+        title = EXCLUDED.title,
+        copyright = EXCLUDED.copyright,
+        download_count = EXCLUDED.download_count,
+        media_type = EXCLUDED.media_type,
+        fingerprint = EXCLUDED.fingerprint,
+        search_vector = EXCLUDED.search_vector
+    RETURNING gutenberg_id, id
+'''
+
+# Each association table, its column for the other side, and the `(book ID,
+# other ID)` pairs the staged books should have in it.
+# Nothing stops a person or subject from being in its table more than
+# once, so each is linked by its lowest ID, as the per-book path does.
+LINKS = [
+    ('book_author', 'person_id', '''
+        SELECT DISTINCT ON (books.id, staged_people.position) books.id, persons.id
+        FROM staged_people
+        JOIN books ON books.gutenberg_id = staged_people.gutenberg_id
+        JOIN persons ON persons.name = staged_people.name
+        AND persons.birth_year IS NOT DISTINCT FROM staged_people.birth_year
+        AND persons.death_year IS NOT DISTINCT FROM staged_people.death_year
+        WHERE staged_people.role = 'author'
+        ORDER BY books.id, staged_people.position, persons.id
+    '''),
+    ('book_translator', 'person_id', '''
+        SELECT DISTINCT ON (books.id, staged_people.position) books.id, persons.id
+        FROM staged_people
+        JOIN books ON books.gutenberg_id = staged_people.gutenberg_id
+        JOIN persons ON persons.name = staged_people.name
+        AND persons.birth_year IS NOT DISTINCT FROM staged_people.birth_year
+        AND persons.death_year IS NOT DISTINCT FROM staged_people.death_year
+        WHERE staged_people.role = 'translator'
+        ORDER BY books.id, staged_people.position, persons.id
+    '''),
+    ('book_bookshelf', 'bookshelf_id', '''
+        SELECT books.id, bookshelves.id
+        FROM staged_bookshelves
+        JOIN books ON books.gutenberg_id = staged_bookshelves.gutenberg_id
+        JOIN bookshelves ON bookshelves.name = staged_bookshelves.name
+    '''),
+    ('book_language', 'language_id', '''
+        SELECT books.id, languages.id
+        FROM staged_languages
+        JOIN books ON books.gutenberg_id = staged_languages.gutenberg_id
+        JOIN languages ON languages.code = staged_languages.code
+    '''),
+    ('book_subject', 'subject_id', '''
+        SELECT DISTINCT ON (books.id, staged_subjects.name) books.id, subjects.id
+        FROM staged_subjects
+        JOIN books ON books.gutenberg_id = staged_subjects.gutenberg_id
+        JOIN subjects ON subjects.name = staged_subjects.name
+        ORDER BY books.id, staged_subjects.name, subjects.id
+    '''),
+]
+
+# The links the staged books no longer have...
+DELETE_LINKS_SQL = '''
+    WITH new_links (book_id, other_id) AS (%(pairs)s)
+    DELETE FROM %(table)s
+    USING staged_books, books
+    WHERE books.gutenberg_id = staged_books.gutenberg_id
+    AND %(table)s.book_id = books.id
+    AND NOT EXISTS (
+        SELECT 1 FROM new_links
+        WHERE new_links.book_id = %(table)s.book_id
+        AND new_links.other_id = %(table)s.%(column)s
+    )
+'''
+# ...and the ones they don't have yet.
+INSERT_LINKS_SQL = '''
+    INSERT INTO %(table)s (book_id, %(column)s)
+    SELECT DISTINCT * FROM (%(pairs)s) AS new_links
+    ON CONFLICT DO NOTHING
+'''
+
+# Formats and summaries belong to one book each, so they're matched on their
+# values: the ones a staged book no longer lists are deleted, and the ones it
+# doesn't have yet are added.
+DETAILS_SQL = [
+    '''
+    DELETE FROM formats
+    USING staged_books, books
+    WHERE books.gutenberg_id = staged_books.gutenberg_id
+    AND formats.book_id = books.id
+    AND NOT EXISTS (
+        SELECT 1 FROM staged_formats
+        WHERE staged_formats.gutenberg_id = staged_books.gutenberg_id
+        AND staged_formats.mime_type = formats.mime_type
+        AND staged_formats.url = formats.url
+    )
+    ''',
+    '''
+    INSERT INTO formats (book_id, mime_type, url)
+    SELECT DISTINCT books.id, staged_formats.mime_type, staged_formats.url
+    FROM staged_formats
+    JOIN books ON books.gutenberg_id = staged_formats.gutenberg_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM formats
+        WHERE formats.book_id = books.id
+        AND formats.mime_type = staged_formats.mime_type
+        AND formats.url = staged_formats.url
+    )
+    ''',
+    '''
+    DELETE FROM summaries
+    USING staged_books, books
+    WHERE books.gutenberg_id = staged_books.gutenberg_id
+    AND summaries.book_id = books.id
+    AND NOT EXISTS (
+        SELECT 1 FROM staged_summaries
+        WHERE staged_summaries.gutenberg_id = staged_books.gutenberg_id
+        AND staged_summaries.text = summaries.text
+    )
+    ''',
+    '''
+    INSERT INTO summaries (book_id, text)
+    SELECT DISTINCT books.id, staged_summaries.text
+    FROM staged_summaries
+    JOIN books ON books.gutenberg_id = staged_summaries.gutenberg_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM summaries
+        WHERE summaries.book_id = books.id
+        AND summaries.text = staged_summaries.text
+    )
+    ''',
+]
+
+def get_copy_value(value) -> str:
+    """A value as `COPY`'s text format reads it."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def get_staged_rows(id: int, book: dict, fingerprint: str) -> dict:
+    """The rows of each staging table for a parsed book."""
+    rows = {
+        'staged_books': [(id, book['title'], book['copyright'], book['downloads'], book['type'], fingerprint)],
+        'staged_people': [],
+        'staged_bookshelves': [(id, name) for name in book['bookshelves']],
+        'staged_languages': [(id, code) for code in book['languages']],
+        'staged_subjects': [(id, name) for name in book['subjects']],
+        'staged_formats': [(id, mime_type, url) for mime_type, url in book['formats'].items()],
+        'staged_summaries': [(id, text) for text in book['summaries']],
+    }
+    for role, people in (('author', book['authors']), ('translator', book['translators'])):
+        for position, person in enumerate(people):
+            rows['staged_people'].append((id, role, position, person['name'], person['birth'], person['death']))
+    return rows
+
+def copy_rows(cursor, buffers: dict) -> None:
+    for table, buffer in buffers.items():
+        buffer.seek(0)
+        columns = ', '.join(column.split()[0] for column in STAGING_TABLES[table])
+        cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+def bulk_load_books(db: Session, books: Iterable[Tuple[int, dict, str]]) -> List[Tuple[int, int]]:
+    """Put `(id, book, fingerprint)` triples, as `get_book` and
+    `get_book_fingerprint` give them, in the database and commit, returning
+    the `(Gutenberg ID, database ID)` of every book written. The books are
+    read as they come, so they can be parsed while earlier ones are copied."""
+    # psycopg2's own cursor, for `copy_expert`, on the session's transaction.
+    cursor = db.connection().connection.cursor()
+    try:
+        for table, columns in STAGING_TABLES.items():
+            cursor.execute(f'CREATE TEMPORARY TABLE {table} ({", ".join(columns)}) ON COMMIT DROP')
+
+        buffers = {table: io.StringIO() for table in STAGING_TABLES}
+        buffered = 0
+        for id, book, fingerprint in books:
+            for table, rows in get_staged_rows(id, book, fingerprint).items():
+                for row in rows:
+                    buffers[table].write('\t'.join(get_copy_value(value) for value in row) + '\n')
+            buffered += 1
+            if buffered == BATCH_SIZE:
+                copy_rows(cursor, buffers)
+                buffered = 0
+        copy_rows(cursor, buffers)
+
+        # Temporary tables are never analyzed on their own, and the planner
+        # needs their sizes to pick hash joins over nested loops.
+        for table in STAGING_TABLES:
+            cursor.execute(f'ANALYZE {table}')
+
+        for sql in INSERT_DIMENSIONS_SQL:
+            cursor.execute(sql)
+        cursor.execute(UPSERT_BOOKS_SQL, [SEARCH_CONFIG])
+        written = cursor.fetchall()
+        for table, column, pairs in LINKS:
+            parameters = {'table': table, 'column': column, 'pairs': pairs}
+            cursor.execute(DELETE_LINKS_SQL % parameters)
+            cursor.execute(INSERT_LINKS_SQL % parameters)
+        for sql in DETAILS_SQL:
+            cursor.execute(sql)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    db.commit()
+    return written
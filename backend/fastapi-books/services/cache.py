@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+# Page payloads are shared between workers through a Redis-protocol server
+# named by `BOOKS_CACHE_URL` (e.g. `redis://localhost:6379/0`). Without one,
+# each worker keeps its own in-memory cache, which is also what tests use.
+BOOKS_CACHE_URL = os.getenv("BOOKS_CACHE_URL", "")
+BOOKS_CACHE_TTL = int(os.getenv("BOOKS_CACHE_TTL", "300"))
+# `GET /books/cache/stats` exposes the counters below, so it's only served
+# with `BOOKS_CACHE_STATS=1`, such as on an internal deployment.
+CACHE_STATS_ENABLED = os.getenv("BOOKS_CACHE_STATS", "") == "1"
+MEMORY_CACHE_SIZE = 4096
+
+class MemoryCache:
+    """LRU cache with per-entry expiry, local to the process."""
+
+    # Lookups never wait on I/O, so coroutines can make them directly.
+    blocking = False
+
+    def __init__(self, max_size: int = MEMORY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+class RedisCache:
+    """Cache on a Redis-protocol server, shared by every worker. Any client
+    with the `redis` package's `get`/`set` API can be passed in, such as a
+    `fakeredis.FakeRedis` in tests."""
+
+    # Every call is a network round trip on a sync client.
+    blocking = True
+
+    def __init__(self, url: Optional[str] = None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.client.set(key, value, ex=ttl)
+
+    def clear(self) -> None:
+        self.client.flushdb()
+
+class ResultCache:
+    """Wraps a backend with hit, miss and latency counters. Backend errors
+    count as misses, so an unreachable cache server slows requests down
+    rather than failing them."""
+
+    def __init__(self, backend, ttl: int = BOOKS_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.errors = 0
+            self.get_seconds = 0.0
+            self.set_seconds = 0.0
+
+    def get(self, key: str) -> Optional[bytes]:
+        start = time.perf_counter()
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            value = None
+            with self._lock:
+                self.errors += 1
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.get_seconds += elapsed
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        start = time.perf_counter()
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            self.set_seconds += time.perf_counter() - start
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        """`get` for coroutines. A blocking backend is called from the
+        threadpool, so that waiting on it doesn't stall the event loop."""
+        if getattr(self.backend, "blocking", True):
+            return await run_in_threadpool(self.get, key)
+        return self.get(key)
+
+    async def set_async(self, key: str, value: bytes) -> None:
+        if getattr(self.backend, "blocking", True):
+            await run_in_threadpool(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "mean_get_ms": 1000 * self.get_seconds / lookups if lookups else None,
+                "total_set_ms": 1000 * self.set_seconds,
+            }
+
+def make_cache_backend(url: str = BOOKS_CACHE_URL):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url)
+    return MemoryCache()
@@ -0,0 +1,50 @@
+import hashlib
+import os
+import threading
+import uuid
+from urllib.parse import parse_qsl
+
+# The catalog only changes when `scripts/update_catalog.py` runs. The loader
+# stamps every run here, and anything derived from the catalog (cached counts,
+# response caches, ETags) is keyed by the stamp, so a reload invalidates it
+# in every worker without any coordination beyond a `stat()` call. The
+# default is anchored to the service directory rather than the working
+# directory, so the API and the loader agree wherever they're started from.
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATALOG_VERSION_PATH = os.getenv(
+    "CATALOG_VERSION_PATH", os.path.join(SERVICE_DIR, "catalog_files", "version")
+)
+
+_lock = threading.Lock()
+_cached_mtime = None
+_cached_version = "0"
+
+def get_catalog_version() -> str:
+    global _cached_mtime, _cached_version
+    try:
+        mtime = os.stat(CATALOG_VERSION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return "0"
+    if mtime != _cached_mtime:
+        with _lock:
+            with open(CATALOG_VERSION_PATH) as version_file:
+                _cached_version = version_file.read().strip() or "0"
+            _cached_mtime = mtime
+    return _cached_version
+
+def bump_catalog_version() -> str:
+    version = uuid.uuid4().hex
+    directory = os.path.dirname(CATALOG_VERSION_PATH)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    temporary_path = CATALOG_VERSION_PATH + ".tmp"
+    with open(temporary_path, "w") as version_file:
+        version_file.write(version)
+    os.replace(temporary_path, CATALOG_VERSION_PATH)
+    return version
+
+def get_etag(path: str, query_string: str) -> str:
+    # Parameter order doesn't change the tag.
+    parameters = sorted(parse_qsl(query_string, keep_blank_values=True))
+    key = repr((get_catalog_version(), path, parameters))
+    return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
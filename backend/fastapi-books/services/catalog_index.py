@@ -0,0 +1,150 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Book, Format, Language, Person, book_author, book_language
+from services.catalog import get_catalog_version
+
+# Filters the index can evaluate. `search` and `topic` need the database.
+INDEXED_FILTERS = ('author_year_end', 'author_year_start', 'copyright', 'ids', 'languages', 'mime_type')
+
+# Copyright is stored as 1, 0, or -1 for unknown.
+COPYRIGHT_UNKNOWN = -1
+
+NO_YEAR_LOW = np.iinfo(np.int32).max
+NO_YEAR_HIGH = np.iinfo(np.int32).min
+
+class CatalogIndex:
+    """Column arrays for every listable book, one row per book in `id`
+    order, plus a boolean mask per language and per MIME type."""
+
+    def __init__(self, db: Session):
+        self.version = get_catalog_version()
+        rows = db.execute(
+            select(Book.id, Book.gutenberg_id, Book.download_count, Book.copyright)
+            .where(Book.download_count != None, Book.title != None)
+            .order_by(Book.id)
+        ).all()
+        self.ids = np.array([row.id for row in rows], dtype=np.int64)
+        self.gutenberg_ids = np.array([row.gutenberg_id for row in rows], dtype=np.int64)
+        download_counts = np.array([row.download_count for row in rows], dtype=np.int64)
+        self.copyright = np.array(
+            [COPYRIGHT_UNKNOWN if row.copyright is None else int(row.copyright) for row in rows], dtype=np.int8
+        )
+
+        self.languages = self._load_masks(db, select(book_language.c.book_id, Language.code).join(
+            Language, Language.id == book_language.c.language_id
+        ))
+        self.mime_types = self._load_masks(db, select(Format.book_id, Format.mime_type).distinct())
+
+        # An author matches `author_year_end` if either of their years is at
+        # most it, so a book matches if its lowest author year is; and the
+        # other way round for `author_year_start`.
+        self.lowest_author_year = np.full(len(self.ids), NO_YEAR_LOW, dtype=np.int32)
+        self.highest_author_year = np.full(len(self.ids), NO_YEAR_HIGH, dtype=np.int32)
+        authors = db.execute(
+            select(book_author.c.book_id, Person.birth_year, Person.death_year)
+            .join(Person, Person.id == book_author.c.person_id)
+        ).all()
+        for year_column in (1, 2):
+            known = [(row[0], row[year_column]) for row in authors if row[year_column] is not None]
+            positions, found = self._positions([book_id for book_id, _ in known])
+            years = np.array([year for _, year in known], dtype=np.int32)[found]
+            np.minimum.at(self.lowest_author_year, positions, years)
+            np.maximum.at(self.highest_author_year, positions, years)
+
+        # Row positions in each sort's order, so that a filter mask taken in
+        # that order gives the page directly.
+        self.orders = {
+            'ascending': np.arange(len(self.ids)),
+            'descending': np.arange(len(self.ids))[::-1],
+            'popular': np.lexsort((self.ids, download_counts))[::-1],
+        }
+
+    def _positions(self, book_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Row positions of the given book IDs, and which of them are listable."""
+        book_ids = np.array(book_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, book_ids).clip(max=max(len(self.ids) - 1, 0))
+        found = self.ids[positions] == book_ids if len(self.ids) else np.zeros(len(book_ids), dtype=bool)
+        return positions[found], found
+
+    def _load_masks(self, db: Session, statement) -> Dict[str, np.ndarray]:
+        book_ids_by_value: Dict[str, List[int]] = {}
+        for book_id, value in db.execute(statement):
+            book_ids_by_value.setdefault(value, []).append(book_id)
+        masks = {}
+        for value, book_ids in book_ids_by_value.items():
+            masks[value] = np.zeros(len(self.ids), dtype=bool)
+            masks[value][self._positions(book_ids)[0]] = True
+        return masks
+
+    @staticmethod
+    def supports(**filters) -> bool:
+        return all(value is None or name in INDEXED_FILTERS for name, value in filters.items())
+
+    def filter(
+        self,
+        author_year_end: Optional[int] = None,
+        author_year_start: Optional[int] = None,
+        copyright: Optional[str] = None,
+        ids: Optional[str] = None,
+        languages: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        **unsupported,
+    ) -> np.ndarray:
+        """Mask of the books passing the filters, with the same results as
+        `filter_books`."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if author_year_end is not None:
+            mask &= self.lowest_author_year <= author_year_end
+        if author_year_start is not None:
+            mask &= self.highest_author_year >= author_year_start
+        if copyright is not None:
+            # As in SQL, each value left out excludes it, and `!= true` or
+            # `!= false` also excludes unknown copyright.
+            values = set(copyright.split(','))
+            if 'true' not in values:
+                mask &= self.copyright == 0
+            if 'false' not in values:
+                mask &= self.copyright == 1
+            if 'null' not in values:
+                mask &= self.copyright != COPYRIGHT_UNKNOWN
+        if ids is not None:
+            try:
+                mask &= np.isin(self.gutenberg_ids, [int(i) for i in ids.split(',')])
+            except ValueError:
+                pass
+        if languages is not None:
+            language_mask = np.zeros(len(self.ids), dtype=bool)
+            for code in {code.lower() for code in languages.split(',')}:
+                if code in self.languages:
+                    language_mask |= self.languages[code]
+            mask &= language_mask
+        if mime_type is not None:
+            mime_mask = np.zeros(len(self.ids), dtype=bool)
+            for value, value_mask in self.mime_types.items():
+                if value.startswith(mime_type):
+                    mime_mask |= value_mask
+            mask &= mime_mask
+        return mask
+
+    def page(self, sort: Optional[str], limit: int, offset: int, **filters) -> Tuple[int, List[int]]:
+        """`(total, book_ids)` for one offset page, in the sort's order."""
+        order = self.orders.get(sort, self.orders['popular'])
+        positions = order[self.filter(**filters)[order]]
+        return len(positions), self.ids[positions[offset:offset + limit]].tolist()
+
+_index: Optional[CatalogIndex] = None
+_index_lock = threading.Lock()
+
+def get_catalog_index(db: Session) -> CatalogIndex:
+    """The index for the current catalog version, rebuilt after a reload."""
+    global _index
+    if _index is None or _index.version != get_catalog_version():
+        with _index_lock:
+            if _index is None or _index.version != get_catalog_version():
+                _index = CatalogIndex(db)
+    return _index
@@ -0,0 +1,108 @@
+"""
+Fixtures for the service's tests. Install the test requirements and run them
+from the service directory:
+
+    pip install -r requirements-test.txt
+    TEST_DATABASE_URL=postgresql://localhost/gutendex_test python -m pytest tests
+
+Tests that need the database run against `TEST_DATABASE_URL`, a disposable
+Postgres database whose tables are dropped and created again for the run.
+Without it, or on a server without the pg_trgm extension the schema needs,
+they're skipped, and only the tests that need no database run.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+# The tests bump a catalog version of their own.
+os.environ["CATALOG_VERSION_PATH"] = os.path.join(tempfile.mkdtemp(), "version")
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from sqlalchemy import select, text
+from sqlalchemy.exc import NotSupportedError
+
+import models
+from db import SessionLocal, async_engine, engine
+from services.books import get_search_vector
+from services.catalog import bump_catalog_version
+
+
+@pytest.fixture(scope="session")
+def database():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set.")
+    models.Base.metadata.drop_all(engine)
+    try:
+        models.Base.metadata.create_all(engine)
+    except NotSupportedError as error:
+        pytest.skip(f"The test database can't hold the schema: {str(error.orig).splitlines()[0]}")
+    yield engine
+    models.Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def db(database):
+    session = SessionLocal()
+    yield session
+    session.close()
+    tables = ", ".join(table.name for table in models.Base.metadata.sorted_tables)
+    with database.begin() as connection:
+        connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+    # Counts and pages cached by one test mustn't be served to the next.
+    bump_catalog_version()
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as client:
+        yield client
+        # Pooled asyncpg connections belong to this client's event loop.
+        client.portal.call(async_engine.dispose)
+
+
+def get_or_create(db, model, **values):
+    instance = db.scalars(select(model).filter_by(**values)).first()
+    if instance is None:
+        instance = model(**values)
+        db.add(instance)
+    return instance
+
+
+@pytest.fixture
+def make_book(db):
+    def make_book(gutenberg_id, **kwargs):
+        author = get_or_create(
+            db, models.Person,
+            name=kwargs.get("author", f"Author {gutenberg_id % 5}"), birth_year=1800, death_year=1870,
+        )
+        book = models.Book(
+            gutenberg_id=gutenberg_id,
+            title=kwargs.get("title", f"Book {gutenberg_id}"),
+            copyright=kwargs.get("copyright", False),
+            download_count=kwargs.get("download_count", gutenberg_id),
+            media_type=kwargs.get("media_type", "Text"),
+            search_vector=get_search_vector(kwargs.get("title", f"Book {gutenberg_id}"), [author.name]),
+            authors=[author],
+            translators=[get_or_create(db, models.Person, name="Translator", birth_year=None, death_year=None)],
+            bookshelves=[get_or_create(db, models.Bookshelf, name=kwargs.get("bookshelf", "Shelf"))],
+            languages=[get_or_create(db, models.Language, code=kwargs.get("language", "en"))],
+            subjects=[get_or_create(db, models.Subject, name=kwargs.get("subject", "Fiction"))],
+            formats=[
+                models.Format(mime_type="text/html", url=f"https://example.org/{gutenberg_id}.html"),
+                models.Format(mime_type="text/plain", url=f"https://example.org/{gutenberg_id}.txt"),
+            ],
+            summaries=[models.Summary(text=f"Summary of book {gutenberg_id}.")],
+        )
+        db.add(book)
+        db.commit()
+        return book
+
+    return make_book
@@ -0,0 +1,201 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, func, select, text
+from sqlalchemy.dialects import postgresql
+
+import db as db_module
+from db import AsyncSessionLocal, async_engine, engine
+from models import FacetCount
+from scripts.check_query_plans import get_fan_out
+from services.books import (
+    BOOK_RELATIONS,
+    estimate_book_count,
+    explain,
+    get_books,
+    get_books_statement,
+    get_facet_statement,
+    get_facets,
+    refresh_facet_counts,
+    serialize_book,
+)
+from services.catalog import bump_catalog_version
+
+
+class QueryCounter:
+    """Counts the statements run on the sync engine while it's active."""
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self.record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+# The page itself, then one `SELECT ... IN` per loaded relationship.
+PAGE_QUERY_COUNT = 1 + len(BOOK_RELATIONS)
+
+
+def test_query_count_does_not_grow_with_page_size(db, make_book):
+    make_book(1)
+    with QueryCounter() as counter:
+        books = [serialize_book(book) for book in get_books(db, limit=32)]
+    assert len(books) == 1
+    assert len(counter.statements) == PAGE_QUERY_COUNT
+
+    db.expunge_all()
+    for gutenberg_id in range(2, 41):
+        make_book(gutenberg_id)
+    db.expunge_all()
+    with QueryCounter() as counter:
+        books = [serialize_book(book) for book in get_books(db, limit=32)]
+    assert len(books) == 32
+    assert len(counter.statements) == PAGE_QUERY_COUNT
+
+
+def test_loaded_relations_are_serialized(db, make_book):
+    make_book(7)
+    db.expunge_all()
+    book = serialize_book(get_books(db, ids="7")[0])
+    assert book["authors"] == [{"name": "Author 2", "birth_year": 1800, "death_year": 1870}]
+    assert book["formats"] == {
+        "text/html": "https://example.org/7.html",
+        "text/plain": "https://example.org/7.txt",
+    }
+    assert book["summaries"] == ["Summary of book 7."]
+
+
+# One of each filter, with values that several of a book's related rows match.
+FILTERS = {
+    "author years": {"author_year_start": 1750, "author_year_end": 1900},
+    "copyright": {"copyright": "false,null"},
+    "ids": {"ids": "1,2,3"},
+    "languages": {"languages": "en,fr"},
+    "mime type": {"mime_type": "text/"},
+    "search": {"search": "book"},
+    "topic": {"topic": "fiction"},
+    "combined": {"languages": "en", "mime_type": "text/", "topic": "fiction"},
+}
+
+
+@pytest.mark.parametrize("name", FILTERS)
+def test_filters_compile_to_semi_joins(name):
+    statement = get_books_statement("postgresql", limit=10, **FILTERS[name])
+    assert [from_.name for from_ in statement.get_final_froms()] == ["books"]
+    assert "DISTINCT" not in str(statement.compile(dialect=postgresql.dialect()))
+
+
+@pytest.mark.parametrize("name", FILTERS)
+def test_filter_plans_do_not_fan_out(db, make_book, name):
+    for gutenberg_id in range(1, 31):
+        make_book(
+            gutenberg_id,
+            copyright=[True, False, None][gutenberg_id % 3],
+            language="en" if gutenberg_id % 2 else "fr",
+            bookshelf="Fiction Shelf" if gutenberg_id % 3 else "Poetry",
+            subject="Fiction",
+        )
+    db.execute(text("ANALYZE"))
+    statement = get_books_statement(db.bind.dialect.name, limit=10, **FILTERS[name])
+    assert get_fan_out(explain(db, statement)[0]["Plan"]) == []
+
+    ids = [book.id for book in db.scalars(statement)]
+    assert ids and len(ids) == len(set(ids))
+
+
+@pytest.mark.parametrize("filters", [
+    {"languages": "en,fr", "topic": "fiction"},
+    {"ids": "1,2,3", "search": "book"},
+    {"author_year_start": 1750, "copyright": "false"},
+])
+def test_filtered_estimates_run_on_both_sessions(db, make_book, filters):
+    for gutenberg_id in range(1, 11):
+        make_book(gutenberg_id, subject="Fiction")
+
+    async def estimate():
+        try:
+            async with AsyncSessionLocal() as session:
+                return await session.run_sync(estimate_book_count, **filters)
+        finally:
+            # Pooled asyncpg connections belong to this event loop.
+            await async_engine.dispose()
+
+    estimated = asyncio.run(estimate())
+    assert isinstance(estimated, int)
+    assert estimated == estimate_book_count(db, **filters)
+
+
+def test_estimated_count_on_a_filtered_list(client, make_book):
+    for gutenberg_id in range(1, 11):
+        make_book(gutenberg_id, subject="Fiction")
+    response = client.get("/books/?count=estimated&languages=en&topic=fiction&search=book")
+    assert response.status_code == 200
+    assert isinstance(response.json()["count"], int)
+
+
+@pytest.mark.parametrize("sync", [False, True])
+def test_endpoints_on_either_session(client, make_book, monkeypatch, sync):
+    monkeypatch.setattr(db_module, "SYNC_DB_ENABLED", sync)
+    for gutenberg_id in range(1, 4):
+        make_book(gutenberg_id)
+    assert client.get("/books/?languages=en").json()["count"] == 3
+    assert client.get("/books/?cursor=").json()["results"][0]["id"] == 3
+    assert client.get("/books/2").json()["title"] == "Book 2"
+    assert client.post("/books/batch", json={"ids": [1, 9]}).json()["not_found"] == [9]
+    assert client.get("/books/facets?languages=en").json()["languages"] == {"en": 3}
+
+
+def make_facet_books(make_book):
+    for gutenberg_id in range(1, 13):
+        make_book(
+            gutenberg_id,
+            copyright=[True, False, None][gutenberg_id % 3],
+            language="en" if gutenberg_id % 4 else "fr",
+            bookshelf=f"Shelf {gutenberg_id % 2}",
+            media_type="Sound" if gutenberg_id == 12 else "Text",
+        )
+
+
+def test_filtered_facets_match_counts(db, make_book):
+    make_facet_books(make_book)
+    filters = {"mime_type": "text/", "author_year_start": 1800}
+    facets = get_facets(db, **filters)
+    assert facets == {
+        "languages": {"en": 9, "fr": 3},
+        "copyright": {"false": 4, "null": 4, "true": 4},
+        "media_type": {"Text": 11, "Sound": 1},
+        "bookshelves": {"Shelf 0": 6, "Shelf 1": 6},
+    }
+    # The same counts as asking for each value on its own.
+    for code, count in facets["languages"].items():
+        assert get_books(db, count_only=True, languages=code, **filters) == count
+    # The copyright filter excludes values with `!=`, which never matches
+    # NULL, so `copyright=null` can't be compared this way.
+    for value in ("true", "false"):
+        assert get_books(db, count_only=True, copyright=value, **filters) == facets["copyright"][value]
+
+    assert get_facets(db, languages="fr")["copyright"] == {"false": 1, "null": 1, "true": 1}
+    assert [row.facet for row in db.execute(get_facet_statement("postgresql", top_bookshelves=1))].count("bookshelves") == 1
+
+
+def test_unfiltered_facets_come_from_stored_counts(db, client, make_book):
+    make_facet_books(make_book)
+    # Before the loader has stored any counts, they're grouped on the spot.
+    assert client.get("/books/facets").json()["languages"] == {"en": 9, "fr": 3}
+
+    refresh_facet_counts(db)
+    assert db.scalar(select(func.count()).select_from(FacetCount)) == 2 + 3 + 2 + 2
+    make_book(13, language="de")
+    bump_catalog_version()
+    # Unfiltered counts are the stored ones until the loader refreshes them...
+    assert client.get("/books/facets").json()["languages"] == {"en": 9, "fr": 3}
+    # ...while filtered ones are always live.
+    assert client.get("/books/facets?languages=de,en").json()["languages"] == {"en": 9, "de": 1}
+
+    refresh_facet_counts(db)
+    assert client.get("/books/facets").json()["languages"] == {"en": 9, "fr": 3, "de": 1}
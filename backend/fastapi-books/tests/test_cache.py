@@ -0,0 +1,161 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import routers.books
+from services.books import get_page_cache_key, page_cache
+from services.cache import MemoryCache, ResultCache
+from services.catalog import bump_catalog_version
+
+
+class BrokenCache:
+    def get(self, key):
+        raise ConnectionError("cache server is down")
+
+    def set(self, key, value, ttl):
+        raise ConnectionError("cache server is down")
+
+
+class RemoteCache(MemoryCache):
+    """Stands in for a network backend, noting the threads it's called on."""
+
+    blocking = True
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, value, ttl):
+        self.threads.add(threading.get_ident())
+        super().set(key, value, ttl)
+
+
+def get_key(**options):
+    parameters = dict(sort=None, limit=10, offset=0, cursor=None, count="exact")
+    parameters.update(options)
+    return get_page_cache_key("http://testserver/", **parameters)
+
+
+def test_equivalent_requests_share_a_key():
+    assert get_key(languages="en,fr") == get_key(languages="FR,en,fr")
+    assert get_key(search="secret garden") == get_key(search="garden secret")
+    assert get_key(copyright="true,false") == get_key(copyright="false,true,maybe")
+    assert get_key(ids="3,1,2") == get_key(ids="1,2,3,3")
+
+
+def test_different_requests_get_different_keys():
+    keys = {
+        get_key(),
+        get_key(languages="en"),
+        get_key(languages="fr"),
+        get_key(offset=10),
+        get_key(limit=20),
+        get_key(sort="ascending"),
+        get_key(count="estimated"),
+        get_key(cursor=""),
+    }
+    assert len(keys) == 8
+    # A cursor locates the page, so the offset doesn't matter with one.
+    assert get_key(cursor="abc", offset=10) == get_key(cursor="abc", offset=0)
+
+
+def test_catalog_version_bump_changes_keys():
+    key = get_key(languages="en")
+    bump_catalog_version()
+    assert get_key(languages="en") != key
+
+
+def test_default_version_path_is_the_same_from_any_directory(tmp_path):
+    service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = {key: value for key, value in os.environ.items() if key != "CATALOG_VERSION_PATH"}
+    environment["PYTHONPATH"] = service_dir
+    paths = {
+        subprocess.run(
+            [sys.executable, "-c", "from services.catalog import CATALOG_VERSION_PATH; print(CATALOG_VERSION_PATH)"],
+            cwd=cwd, env=environment, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        for cwd in (service_dir, tmp_path)
+    }
+    assert paths == {os.path.join(service_dir, "catalog_files", "version")}
+
+
+def test_memory_cache_expires_and_evicts():
+    cache = MemoryCache(max_size=2)
+    cache.set("expired", b"1", ttl=0)
+    assert cache.get("expired") is None
+
+    cache.set("a", b"a", ttl=60)
+    cache.set("b", b"b", ttl=60)
+    cache.get("a")
+    cache.set("c", b"c", ttl=60)
+    # "b" was the least recently used.
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (b"a", None, b"c")
+
+
+def test_stats_count_hits_and_misses():
+    cache = ResultCache(MemoryCache())
+    assert cache.get("page") is None
+    cache.set("page", b"body")
+    assert cache.get("page") == b"body"
+    assert cache.get("page") == b"body"
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["errors"]) == (2, 1, 0)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["backend"] == "MemoryCache"
+
+    cache.reset_stats()
+    assert cache.stats()["hits"] == 0
+
+
+def test_backend_errors_count_as_misses():
+    cache = ResultCache(BrokenCache())
+    cache.set("page", b"body")
+    assert cache.get("page") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["errors"]) == (0, 1, 2)
+
+
+def test_blocking_backends_are_called_off_the_event_loop():
+    async def use(cache):
+        await cache.set_async("page", b"body")
+        return threading.get_ident(), await cache.get_async("page")
+
+    remote = RemoteCache()
+    loop_thread, body = asyncio.run(use(ResultCache(remote)))
+    assert body == b"body"
+    assert remote.threads and loop_thread not in remote.threads
+
+    local = MemoryCache()
+    assert asyncio.run(use(ResultCache(local)))[1] == b"body"
+
+
+def test_pages_are_cached_until_the_catalog_changes(client, make_book):
+    make_book(1)
+    page_cache.reset_stats()
+    first = client.get("/books/?languages=en")
+    assert first.json()["count"] == 1
+    assert client.get("/books/?languages=EN").content == first.content
+    assert (page_cache.hits, page_cache.misses) == (1, 1)
+
+    make_book(2)
+    assert client.get("/books/?languages=en").content == first.content
+    bump_catalog_version()
+    assert client.get("/books/?languages=en").json()["count"] == 2
+    assert (page_cache.hits, page_cache.misses) == (2, 2)
+
+
+def test_stats_endpoint_is_off_by_default(client, monkeypatch):
+    assert client.get("/books/cache/stats").status_code == 404
+    monkeypatch.setattr(routers.books, "CACHE_STATS_ENABLED", True)
+    response = client.get("/books/cache/stats")
+    assert response.status_code == 200
+    assert response.json()["backend"] == "MemoryCache"
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import services.books
+from scripts.synthetic_catalog import generate_catalog, load_catalog
+from services.books import get_books_with_count
+from services.catalog_index import CatalogIndex
+
+# Each filter the index evaluates, on its own and combined, with values that
+# match many books, a few, or none.
+FILTER_SETS = {
+    "none": {},
+    "copyright true": {"copyright": "true"},
+    "copyright false": {"copyright": "false"},
+    "copyright null": {"copyright": "null"},
+    "copyright false,null": {"copyright": "false,null"},
+    "copyright all": {"copyright": "true,false,null"},
+    "copyright unknown value": {"copyright": "maybe"},
+    "author year end": {"author_year_end": 1600},
+    "author year start": {"author_year_start": 1900},
+    "author years": {"author_year_start": 1700, "author_year_end": 1800},
+    "mime prefix": {"mime_type": "text/"},
+    "mime type": {"mime_type": "application/epub+zip"},
+    "mime prefix with no books": {"mime_type": "video/"},
+    "languages": {"languages": "fr,DE"},
+    "rare language": {"languages": "eo"},
+    "unknown language": {"languages": "xx"},
+    "ids": {"ids": "1,5,17,250,9999"},
+    "invalid ids": {"ids": "1,x"},
+    "combined": {"languages": "en", "copyright": "false", "mime_type": "text/html", "author_year_start": 1800},
+}
+SORTS = [None, "popular", "ascending", "descending"]
+
+
+@pytest.fixture
+def catalog(db):
+    load_catalog(db, generate_catalog(600, seed=3))
+    return db
+
+
+def test_index_pages_match_the_database(catalog):
+    index = CatalogIndex(catalog)
+    for name, filters in FILTER_SETS.items():
+        assert CatalogIndex.supports(**filters)
+        for sort in SORTS:
+            for limit, offset in ((1000, 0), (10, 20)):
+                total, books = get_books_with_count(
+                    catalog, limit=limit, offset=offset, sort=sort, documents=True, **filters
+                )
+                assert index.page(sort, limit, offset, **filters) == (total, [book.id for book in books]), (
+                    name, sort, offset,
+                )
+
+
+def test_unsupported_filters_fall_back_to_the_database(catalog, monkeypatch):
+    filters = {"topic": "garden", "languages": "en", "copyright": "false"}
+    assert not CatalogIndex.supports(**filters)
+    for sort in SORTS:
+        total, books = get_books_with_count(catalog, limit=1000, offset=0, sort=sort, documents=True, **filters)
+        monkeypatch.setattr(services.books, "CATALOG_INDEX_ENABLED", True)
+        indexed_total, indexed_books = get_books_with_count(catalog, limit=1000, offset=0, sort=sort, documents=True, **filters)
+        monkeypatch.setattr(services.books, "CATALOG_INDEX_ENABLED", False)
+        assert total > 0
+        assert (indexed_total, [book.id for book in indexed_books]) == (total, [book.id for book in books])
+
+
+def test_enabled_index_serves_the_same_pages(catalog, monkeypatch):
+    filters = {"languages": "en,fr", "mime_type": "text/"}
+    expected = get_books_with_count(catalog, limit=32, offset=64, **filters)
+    monkeypatch.setattr(services.books, "CATALOG_INDEX_ENABLED", True)
+    total, books = get_books_with_count(catalog, limit=32, offset=64, **filters)
+    assert (total, [book.id for book in books]) == (expected[0], [book.id for book in expected[1]])
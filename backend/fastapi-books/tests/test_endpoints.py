@@ -0,0 +1,109 @@
+import json
+from urllib.parse import parse_qs, urlsplit
+
+from schemas import MAX_BATCH_IDS
+from services.books import iter_book_documents
+from services.catalog import bump_catalog_version
+
+
+def test_matching_etag_gets_not_modified(client, make_book):
+    make_book(1)
+    response = client.get("/books/1")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+
+    not_modified = client.get("/books/1", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.content == b""
+    assert client.get("/books/1", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get("/books/1", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_catalog_change_makes_etags_stale(client, make_book):
+    make_book(1)
+    etag = client.get("/books/?languages=en").headers["ETag"]
+    bump_catalog_version()
+    response = client.get("/books/?languages=en", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["count"] == 1
+
+
+def test_etags_depend_on_the_query(client, make_book):
+    make_book(1)
+    etag = client.get("/books/?languages=en&sort=ascending").headers["ETag"]
+    assert client.get("/books/?sort=ascending&languages=en", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/books/?languages=fr", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_any_etag_does_not_hide_missing_books(client, make_book):
+    make_book(1)
+    assert client.get("/books/2", headers={"If-None-Match": "*"}).status_code == 404
+
+
+def get_all_pages(client, query):
+    """Every book `/books/` returns for the query, page by page."""
+    books = []
+    while True:
+        page = client.get(f"/books/?limit=4&offset={len(books)}&{query}").json()
+        books += page["results"]
+        if len(books) >= page["count"]:
+            return books
+
+
+def test_export_streams_the_listed_books(client, make_book):
+    for gutenberg_id in range(1, 12):
+        make_book(gutenberg_id, language="en" if gutenberg_id % 3 else "fr", download_count=gutenberg_id % 4)
+    for query in ("", "languages=en", "languages=fr&sort=ascending", "sort=descending"):
+        response = client.get(f"/books/export?{query}")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.text.endswith("\n")
+        lines = response.text.splitlines()
+        assert [json.loads(line) for line in lines] == get_all_pages(client, query), query
+    assert len(client.get("/books/export?languages=fr").text.splitlines()) == 3
+
+
+def test_export_batches_join_up(db, make_book):
+    for gutenberg_id in range(1, 12):
+        make_book(gutenberg_id)
+    batches = list(iter_book_documents(db, batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 4, 3]
+    assert sum(batches, []) == next(iter_book_documents(db))
+
+
+def test_batch_keeps_request_order(client, make_book):
+    for gutenberg_id in (3, 1, 2):
+        make_book(gutenberg_id)
+    response = client.post("/books/batch", json={"ids": [2, 3, 1]})
+    assert response.status_code == 200
+    assert [book["title"] for book in response.json()["results"]] == ["Book 2", "Book 3", "Book 1"]
+    assert response.json()["not_found"] == []
+    assert response.json()["results"][0] == client.get("/books/2").json()
+
+
+def test_batch_repeats_duplicates_and_marks_missing_ids(client, make_book):
+    make_book(1)
+    make_book(2)
+    body = client.post("/books/batch", json={"ids": [9, 1, 9, 2, 1, 8, 9]}).json()
+    assert [book and book["title"] for book in body["results"]] == [None, "Book 1", None, "Book 2", "Book 1", None, None]
+    assert body["not_found"] == [9, 8]
+
+
+def test_batch_size_is_limited(client):
+    assert client.post("/books/batch", json={"ids": list(range(1, MAX_BATCH_IDS + 1))}).status_code == 200
+    assert client.post("/books/batch", json={"ids": list(range(1, MAX_BATCH_IDS + 2))}).status_code == 422
+    assert client.post("/books/batch", json={"ids": []}).status_code == 422
+
+
+def test_invalid_cursor_is_a_bad_request(client, make_book):
+    make_book(1)
+    make_book(2)
+    next_url = client.get("/books/?sort=ascending&cursor=&limit=1").json()["next"]
+    # Another sort's cursor has the wrong number of keys.
+    ascending_cursor = parse_qs(urlsplit(next_url).query)["cursor"][0]
+    for cursor in ("not-a-cursor", ascending_cursor):
+        response = client.get("/books/", params={"cursor": cursor, "sort": "popular"})
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor"}
@@ -0,0 +1,28 @@
+import random
+import urllib.parse
+
+import pytest
+
+from scripts.load_test import DETAIL_PATHS, make_request_picker
+
+
+def get_deep_pages(api):
+    pick = make_request_picker(random.Random(0), api, max_id=100)
+    paths = (path for name, path in iter(pick, None) if name == "deep page")
+    return [urllib.parse.parse_qs(urllib.parse.urlsplit(next(paths)).query) for _ in range(20)]
+
+
+def test_deep_pages_use_each_apis_paging():
+    for query in get_deep_pages("fastapi"):
+        assert set(query) == {"limit", "offset"}
+        assert query["limit"] == ["32"]
+        assert query["offset"] in (["128"], ["608"], ["3168"])
+    for query in get_deep_pages("django"):
+        assert query in ({"page": ["5"]}, {"page": ["20"]}, {"page": ["100"]})
+
+
+@pytest.mark.parametrize("api", sorted(DETAIL_PATHS))
+def test_every_kind_is_requested(api):
+    pick = make_request_picker(random.Random(0), api, max_id=100)
+    names = {pick()[0] for _ in range(2000)}
+    assert "detail" in names and "deep page" in names and len(names) == 10
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import text
+
+import models
+from db import SessionLocal
+from services.books import get_books
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_config():
+    config = Config(os.path.join(SERVICE_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(SERVICE_DIR, "alembic"))
+    return config
+
+
+def get_schema_drift(engine):
+    with engine.connect() as connection:
+        return compare_metadata(MigrationContext.configure(connection), models.Base.metadata)
+
+
+@pytest.fixture
+def migrated_database(database):
+    """The test database with its tables left to the migrations."""
+    models.Base.metadata.drop_all(database)
+    yield database
+    with database.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    models.Base.metadata.drop_all(database)
+    models.Base.metadata.create_all(database)
+
+
+def test_migrations_build_the_models_schema(migrated_database):
+    config = get_config()
+    command.upgrade(config, "head")
+    assert get_schema_drift(migrated_database) == []
+
+    command.downgrade(config, "base")
+    with migrated_database.connect() as connection:
+        tables = connection.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = current_schema()"
+        )).scalars().all()
+    assert tables == ["alembic_version"]
+
+
+def test_existing_books_become_searchable(migrated_database):
+    config = get_config()
+    command.upgrade(config, "6341e7bd03e7")
+    with migrated_database.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO books (id, gutenberg_id, title, download_count, media_type) VALUES"
+            " (1, 1, 'The Secret Garden', 10, 'Text'), (2, 2, 'Poems', 20, 'Text'), (3, 3, 'Untitled', 30, 'Text')"
+        ))
+        connection.execute(text(
+            "INSERT INTO persons (id, name) VALUES (1, 'Burnett, Frances Hodgson'), (2, 'Anonymous')"
+        ))
+        connection.execute(text("INSERT INTO book_author (book_id, person_id) VALUES (1, 1), (2, 1), (2, 2)"))
+
+    command.upgrade(config, "head")
+    with SessionLocal() as db:
+        assert [book.gutenberg_id for book in get_books(db, search="secret garden")] == [1]
+        assert [book.gutenberg_id for book in get_books(db, search="burnett poems")] == [2]
+        assert [book.gutenberg_id for book in get_books(db, search="burnett", sort="ascending")] == [1, 2]
+        assert [book.gutenberg_id for book in get_books(db, search="anonymous")] == [2]
+        assert [book.gutenberg_id for book in get_books(db, search="untitled")] == [3]
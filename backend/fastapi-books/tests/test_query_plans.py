@@ -0,0 +1,71 @@
+import json
+import sys
+
+import pytest
+
+from scripts import check_query_plans
+from scripts.check_query_plans import PLAN_MATRIX, SORTS, compare, measure_plans
+from scripts.synthetic_catalog import generate_catalog, load_catalog
+
+BASELINE = {
+    "shape": ["Limit", "  Index Scan relation=books index=ix_books_download_count_id"],
+    "fan_out": [],
+    "cost": 100.0,
+    "buffers": 40,
+}
+
+
+def test_compare_allows_small_changes():
+    assert compare(BASELINE, BASELINE, 1.5) == []
+    assert compare(BASELINE, dict(BASELINE, cost=140.0, buffers=100), 1.5) == []
+
+
+def test_compare_reports_regressions():
+    current = {
+        "shape": ["Limit", "  Sort", "    Seq Scan relation=books"],
+        "fan_out": ["Inner Hash Join"],
+        "cost": 200.0,
+        "buffers": 400,
+    }
+    assert compare(BASELINE, current, 1.5) == [
+        "cost 100 -> 200",
+        "buffers 40 -> 400",
+        "new Seq Scan relation=books",
+        "fan-out at Inner Hash Join",
+    ]
+
+
+@pytest.fixture
+def catalog(db):
+    load_catalog(db, generate_catalog(2000, seed=0))
+    return db
+
+
+def test_first_pages_do_not_fan_out(catalog):
+    plans = measure_plans(catalog, limit=32)
+    assert len(plans) == len(PLAN_MATRIX) * len(SORTS)
+    for key, plan in plans.items():
+        assert plan["fan_out"] == [], (key, plan["shape"])
+        # Books itself is read by a single scan, whatever the filters.
+        assert sum("relation=books" in line.split() for line in plan["shape"]) == 1, (key, plan["shape"])
+
+
+def run_script(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["check_query_plans", *args])
+    check_query_plans.main()
+
+
+def test_script_records_and_checks_baselines(catalog, monkeypatch, tmp_path):
+    path = str(tmp_path / "baselines.json")
+    run_script(monkeypatch, "--baselines", path, "--update")
+    with open(path) as baseline_file:
+        baselines = json.load(baseline_file)
+    assert set(baselines) == {f"{name} / {sort}" for name in PLAN_MATRIX for sort in SORTS}
+    run_script(monkeypatch, "--baselines", path)
+
+    baselines["languages / popular"]["cost"] /= 10
+    with open(path, "w") as baseline_file:
+        json.dump(baselines, baseline_file)
+    with pytest.raises(SystemExit) as exit_info:
+        run_script(monkeypatch, "--baselines", path)
+    assert exit_info.value.code == 1
@@ -0,0 +1,51 @@
+import json
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from responses import BookJSONResponse, encode_book_list
+from services.books import encode_book, get_book_by_gutenberg_id, serialize_book
+
+BOOK = {
+    "id": 7,
+    "title": "Les Misérables — “Fantine” \\ 1/5\n",
+    "authors": [{"name": "Hugo, Victor", "birth_year": 1802, "death_year": 1885}],
+    "summaries": [],
+    "translators": [{"name": "Anonymous", "birth_year": None, "death_year": None}],
+    "subjects": ["France -- History -- 19th century -- Fiction"],
+    "bookshelves": ["Best Books Ever Listings"],
+    "languages": ["en"],
+    "copyright": False,
+    "media_type": "Text",
+    "formats": {"text/html": "https://www.gutenberg.org/ebooks/135.html.images"},
+    "download_count": 12345,
+}
+
+
+def get_default_body(content):
+    """What FastAPI would send for the content with its own encoder."""
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def test_book_response_decodes_like_the_default_encoder():
+    body = BookJSONResponse(BOOK).body
+    assert json.loads(body) == json.loads(get_default_body(BOOK))
+    # Stored documents are sent as they are.
+    assert BookJSONResponse(body.decode()).body == BookJSONResponse(body).body == body
+
+
+def test_book_lists_decode_like_the_default_encoder():
+    envelope = {"count": 3, "next": "/books/?limit=2&offset=2", "previous": None}
+    books = [BOOK, dict(BOOK, id=8, copyright=None), dict(BOOK, id=9, title=None, formats={})]
+    body = encode_book_list(envelope, [BookJSONResponse(book).body.decode() for book in books])
+    assert json.loads(body) == json.loads(get_default_body({**envelope, "results": books}))
+    assert json.loads(encode_book_list(envelope, [])) == {**envelope, "results": []}
+
+
+def test_endpoints_send_what_the_default_encoder_would(db, client, make_book):
+    make_book(1, title="Café “Noir” \\ 1/2")
+    expected = json.loads(get_default_body(serialize_book(get_book_by_gutenberg_id(db, 1))))
+    assert json.loads(encode_book(get_book_by_gutenberg_id(db, 1))) == expected
+    assert client.get("/books/1").json() == expected
+    page = client.get("/books/?ids=1").json()
+    assert page == {"count": 1, "next": None, "previous": None, "results": [expected]}
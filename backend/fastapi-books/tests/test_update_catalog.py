@@ -0,0 +1,92 @@
+import json
+import os
+
+import pytest
+from sqlalchemy import select, update
+
+import models
+from scripts.synthetic_catalog import generate_catalog, write_rdf_files
+from scripts.update_catalog import put_catalog_in_db
+from services.books import BOOK_RELATIONS, serialize_book
+
+
+@pytest.fixture
+def book_files(tmp_path):
+    write_rdf_files(generate_catalog(40, seed=2), str(tmp_path))
+    return [(id, os.path.join(tmp_path, str(id), f"pg{id}.rdf")) for id in range(1, 41)]
+
+
+def normalize(document):
+    # The relationships have no order, so a book's subjects, say, can come
+    # back in a different order from one query to the next.
+    return {
+        key: sorted(value, key=json.dumps) if isinstance(value, list) else value
+        for key, value in document.items()
+    }
+
+
+def get_stored_and_live_documents(db):
+    db.expire_all()
+    stored = {
+        book_id: normalize(json.loads(document))
+        for book_id, document in db.execute(select(models.BookDocument.book_id, models.BookDocument.document))
+    }
+    live = {
+        book.id: normalize(serialize_book(book))
+        for book in db.scalars(select(models.Book).options(*BOOK_RELATIONS))
+    }
+    return stored, live
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_stored_documents_match_live_books(db, book_files, bulk):
+    put_catalog_in_db(workers=1, book_files=book_files, bulk=bulk)
+    stored, live = get_stored_and_live_documents(db)
+    assert len(live) == 40
+    assert stored == live
+    # The catalog has every part of a document somewhere in it.
+    for key in ("authors", "translators", "formats", "summaries", "subjects", "bookshelves"):
+        assert any(document[key] for document in live.values()), key
+
+    # A re-ingest of a changed book rewrites its document.
+    gutenberg_id, path = book_files[6]
+    with open(path) as rdf_file:
+        rdf = rdf_file.read()
+    title = live[db.scalar(select(models.Book.id).filter_by(gutenberg_id=gutenberg_id))]["title"]
+    with open(path, "w") as rdf_file:
+        rdf_file.write(rdf.replace(title, "A Retitled Book"))
+    changes = put_catalog_in_db(workers=1, book_files=book_files, bulk=bulk)
+    assert (changes.changed, changes.unchanged) == (1, 39)
+
+    stored, live = get_stored_and_live_documents(db)
+    assert stored == live
+    assert [document["title"] for document in stored.values()].count("A Retitled Book") == 1
+
+
+def test_bulk_load_links_the_first_of_duplicate_rows(db, book_files):
+    put_catalog_in_db(workers=1, book_files=book_files, bulk=False)
+
+    def get_links():
+        db.expire_all()
+        return {
+            book.gutenberg_id: (
+                sorted(person.id for person in book.authors),
+                sorted(person.id for person in book.translators),
+                sorted(subject.id for subject in book.subjects),
+            )
+            for book in db.scalars(select(models.Book).options(*BOOK_RELATIONS))
+        }
+
+    expected = get_links()
+    # Copies of every person and subject, with higher IDs.
+    db.add_all([
+        models.Person(name=person.name, birth_year=person.birth_year, death_year=person.death_year)
+        for person in db.scalars(select(models.Person)).all()
+    ])
+    db.add_all([models.Subject(name=subject.name) for subject in db.scalars(select(models.Subject)).all()])
+    db.execute(update(models.Book).values(fingerprint=None))
+    db.commit()
+
+    changes = put_catalog_in_db(workers=1, book_files=book_files, bulk=True)
+    assert (changes.changed, changes.unchanged) == (40, 0)
+    assert get_links() == expected